@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Runner overhead benchmarks.
+Runs synthetic pipelines (see synthetic.py) through
+PipelineRunner.execute_pipeline and records what the engine costs on top of
+the commands it runs: per-step scheduling latency and bookkeeping, spawn
+latency of no-op commands, progress events per second and the peak RSS of
+the runner process. Each scenario runs in a fresh interpreter so peak RSS
+is its own. Results are written as JSON to compare them over time:
+
+    python -m benchmarks.run_benchmarks                      # full suite, both engines
+    python -m benchmarks.run_benchmarks --quick --engine threads
+    python -m benchmarks.run_benchmarks --compare benchmarks/results/runner_<ts>.json
+"""
+import os
+import sys
+import json
+import time
+import glob
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import datetime
+import statistics
+import subprocess
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if not __package__:
+    # Run as a script: make `core` and `benchmarks` importable
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.synthetic import artifact_fanout, large_output, trivial_steps, wide_parallel, write_pipeline
+
+# Results of full runs, relative to the repository root
+RESULTS_DIR = os.path.join("benchmarks", "results")
+# Scale of --quick runs: 100 trivial steps, blocks of 10, 10 MB of output, 100 artifact files
+QUICK_SCALE = 0.1
+ENGINES = ("threads", "asyncio")
+
+# name -> (pipeline builder taking the scale, run with parallel=True)
+SCENARIOS = {
+    "trivial_steps": (lambda scale: trivial_steps(max(1, int(1000 * scale))), False),
+    "wide_parallel": (lambda scale: wide_parallel(width=max(1, int(100 * scale)), blocks=5), True),
+    "large_output": (lambda scale: large_output(megabytes=max(1, int(100 * scale))), True),
+    "artifact_fanout": (lambda scale: artifact_fanout(files=max(1, int(1000 * scale)),
+                                                      consumers=max(2, int(20 * scale))), True),
+}
+# Metrics shown by --compare: (path in a result, higher is better)
+COMPARED_METRICS = (
+    (("wall_seconds",), False),
+    (("step_overhead_ms", "p50"), False),
+    (("schedule_latency_ms", "p50"), False),
+    (("command_latency_ms", "p50"), False),
+    (("events_per_second",), True),
+    (("peak_rss_bytes",), False),
+)
+
+
+def _summary(values: List[float]) -> Optional[Dict[str, float]]:
+    """count, mean, p50, p95 and max of durations in seconds, as milliseconds."""
+    if not values:
+        return None
+    ordered = sorted(value * 1000 for value in values)
+    return {
+        "count": len(ordered),
+        "mean": round(statistics.fmean(ordered), 3),
+        "p50": round(ordered[len(ordered) // 2], 3),
+        "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+        "max": round(ordered[-1], 3)
+    }
+
+
+def _peak_rss() -> int:
+    """Peak RSS of this process in bytes."""
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_scenario(name: str, engine: str, scale: float, workdir: str,
+                 max_workers: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Runs one scenario in this process and measures it.
+
+    Returns:
+        dict: Measurements of the run
+    """
+    from core.src.main import create_runner
+
+    build, parallel = SCENARIOS[name]
+    pipeline_file = write_pipeline(build(scale), workdir)
+    events = Counter()
+
+    def count_event(event_data):
+        events[event_data.get("event")] += 1
+
+    runner = create_runner(engine, progress_callback=count_event, use_cache=False)
+    started = time.perf_counter()
+    success = runner.execute_pipeline(pipeline_file, parallel=parallel, max_workers=max_workers)
+    wall = time.perf_counter() - started
+
+    reports = sorted(glob.glob(os.path.join(workdir, "reports", "pipeline_report_*.json")), key=os.path.getmtime)
+    with open(reports[-1], 'r') as f:
+        steps = json.load(f)["steps"]
+
+    schedule_latency, step_overhead, command_latency = [], [], []
+    for step in steps:
+        timing = step.get("timing") or {}
+        if "end_monotonic" not in timing:
+            continue
+        commands = timing.get("commands") or []
+        command_time = sum(command["end_monotonic"] - command["start_monotonic"] for command in commands)
+        command_latency.extend(command["end_monotonic"] - command["start_monotonic"] for command in commands)
+        # Time in the runner around the commands: setup, logs, events, result
+        step_overhead.append(timing["end_monotonic"] - timing["start_monotonic"] - command_time)
+        if "ready_monotonic" in timing:
+            # From ready to running, minus the time spent waiting for a free worker
+            schedule_latency.append(timing["start_monotonic"] - timing["ready_monotonic"] - timing.get("queue_wait", 0))
+
+    output_bytes = sum(os.path.getsize(path) for path in glob.glob(os.path.join(runner.log_dir or "", "*.log")))
+    total_events = sum(events.values())
+    return {
+        "scenario": name,
+        "engine": engine,
+        "scale": scale,
+        "success": success,
+        "steps": len(steps),
+        "max_workers": max_workers,
+        "wall_seconds": round(wall, 3),
+        "steps_per_second": round(len(steps) / wall, 1),
+        # Summed over steps: compare with wall_seconds for the sequential scenario
+        "command_seconds": round(sum(command_latency), 3),
+        "schedule_latency_ms": _summary(schedule_latency),
+        "step_overhead_ms": _summary(step_overhead),
+        "command_latency_ms": _summary(command_latency),
+        "events": total_events,
+        "events_per_second": round(total_events / wall, 1),
+        "event_counts": dict(events),
+        "output_bytes": output_bytes,
+        "output_mb_per_second": round(output_bytes / 1e6 / wall, 1),
+        "peak_rss_bytes": _peak_rss()
+    }
+
+
+def _run_isolated(name: str, engine: str, scale: float, max_workers: Optional[int], keep: bool) -> Dict[str, Any]:
+    """Runs a scenario in a child interpreter, so its peak RSS isn't inflated by earlier ones."""
+    workdir = tempfile.mkdtemp(prefix=f"localforge-bench-{name}-")
+    result_file = os.path.join(workdir, "result.json")
+    command = [sys.executable, "-m", "benchmarks.run_benchmarks", "--run-scenario", name,
+               "--engine", engine, "--scale", str(scale), "--workdir", workdir, "--result-file", result_file]
+    if max_workers:
+        command += ["--max-workers", str(max_workers)]
+    try:
+        # The runner prints a line per step: keep it out of the way. Its runs go to a
+        # throwaway store instead of the user's history
+        env = dict(os.environ, LOCALFORGE_RUN_STORE=os.path.join(workdir, "runs.db"))
+        completed = subprocess.run(command, cwd=REPO_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                   text=True, env=env)
+        if completed.returncode != 0 or not os.path.exists(result_file):
+            raise RuntimeError(f"scenario {name} ({engine}) failed: {completed.stderr.strip()[-2000:]}")
+        with open(result_file, 'r') as f:
+            return json.load(f)
+    finally:
+        if keep:
+            print(f"Kept {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _metric(result: Dict[str, Any], path: tuple) -> Optional[float]:
+    value = result
+    for key in path:
+        value = value.get(key) if isinstance(value, dict) else None
+    return value
+
+
+def compare(previous: Dict[str, Any], current: Dict[str, Any]) -> List[str]:
+    """
+    Compares two result files.
+
+    Returns:
+        list: One line per scenario, engine and metric, with the change in percent
+    """
+    before = {(result["scenario"], result["engine"]): result for result in previous.get("results", [])}
+    lines = []
+    for result in current["results"]:
+        old = before.get((result["scenario"], result["engine"]))
+        if not old:
+            continue
+        if old.get("scale") != result.get("scale"):
+            lines.append(f"{result['scenario']} [{result['engine']}]: scale {old.get('scale')} vs "
+                         f"{result.get('scale')}, not comparable")
+            continue
+        for path, higher_is_better in COMPARED_METRICS:
+            old_value, new_value = _metric(old, path), _metric(result, path)
+            if not old_value or new_value is None:
+                continue
+            change = (new_value - old_value) / old_value * 100
+            better = change > 0 if higher_is_better else change < 0
+            lines.append(f"{result['scenario']} [{result['engine']}] {'.'.join(path)}: "
+                         f"{old_value:g} -> {new_value:g} ({change:+.1f}%{', better' if better and abs(change) >= 5 else ''})")
+    return lines
+
+
+def _print_result(result: Dict[str, Any]) -> None:
+    def p50(key):
+        summary = result.get(key)
+        return f"{summary['p50']:.2f}ms" if summary else "-"
+
+    print(f"{result['scenario']:<14} {result['engine']:<8} {result['steps']:>5} steps  "
+          f"{result['wall_seconds']:>8.2f}s  schedule {p50('schedule_latency_ms'):>9}  "
+          f"overhead {p50('step_overhead_ms'):>9}  command {p50('command_latency_ms'):>9}  "
+          f"{result['events_per_second']:>9.0f} events/s  "
+          f"RSS {result['peak_rss_bytes'] / 2**20:.0f} MiB"
+          + ("" if result["success"] else "  FAILED"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the overhead of the pipeline runner on synthetic pipelines")
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='Scenario to run (repeatable; default: all)')
+    parser.add_argument('--engine', choices=ENGINES + ('both',), default='both',
+                        help='Execution engine to measure')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='Size of the synthetic pipelines (1.0: 1000 steps, blocks of 100, 100 MB of output, 1000 artifact files)')
+    parser.add_argument('--quick', action='store_true',
+                        help=f'Shortcut for --scale {QUICK_SCALE}')
+    parser.add_argument('--max-workers', type=int, default=None,
+                        help='Worker limit of the parallel scenarios (default: the engine default)')
+    parser.add_argument('--output', '-o',
+                        help='Result file (default: benchmarks/results/runner_<timestamp>.json)')
+    parser.add_argument('--compare', metavar='RESULT_FILE',
+                        help='Earlier result file to compare with')
+    parser.add_argument('--keep', action='store_true',
+                        help='Keep the generated pipelines, reports and logs')
+    # Internal: run one scenario in this process
+    parser.add_argument('--run-scenario', help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scenario:
+        logging.basicConfig(level=logging.WARNING)
+        result = run_scenario(args.run_scenario, args.engine, args.scale, args.workdir, args.max_workers)
+        with open(args.result_file, 'w') as f:
+            json.dump(result, f)
+        return
+
+    scale = QUICK_SCALE if args.quick else args.scale
+    engines = ENGINES if args.engine == 'both' else (args.engine,)
+    results = []
+    for name in args.scenario or list(SCENARIOS):
+        for engine in engines:
+            result = _run_isolated(name, engine, scale, args.max_workers, args.keep)
+            _print_result(result)
+            results.append(result)
+
+    report = {
+        "suite": "runner_overhead",
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "scale": scale,
+        "results": results
+    }
+    output = args.output or os.path.join(REPO_ROOT, RESULTS_DIR,
+                                         f"runner_{datetime.datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {output}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            previous = json.load(f)
+        print(f"Compared with {args.compare} ({previous.get('commit') or 'unknown commit'}):")
+        for line in compare(previous, report):
+            print(f"  {line}")
+
+    sys.exit(0 if all(result["success"] for result in results) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Synthetic pipelines for the runner benchmarks.
+Each generator writes a pipeline file whose commands cost next to nothing
+(or only produce output), so what a run measures is the engine itself:
+scheduling, process spawning, output handling and progress events.
+"""
+import os
+import sys
+import shlex
+from typing import Any, Dict, List
+
+import yaml
+
+# Command doing nothing; exec'd directly, without a shell
+NOOP_COMMAND = "true"
+# Lines of 100 bytes, in blocks of 1 MB
+_OUTPUT_SCRIPT = ("import sys; out = sys.stdout.buffer; block = (b'x' * 99 + b'\\n') * 10000; "
+                  "[out.write(block) for _ in range({megabytes})]")
+
+
+def trivial_steps(count: int = 1000) -> Dict[str, Any]:
+    """A chain of `count` no-op steps: per-step overhead of the sequential path."""
+    return {"pipeline": [{"step": f"noop_{index:04d}", "command": NOOP_COMMAND} for index in range(count)]}
+
+
+def wide_parallel(width: int = 100, blocks: int = 5) -> Dict[str, Any]:
+    """
+    `blocks` fan-out/fan-in blocks of `width` no-op steps.
+
+    Every block starts from a gate step and the next gate needs the whole
+    block, so each block releases `width` ready steps at once.
+    """
+    steps: List[Dict[str, Any]] = []
+    previous: List[str] = []
+    for block in range(blocks):
+        gate = f"gate_{block}"
+        steps.append({"step": gate, "needs": previous, "command": NOOP_COMMAND})
+        previous = [f"block_{block}_{index:03d}" for index in range(width)]
+        steps.extend({"step": name, "needs": [gate], "command": NOOP_COMMAND} for name in previous)
+    steps.append({"step": "gate_end", "needs": previous, "command": NOOP_COMMAND})
+    return {"pipeline": steps}
+
+
+def large_output(megabytes: int = 100, steps: int = 1) -> Dict[str, Any]:
+    """Steps printing `megabytes` MB of 100-byte lines each: output streaming, logs and events."""
+    command = f"{shlex.quote(sys.executable)} -c {shlex.quote(_OUTPUT_SCRIPT.format(megabytes=megabytes))}"
+    return {"pipeline": [{"step": f"print_{index}", "needs": [], "command": command} for index in range(steps)]}
+
+
+def artifact_fanout(files: int = 1000, consumers: int = 20) -> Dict[str, Any]:
+    """
+    A step producing a `files`-file artifact and `consumers` parallel steps using it at
+    its original path: artifact copies, and consumers placing one destination at once.
+    """
+    script = (f"import os; os.makedirs('dist/files', exist_ok=True); "
+              f"[open(f'dist/files/{{i}}.txt', 'w').write(str(i)) for i in range({files})]")
+    check = f"import os; assert len(os.listdir('dist/files')) == {files}"
+    steps: List[Dict[str, Any]] = [{"step": "produce", "artifacts": {"dist": "dist"},
+                                    "command": f"{shlex.quote(sys.executable)} -c {shlex.quote(script)}"}]
+    steps.extend({"step": f"consume_{index:03d}", "needs": ["produce"], "uses_artifacts": ["dist"],
+                  "command": f"{shlex.quote(sys.executable)} -c {shlex.quote(check)}"}
+                 for index in range(consumers))
+    return {"pipeline": steps}
+
+
+def write_pipeline(config: Dict[str, Any], directory: str, name: str = "pipeline.yml") -> str:
+    """Writes a pipeline configuration and returns its path."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name)
+    with open(path, 'w') as f:
+        yaml.safe_dump(config, f, sort_keys=False)
+    return path
@@ -0,0 +1,173 @@
+"""
+Pipeline agent for distributed execution.
+Connects to a coordinator started with `localforge-pipeline --agents ADDRESS`,
+runs the steps it receives with a local PipelineRunner and streams their
+progress events and results back. Several agents can run on one machine.
+"""
+import os
+import time
+import socket
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+from core.src.main import PipelineRunner
+from core.src.cli.cli_manager import CLIManager
+from core.src.utils.log_manager import setup_logging
+from core.src.engine.cache import StepCache, CACHE_DIR
+from core.src.engine.distributed import MessageChannel, PROTOCOL_VERSION, parse_address
+
+# Seconds between connection attempts while the coordinator is unreachable
+RECONNECT_DELAY = 2.0
+
+
+class PipelineAgent:
+    """Worker process that runs steps for a coordinator."""
+
+    def __init__(self, address: str, name: Optional[str] = None, labels: Optional[List[str]] = None,
+                 slots: int = 1, token: Optional[str] = None, workdir: Optional[str] = None,
+                 use_cache: bool = True):
+        """
+        Initializes the agent.
+
+        Args:
+            address: Coordinator address (see parse_address)
+            name: Agent name reported to the coordinator
+            labels: Labels matched against the `runs_on:` of steps
+            slots: Number of steps run at the same time
+            token: Shared secret expected by the coordinator
+            workdir: Directory used when the coordinator's directory doesn't exist here
+            use_cache: Replay results of steps whose declared `inputs:` are unchanged
+        """
+        self.address = address
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.labels = labels or []
+        self.slots = max(1, slots)
+        self.token = token
+        self.workdir = os.path.abspath(workdir or os.getcwd())
+        self.use_cache = use_cache
+        self._runners: Dict[str, PipelineRunner] = {}
+        self._lock = threading.Lock()
+
+    def serve_forever(self, once: bool = False) -> None:
+        """
+        Connects to the coordinator and runs steps until stopped.
+
+        Args:
+            once: Return when the coordinator disconnects instead of reconnecting
+        """
+        while True:
+            channel = self._connect()
+            if channel is not None:
+                try:
+                    self._serve(channel)
+                finally:
+                    self._stop_runners()
+                    channel.close()
+                logging.info("Disconnected from coordinator")
+                if once:
+                    return
+            time.sleep(RECONNECT_DELAY)
+
+    def _connect(self) -> Optional[MessageChannel]:
+        """Opens a connection and performs the handshake, or returns None."""
+        family, address = parse_address(self.address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            sock.connect(address)
+        except OSError as e:
+            logging.debug(f"Coordinator {self.address} not reachable: {e}")
+            sock.close()
+            return None
+
+        channel = MessageChannel(sock)
+        channel.send({"type": "hello", "version": PROTOCOL_VERSION, "name": self.name,
+                      "labels": self.labels, "slots": self.slots, "token": self.token})
+        reply = channel.receive()
+        if not reply or reply.get("type") != "welcome":
+            reason = (reply or {}).get("reason", "connection closed")
+            logging.error(f"Coordinator {self.address} rejected agent {self.name}: {reason}")
+            channel.close()
+            return None
+        logging.info(f"Agent {self.name} connected to {self.address} (labels: {self.labels}, slots: {self.slots})")
+        return channel
+
+    def _serve(self, channel: MessageChannel) -> None:
+        """Handles coordinator messages until the connection closes."""
+        while True:
+            try:
+                message = channel.receive()
+            except ValueError as e:
+                logging.error(f"Invalid message from coordinator: {e}")
+                return
+            if message is None:
+                return
+            if message.get("type") == "run":
+                threading.Thread(target=self._run_job, args=(channel, message), daemon=True).start()
+            elif message.get("type") == "stop":
+                logging.info("Stop requested by coordinator")
+                self._stop_runners()
+
+    def _run_job(self, channel: MessageChannel, message: Dict[str, Any]) -> None:
+        """Runs one step and sends its events and result to the coordinator."""
+        job_id = message["job_id"]
+        step = message["step"]
+
+        def forward(event):
+            if event.get("event") == "pipeline_stopped":
+                # The coordinator reports its own stop
+                return
+            try:
+                channel.send({"type": "event", "job_id": job_id, "event": event})
+            except OSError:
+                pass
+
+        cwd = message.get("cwd")
+        if not cwd or not os.path.isdir(cwd):
+            cwd = self.workdir
+        runner = PipelineRunner(progress_callback=forward, use_cache=self.use_cache)
+        runner.pipeline_dir = cwd
+        runner.step_cache = StepCache(os.path.join(cwd, CACHE_DIR)) if self.use_cache else None
+        with self._lock:
+            self._runners[job_id] = runner
+
+        try:
+            result = runner.execute_step(step, message.get("env_vars"), is_cleanup=message.get("is_cleanup", False))
+        except Exception as e:
+            logging.error(f"Unexpected error running step {step.get('step')}: {e}")
+            result = {"step": step.get("step"), "status": "error", "duration": "0.00s", "output": None, "error": str(e)}
+        finally:
+            with self._lock:
+                self._runners.pop(job_id, None)
+
+        try:
+            channel.send({"type": "result", "job_id": job_id, "result": result})
+        except OSError as e:
+            logging.error(f"Could not report result of step {step.get('step')}: {e}")
+
+    def _stop_runners(self) -> None:
+        with self._lock:
+            runners = list(self._runners.values())
+        for runner in runners:
+            runner.stop()
+
+
+def main():
+    """Main function for the localforge-agent entry point."""
+    parser = CLIManager.create_agent_parser()
+    args = parser.parse_args()
+
+    log_level = CLIManager.get_log_level(args.log_level)
+    setup_logging(log_file="localforge_agent.log", level=log_level)
+
+    labels = [label.strip() for label in args.labels.split(',') if label.strip()]
+    agent = PipelineAgent(args.connect, name=args.name, labels=labels, slots=args.slots,
+                          token=args.token, workdir=args.workdir, use_cache=not args.no_cache)
+    try:
+        agent.serve_forever(once=args.once)
+    except KeyboardInterrupt:
+        logging.info("Agent stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,180 +1,453 @@
 """
 Module for pipeline management and state.
+Keeps a registry of pipeline runs: submissions get a run ID and wait in a
+priority queue (FIFO within a priority) until one of the concurrent run
+slots is free and no other run of the same pipeline is active. Finished runs
+are recorded in the project's run store, which answers the history and
+statistics queries.
 """
 import os
+import json
 import time
+import heapq
+import uuid
+import logging
+import sqlite3
+import itertools
 import threading
 from datetime import datetime
 from core.src.main import PipelineRunner
+from core.src.engine.run_store import RunStore, default_store_path, new_run_id
+
+# Pipelines running at the same time, unless LOCALFORGE_MAX_CONCURRENT_RUNS says otherwise
+DEFAULT_MAX_CONCURRENT_RUNS = 2
+# Finished runs kept in the registry
+MAX_FINISHED_RUNS = 50
+# Characters of output (and of error output) kept per step for the UI; the full output is in the step log
+MAX_STEP_OUTPUT = 64 * 1024
+# Minimum seconds between two status updates sent to the clients while a run streams events
+STATUS_EMIT_INTERVAL = 0.25
+# Runs returned by the history API unless asked otherwise
+DEFAULT_HISTORY_SIZE = 10
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../'))
+
+
+def _append_output(step, key, text):
+    """Appends text to a step's output, keeping only its last MAX_STEP_OUTPUT characters."""
+    output = step.get(key, "") + text
+    if len(output) > MAX_STEP_OUTPUT:
+        output = output[-MAX_STEP_OUTPUT:]
+        step["output_truncated"] = True
+    step[key] = output
+
+
+def _new_status(pipeline_file=None, run_id=None):
+    """Returns the initial status of a run."""
+    return {
+        "run_id": run_id,
+        "running": False,
+        "steps": [],
+        "log": [],
+        "start_time": None,
+        "end_time": None,
+        "duration": None,
+        "current_step": None,
+        "total_steps": 0,
+        "completed_steps": 0,
+        "failed_steps": 0,
+        "success_rate": 0,
+        "pipeline_file": pipeline_file,
+        "report_file": None,
+        # Chrome trace of the run, once it finished (see core/src/engine/trace.py)
+        "trace_file": None,
+        # Whether the runner recorded the run in the run store
+        "recorded": False,
+        # Why the runner could not run the pipeline at all
+        "error": None
+    }
+
 
 class PipelineManager:
-    def __init__(self, socketio):
-        self.status = {
-            "running": False,
-            "steps": [],
-            "log": [],
-            "start_time": None,
-            "end_time": None,
-            "duration": None,
-            "current_step": None,
-            "total_steps": 0,
-            "completed_steps": 0,
-            "failed_steps": 0,
-            "success_rate": 0,
-            "pipeline_file": None
-        }
-        self.history = []
+    def __init__(self, socketio, max_concurrent_runs=None):
+        # Status of the run shown by the UI: the most recently started one
+        self.status = _new_status()
         self.socketio = socketio
+        try:
+            # The store CLI runs record into: one history per pipeline
+            self.store = RunStore(default_store_path())
+        except sqlite3.Error as e:
+            logging.error(f"Run history disabled, the run store can't be opened: {e}")
+            self.store = None
+        self.max_concurrent_runs = max(1, int(
+            max_concurrent_runs or os.environ.get('LOCALFORGE_MAX_CONCURRENT_RUNS', DEFAULT_MAX_CONCURRENT_RUNS)))
+        self.runs = {}
+        self._queue = []
+        self._sequence = itertools.count()
+        self._active_pipelines = set()
+        self._lock = threading.RLock()
+        # Status updates are throttled: last one sent, and the timer sending the pending one
+        self._last_status_emit = 0.0
+        self._status_flush = None
+
+    def get_stats(self, pipeline_file=None, since=None):
+        """
+        Statistics of the recorded runs.
 
-    def get_stats(self):
-        if not self.history:
+        Args:
+            pipeline_file: Only runs of this pipeline (relative to the project root)
+            since: Only runs started after this time, epoch seconds
+        """
+        if not self.store:
             return {"total_runs": 0, "success_rate": 0, "avg_duration": 0}
-        total_runs = len(self.history)
-        successful_runs = sum(1 for run in self.history if run.get("success", False))
-        success_rate = (successful_runs / total_runs) * 100 if total_runs > 0 else 0
-        durations = [run.get("duration_seconds", 0) for run in self.history if run.get("duration_seconds")]
-        avg_duration = sum(durations) / len(durations) if durations else 0
-        return {
-            "total_runs": total_runs,
-            "success_rate": round(success_rate, 1),
-            "avg_duration": round(avg_duration, 1),
-            "last_run": self.history[-1] if self.history else None
-        }
-
-    def run_pipeline_in_background(self, pipeline_file=None):
+        return self.store.stats(self._pipeline_path(pipeline_file), since)
+
+    def get_history(self, limit=DEFAULT_HISTORY_SIZE, pipeline_file=None, status=None):
+        """
+        Most recent recorded runs, oldest first.
+
+        Args:
+            limit: Maximum number of runs
+            pipeline_file: Only runs of this pipeline (relative to the project root)
+            status: Only runs with this status ("success", "failed" or "error")
+        """
+        if not self.store:
+            return []
+        return self.store.history(limit, self._pipeline_path(pipeline_file), status)
+
+    @staticmethod
+    def _pipeline_path(pipeline_file):
+        return os.path.join(PROJECT_ROOT, pipeline_file) if pipeline_file else None
+
+    def submit_run(self, pipeline_file, priority=0, requested_by=None):
+        """
+        Queues a pipeline run.
+
+        Args:
+            pipeline_file: Pipeline path relative to the project root
+            priority: Higher priorities start first; equal priorities start in submission order
+            requested_by: Optional name of who requested the run
+
+        Returns:
+            str: ID of the run
+        """
         if not pipeline_file:
             raise ValueError("Pipeline file to execute must be specified.")
-        def _run():
-            start_time = time.time()
-            self.status.update({
+        run_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self.runs[run_id] = {
+                "id": run_id,
+                "pipeline_file": pipeline_file,
+                "priority": int(priority),
+                "requested_by": requested_by,
+                "state": "queued",
+                "submitted_at": datetime.now().isoformat(),
+                "started_at": None,
+                "finished_at": None,
+                "success": None,
+                "status": _new_status(pipeline_file, run_id),
+                "runner": None,
+                # Set when a stop arrives before the worker created the runner
+                "stop_requested": False
+            }
+            heapq.heappush(self._queue, (-int(priority), next(self._sequence), run_id))
+            self._dispatch()
+        self._emit_runs()
+        return run_id
+
+    def run_pipeline_in_background(self, pipeline_file=None, priority=0):
+        """Queues a pipeline run (see submit_run) and returns its ID."""
+        return self.submit_run(pipeline_file, priority=priority)
+
+    def list_runs(self):
+        """Returns a summary of the queued, running and recently finished runs."""
+        with self._lock:
+            queue_positions = {run_id: position for position, (_, _, run_id) in enumerate(sorted(self._queue), 1)}
+            return [{
+                "id": run["id"],
+                "pipeline_file": run["pipeline_file"],
+                "priority": run["priority"],
+                "requested_by": run["requested_by"],
+                "state": run["state"],
+                "queue_position": queue_positions.get(run["id"]),
+                "submitted_at": run["submitted_at"],
+                "started_at": run["started_at"],
+                "finished_at": run["finished_at"],
+                "success": run["success"]
+            } for run in self.runs.values()]
+
+    def get_run(self, run_id):
+        """Returns the status of a run, or None if it is unknown."""
+        with self._lock:
+            run = self.runs.get(run_id)
+            return dict(run["status"], state=run["state"]) if run else None
+
+    def get_trace(self, run_id):
+        """
+        Returns the Chrome trace of a finished run.
+
+        Returns:
+            dict: Trace events, or None if the run is unknown or has no trace (yet)
+        """
+        with self._lock:
+            run = self.runs.get(run_id)
+            trace_file = run["status"].get("trace_file") if run else None
+        if not trace_file or not os.path.isfile(trace_file):
+            return None
+        with open(trace_file, 'r') as f:
+            return json.load(f)
+
+    def cancel_run(self, run_id):
+        """Removes a queued run, or stops it if it is running. Returns False for unknown or finished runs."""
+        with self._lock:
+            run = self.runs.get(run_id)
+            if not run or run["state"] not in ("queued", "running"):
+                return False
+            if run["state"] == "queued":
+                self._queue = [entry for entry in self._queue if entry[2] != run_id]
+                heapq.heapify(self._queue)
+                run["state"] = "cancelled"
+                run["finished_at"] = datetime.now().isoformat()
+                self._emit_runs()
+                return True
+        return self.stop_pipeline(run_id)
+
+    def _dispatch(self):
+        """Starts queued runs while slots are free. Must hold self._lock."""
+        # A stopping run holds its slot until its worker thread is done (SIGTERM grace period, cleanup steps)
+        running = sum(1 for run in self.runs.values() if run["state"] in ("running", "stopping"))
+        deferred = []
+        while self._queue and running < self.max_concurrent_runs:
+            entry = heapq.heappop(self._queue)
+            run = self.runs[entry[2]]
+            # Per-pipeline lock: the same pipeline never runs twice at once
+            if run["pipeline_file"] in self._active_pipelines:
+                deferred.append(entry)
+                continue
+            self._active_pipelines.add(run["pipeline_file"])
+            run["state"] = "running"
+            run["started_at"] = datetime.now().isoformat()
+            running += 1
+            thread = threading.Thread(target=self._run, args=(run,))
+            thread.daemon = True
+            thread.start()
+        for entry in deferred:
+            heapq.heappush(self._queue, entry)
+
+    def _emit_runs(self):
+        self.socketio.emit('runs_update', {"runs": self.list_runs(), "max_concurrent_runs": self.max_concurrent_runs})
+
+    def get_status(self):
+        """Returns a snapshot of the status of the run shown by the UI."""
+        with self._lock:
+            return self._snapshot(self.status)
+
+    @staticmethod
+    def _snapshot(status):
+        """Copies a run status, so it can be serialized while runner threads update it. Must hold self._lock."""
+        return dict(status, steps=[dict(step) for step in status["steps"]], log=list(status["log"]))
+
+    def _emit_status(self, status, force=False):
+        """
+        Sends a snapshot of a run status to the clients if it is the run shown by the UI.
+
+        Chatty runs (every output chunk is an event) send at most one update per
+        STATUS_EMIT_INTERVAL; the last change is always sent, at the end of the
+        interval. `force` sends it right away (state changes).
+        """
+        with self._lock:
+            if status is not self.status:
+                return
+            wait = self._last_status_emit + STATUS_EMIT_INTERVAL - time.monotonic()
+            if not force and wait > 0:
+                if self._status_flush is None:
+                    self._status_flush = threading.Timer(wait, self._flush_status)
+                    self._status_flush.daemon = True
+                    self._status_flush.start()
+                return
+            if self._status_flush is not None:
+                self._status_flush.cancel()
+                self._status_flush = None
+            self._last_status_emit = time.monotonic()
+            snapshot = self._snapshot(status)
+        self.socketio.emit('pipeline_update', snapshot)
+
+    def _flush_status(self):
+        with self._lock:
+            self._status_flush = None
+            status = self.status
+        self._emit_status(status, force=True)
+
+    def _run(self, run):
+        pipeline_file = run["pipeline_file"]
+        status = run["status"]
+        start_time = time.time()
+        with self._lock:
+            status.update({
                 "running": True,
-                "steps": [],
                 "log": ["🚀 Pipeline started..."],
-                "start_time": datetime.now().isoformat(),
-                "end_time": None,
-                "duration": None,
-                "current_step": None,
-                "total_steps": 0,
-                "completed_steps": 0,
-                "failed_steps": 0,
-                "pipeline_file": pipeline_file
+                "start_time": datetime.now().isoformat()
             })
-            self.socketio.emit('pipeline_update', self.status)
-
-            def progress_callback(event_data):
-                step_name = event_data.get("step")
-                event = event_data.get("event")
-                timestamp = event_data.get('timestamp', datetime.now().strftime('%H:%M:%S'))
-                if event_data.get('message'):
-                    log_entry = f"[{timestamp}] {event_data.get('step', 'Pipeline')}: {event_data.get('message')}"
-                else:
-                    log_entry = f"[{timestamp}] {event}: {step_name}"
-                self.status["log"].append(log_entry)
-                if len(self.status["log"]) > 100:
-                    self.status["log"] = self.status["log"][-100:]
-                if step_name:
-                    step_found = False
-                    for step in self.status["steps"]:
-                        if step["name"] == step_name:
-                            step_found = True
-                            if event == "step_start":
-                                step["status"] = "running"
-                                step["start_time"] = timestamp
-                                self.status["current_step"] = step_name
-                            elif event == "step_success":
-                                step["status"] = "success"
-                                step["duration"] = event_data.get("duration")
-                                step["end_time"] = timestamp
-                                self.status["completed_steps"] += 1
-                            elif event == "step_failure":
-                                step["status"] = "failure"
-                                step["duration"] = event_data.get("duration")
-                                step["error"] = event_data.get("error")
-                                step["end_time"] = timestamp
-                                self.status["failed_steps"] += 1
-                            elif event == "step_output":
-                                step["output"] = step.get("output", "") + event_data.get("output", "") + "\n"
-                            elif event == "step_error":
-                                step["error_output"] = step.get("error_output", "") + event_data.get("error", "") + "\n"
-                            break
-                    if not step_found and event == "step_start":
-                        self.status["steps"].append({
-                            "name": step_name,
-                            "status": "running",
-                            "output": "",
-                            "error_output": "",
-                            "start_time": timestamp
-                        })
-                        self.status["total_steps"] = len(self.status["steps"])
-                
-                if self.status["total_steps"] > 0:
-                    progress = (self.status["completed_steps"] + self.status["failed_steps"]) / self.status["total_steps"] * 100
-                    self.status["progress"] = round(progress, 1)
-                self.socketio.emit('pipeline_update', self.status)
-            
-            try:
-                runner = PipelineRunner(progress_callback=progress_callback)
-                # Store reference to current runner for stop functionality
-                self.current_runner = runner
-                project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../'))
-                absolute_pipeline_path = os.path.join(project_root, pipeline_file)
-                success = runner.execute_pipeline(absolute_pipeline_path, parallel=True)
-                end_time = time.time()
-                duration = end_time - start_time
-                self.status.update({
+            self.status = status
+        self._emit_status(status, force=True)
+        self._emit_runs()
+
+        def progress_callback(event_data):
+            with self._lock:
+                self._handle_progress(status, event_data)
+            self._emit_status(status)
+
+        success = False
+        try:
+            runner = PipelineRunner(progress_callback=progress_callback, collect_metrics=True, run_store=self.store)
+            with self._lock:
+                run["runner"] = runner
+                stop_requested = run["stop_requested"]
+            if stop_requested:
+                runner.stop()
+            absolute_pipeline_path = os.path.join(PROJECT_ROOT, pipeline_file)
+            success = runner.execute_pipeline(absolute_pipeline_path, parallel=True)
+            duration = time.time() - start_time
+            success_msg = "✅ Completed successfully" if success else "❌ Finished with errors"
+            with self._lock:
+                status.update({
                     "running": False,
                     "end_time": datetime.now().isoformat(),
                     "duration": f"{duration:.2f}s",
                     "current_step": None
                 })
-                history_entry = {
-                    "pipeline_file": pipeline_file,
-                    "start_time": self.status["start_time"],
-                    "end_time": self.status["end_time"],
-                    "duration": self.status["duration"],
-                    "duration_seconds": duration,
-                    "success": success,
-                    "total_steps": self.status["total_steps"],
-                    "completed_steps": self.status["completed_steps"],
-                    "failed_steps": self.status["failed_steps"]
-                }
-                self.history.append(history_entry)
-                if len(self.history) > 10:
-                    self.history = self.history[-10:]
-                
-                success_msg = "✅ Completed successfully" if success else "❌ Finished with errors"
-                self.status["log"].append(f"🏁 Pipeline finished. {success_msg} (Duration: {duration:.2f}s)")
-            except Exception as e:
-                end_time = time.time()
-                duration = end_time - start_time
-                self.status.update({
+                status["log"].append(f"🏁 Pipeline finished. {success_msg} (Duration: {duration:.2f}s)")
+            if not status["recorded"]:
+                self._record_failure(run, start_time, duration, status["error"] or "The pipeline could not be run")
+        except Exception as e:
+            duration = time.time() - start_time
+            with self._lock:
+                status.update({
                     "running": False,
                     "end_time": datetime.now().isoformat(),
                     "duration": f"{duration:.2f}s",
                     "current_step": None
                 })
-                self.status["log"].append(f"💥 Critical error in pipeline execution: {e}")
-                history_entry = {
-                    "pipeline_file": pipeline_file,
-                    "start_time": self.status["start_time"],
-                    "end_time": self.status["end_time"],
-                    "duration": self.status["duration"],
-                    "duration_seconds": duration,
-                    "success": False,
-                    "error": str(e),
-                    "total_steps": self.status["total_steps"],
-                    "completed_steps": self.status["completed_steps"],
-                    "failed_steps": self.status["failed_steps"]
-                }
-                self.history.append(history_entry)
-            finally:
-                self.socketio.emit('pipeline_update', self.status)
-                # Emit updated stats after pipeline completion
-                self.socketio.emit('stats_update', self.get_stats())
-
-        thread = threading.Thread(target=_run)
-        thread.daemon = True
-        thread.start()
+                status["log"].append(f"💥 Critical error in pipeline execution: {e}")
+            if not status["recorded"]:
+                self._record_failure(run, start_time, duration, str(e))
+        finally:
+            with self._lock:
+                run["runner"] = None
+                if run["state"] == "running":
+                    run["state"] = "finished"
+                elif run["state"] == "stopping":
+                    run["state"] = "stopped"
+                run["success"] = success
+                run["finished_at"] = datetime.now().isoformat()
+                self._active_pipelines.discard(pipeline_file)
+                self._prune_finished_runs()
+                self._dispatch()
+            self._emit_status(status, force=True)
+            self._emit_runs()
+            # Emit updated stats after pipeline completion
+            self.socketio.emit('stats_update', self.get_stats())
+
+    def _record_failure(self, run, start_time, duration, error):
+        """Records a run the runner gave up on before its report (e.g. an invalid pipeline file)."""
+        if not self.store:
+            return
+        report = {"run_id": new_run_id(), "pipeline_file": self._pipeline_path(run["pipeline_file"]),
+                  "steps": [], "success": False}
+        try:
+            self.store.record_run(report, start_time, duration, error=error)
+        except sqlite3.Error as e:
+            logging.error(f"Error recording run {run['id']}: {e}")
+
+    def _prune_finished_runs(self):
+        """Forgets the oldest finished runs beyond MAX_FINISHED_RUNS. Must hold self._lock."""
+        finished = [run_id for run_id, run in self.runs.items()
+                    if run["state"] not in ("queued", "running", "stopping")]
+        for run_id in finished[:max(0, len(finished) - MAX_FINISHED_RUNS)]:
+            del self.runs[run_id]
+
+    @staticmethod
+    def _handle_progress(status, event_data):
+        """Applies a runner progress event to a run status."""
+        step_name = event_data.get("step")
+        event = event_data.get("event")
+        if event_data.get("metrics"):
+            for step in status["steps"]:
+                if step["name"] == step_name:
+                    step["metrics"] = event_data["metrics"]
+        if event == "step_metrics":
+            # Live usage samples only update the step, they don't belong in the run log
+            return
+        if event in ("report_saved", "trace_saved"):
+            status["report_file" if event == "report_saved" else "trace_file"] = event_data.get("file")
+        elif event == "run_recorded":
+            status["recorded"] = True
+        elif event == "pipeline_error":
+            status["error"] = event_data.get("error")
+        timestamp = event_data.get('timestamp', datetime.now().strftime('%H:%M:%S'))
+        if event_data.get('message'):
+            log_entry = f"[{timestamp}] {event_data.get('step', 'Pipeline')}: {event_data.get('message')}"
+        else:
+            log_entry = f"[{timestamp}] {event}: {step_name}"
+        status["log"].append(log_entry)
+        if len(status["log"]) > 100:
+            status["log"] = status["log"][-100:]
+        if step_name:
+            step_found = False
+            for step in status["steps"]:
+                if step["name"] == step_name:
+                    step_found = True
+                    if event == "step_start":
+                        step["status"] = "running"
+                        step["start_time"] = timestamp
+                        status["current_step"] = step_name
+                    elif event == "step_success":
+                        step["status"] = "success"
+                        step["duration"] = event_data.get("duration")
+                        step["cache_hit"] = event_data.get("cache_hit", False)
+                        step["attempts"] = event_data.get("attempts", 1)
+                        step["log_file"] = event_data.get("log_file")
+                        step["end_time"] = timestamp
+                        status["completed_steps"] += 1
+                    elif event == "step_failure":
+                        step["status"] = "failure"
+                        # "timeout" / "resource_exceeded" when a step limit stopped it
+                        step["failure_reason"] = event_data.get("status")
+                        step["duration"] = event_data.get("duration")
+                        step["error"] = event_data.get("error")
+                        step["log_file"] = event_data.get("log_file")
+                        step["end_time"] = timestamp
+                        status["failed_steps"] += 1
+                    elif event == "step_skipped":
+                        step["status"] = "skipped"
+                        step["end_time"] = timestamp
+                        status["completed_steps"] += 1
+                    elif event == "step_retry":
+                        step["attempt"] = event_data.get("attempt")
+                        _append_output(step, "output", (
+                            f">>> Attempt {event_data.get('attempt')}/{event_data.get('attempts')} "
+                            f"in {event_data.get('delay', 0):g}s (exit code {event_data.get('exit_code')})\n"))
+                    elif event == "step_output":
+                        _append_output(step, "output", event_data.get("output", "") + "\n")
+                    elif event == "step_error":
+                        _append_output(step, "error_output", event_data.get("error", "") + "\n")
+                    if event in ("step_success", "step_failure") and step.get("output_truncated") and step["log_file"]:
+                        _append_output(step, "output", f">>> Output truncated, full log: {step['log_file']}\n")
+                    break
+            if not step_found and event in ("step_start", "step_skipped"):
+                status["steps"].append({
+                    "name": step_name,
+                    "status": "running" if event == "step_start" else "skipped",
+                    "output": "",
+                    "error_output": "",
+                    "start_time": timestamp
+                })
+                status["total_steps"] = len(status["steps"])
+                if event == "step_skipped":
+                    status["completed_steps"] += 1
+
+        if status["total_steps"] > 0:
+            progress = (status["completed_steps"] + status["failed_steps"]) / status["total_steps"] * 100
+            status["progress"] = round(progress, 1)
 
     def clear_logs(self):
         if not self.status["running"]:
@@ -186,29 +459,31 @@ class PipelineManager:
             self.status["steps"] = []
             self.socketio.emit('pipeline_update', {"steps": self.status["steps"]})
 
-    def stop_pipeline(self):
-        """Stops the current pipeline execution."""
-        if not self.status["running"]:
-            return False
-        
+    def stop_pipeline(self, run_id=None):
+        """Stops a running pipeline execution (by default the one shown by the UI)."""
+        with self._lock:
+            run = self.runs.get(run_id or self.status.get("run_id"))
+            if not run or run["state"] != "running":
+                return False
+            # The run becomes "stopped" when its worker thread is done
+            run["state"] = "stopping"
+            runner = run["runner"]
+            if not runner:
+                # The worker hasn't created the runner yet, it stops it right after
+                run["stop_requested"] = True
+        status = run["status"]
+
         try:
-            # Stop the pipeline runner if it exists
-            if hasattr(self, 'current_runner') and self.current_runner:
-                self.current_runner.stop()
-            
-            # Update status to indicate stopped
-            self.status.update({
-                "running": False,
-                "current_step": None,
-                "end_time": datetime.now().isoformat()
-            })
-            
-            # Add stop message to logs
-            self.status["log"].append(f"⏹️ Pipeline stopped by user request at {datetime.now().strftime('%H:%M:%S')}")
-            
+            if runner:
+                runner.stop()
+
+            with self._lock:
+                status["log"].append(f"⏹️ Pipeline stop requested by user at {datetime.now().strftime('%H:%M:%S')}")
+
             # Emit status update
-            self.socketio.emit('pipeline_update', self.status)
-            
+            self._emit_status(status, force=True)
+            self._emit_runs()
+
             return True
         except Exception as e:
             print(f"❌ Error stopping pipeline: {e}")
@@ -4,7 +4,8 @@ Utility functions for the web UI: pipeline discovery, statistics, etc.
 import os
 import glob
 from datetime import datetime
-import yaml
+
+from core.src.engine.pipeline_loader import load_pipeline
 
 def discover_pipeline_files():
     """Automatically discovers available pipeline files in the project."""
@@ -42,15 +43,14 @@ def discover_pipeline_files():
                     env_suffix = ''
                 
                 try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        config = yaml.safe_load(f)
-                        name = config.get('name', f"{project_name} - {environment.title()}")
-                        description = config.get('description', 'No description')
-                        steps_count = 0
-                        if 'pipeline' in config:
-                            steps_count += len(config['pipeline'])
-                        if 'parallel_steps' in config:
-                            steps_count += len(config['parallel_steps'])
+                    config = load_pipeline(file_path)
+                    name = config.get('name', f"{project_name} - {environment.title()}")
+                    description = config.get('description', 'No description')
+                    steps_count = 0
+                    if 'pipeline' in config:
+                        steps_count += len(config['pipeline'])
+                    if 'parallel_steps' in config:
+                        steps_count += len(config['parallel_steps'])
                 except Exception as e:
                     name = f"{project_name} - {environment.title()}"
                     description = f'Pipeline file (Read error: {str(e)})'
@@ -0,0 +1,187 @@
+"""
+asyncio-based pipeline engine.
+Runs the same pipelines as PipelineRunner, with the same progress events and
+report format, but multiplexes every child process and its output from a
+single event loop instead of one thread per running step.
+"""
+import time
+import asyncio
+import logging
+import subprocess
+from typing import Any, Callable, Dict, Optional
+
+from core.src.main import PipelineRunner, _command_argv
+from core.src.engine.output import stream_async_process_output
+from core.src.engine.scheduler import StepScheduler
+from core.src.engine.limits import apply_cpu_limit
+from core.src.engine.process import TERMINATE_GRACE_PERIOD, process_group_alive, process_group_kwargs, signal_process_group
+from core.src.engine.trace import mark
+
+# Concurrent steps for parallel runs when no limit is given
+DEFAULT_ASYNC_CONCURRENCY = 256
+
+
+class AsyncPipelineRunner(PipelineRunner):
+    """PipelineRunner variant built on asyncio subprocesses."""
+
+    def __init__(self, *args, **kwargs):
+        """Initializes the runner. Accepts the same arguments as PipelineRunner."""
+        super().__init__(*args, **kwargs)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._processes = set()
+
+    def _terminate_running(self):
+        """Terminates the process trees of every running step from the event loop."""
+        if self.agent_pool:
+            self.agent_pool.stop_all()
+        loop = self._loop
+        if loop and not loop.is_closed():
+            try:
+                loop.call_soon_threadsafe(self._terminate_processes)
+            except RuntimeError:
+                # The loop finished in the meantime
+                pass
+
+    def _terminate_processes(self):
+        """Terminates the running process groups, killing them after a grace period."""
+        for process in list(self._processes):
+            logging.info(f"Terminating process group {process.pid}...")
+            if signal_process_group(process.pid):
+                self._loop.call_later(TERMINATE_GRACE_PERIOD, self._kill_process_group, process.pid)
+
+    @staticmethod
+    def _kill_process_group(pid):
+        if process_group_alive(pid) and signal_process_group(pid, force=True):
+            logging.warning(f"Forced termination of process group {pid}")
+
+    def _default_workers(self) -> int:
+        return DEFAULT_ASYNC_CONCURRENCY
+
+    def _worker_name(self) -> str:
+        # Every step is a task of the same loop; the trace gives overlapping ones their own lanes
+        return "event-loop"
+
+    def _run_phases(self, pipeline_config: Dict[str, Any], scheduler: StepScheduler,
+                    env_vars: Optional[Dict[str, str]]):
+        """Runs the step graph and the cleanup steps on one event loop."""
+        return asyncio.run(self._run_phases_async(pipeline_config, scheduler, env_vars))
+
+    async def _run_phases_async(self, pipeline_config: Dict[str, Any], scheduler: StepScheduler,
+                                env_vars: Optional[Dict[str, str]]):
+        self._loop = asyncio.get_running_loop()
+        try:
+            results = []
+            final_success = True
+            if scheduler.nodes:
+                self._graph_started(scheduler)
+                results, final_success = await scheduler.run_async(
+                    lambda step: self.execute_step_async(step, env_vars),
+                    should_stop=lambda: self.stop_requested,
+                    on_halt=self._pipeline_halted
+                )
+                self._emit_progress({"event": "graph_end"})
+
+            # Execute cleanup steps if they exist
+            if 'cleanup' in pipeline_config:
+                logging.info("Starting cleanup steps")
+                self._emit_progress({"event": "cleanup_start"})
+                for cleanup_step in pipeline_config.get('cleanup', []):
+                    cleanup_result = await self.execute_step_async(cleanup_step, env_vars, is_cleanup=True)
+                    results.append(cleanup_result)
+                    # Cleanup steps don't affect the overall pipeline success
+                self._emit_progress({"event": "cleanup_end"})
+            return results, final_success
+        finally:
+            self._loop = None
+
+    async def execute_step_async(self, step: Dict[str, Any], env_vars: Optional[Dict[str, str]] = None,
+                                 is_cleanup: bool = False) -> Dict[str, Any]:
+        """Executes an individual pipeline step as a coroutine."""
+        started = mark("start")
+        return self._step_done(await self._execute_step_async(step, env_vars, is_cleanup), started, is_cleanup)
+
+    async def _execute_step_async(self, step: Dict[str, Any], env_vars: Optional[Dict[str, str]],
+                                  is_cleanup: bool) -> Dict[str, Any]:
+        if self.agent_pool:
+            # Dispatching blocks until the agent reports back, keep it off the loop
+            return await asyncio.get_running_loop().run_in_executor(
+                None, self._execute_remote, step, env_vars, is_cleanup)
+
+        run = self._begin_step(step, env_vars, is_cleanup)
+        if "result" in run:
+            return run["result"]
+        # Probes block (HTTP, sockets, log commands), keep them off the loop
+        if run["wait_for"] and not await asyncio.get_running_loop().run_in_executor(None, self._wait_for_ready, run):
+            return self._step_cancelled(run) if self._cancelling(is_cleanup) else self._step_limit_exceeded(run)
+
+        # Each iteration is one attempt; only steps with a retry policy loop
+        while True:
+            try:
+                # Execute each command sequentially
+                for i, command in enumerate(run["commands"]):
+                    # Check if stop was requested (except for cleanup steps)
+                    if self._cancelling(is_cleanup):
+                        return self._step_cancelled(run)
+                    if self._deadline_passed(run):
+                        return self._step_limit_exceeded(run)
+
+                    on_chunk, command_stderr = self._begin_command(run, i, command)
+                    return_code = await self._run_command_async(run, command, on_chunk)
+                    self._check_return_code(run, i, command, return_code, command_stderr)
+
+                return self._step_succeeded(run)
+            except subprocess.CalledProcessError as e:
+                # A command killed by fail-fast or a stop request is cancelled, not failed
+                if self._cancelling(is_cleanup):
+                    return self._step_cancelled(run)
+                if self._limit_exceeded(run, e.returncode):
+                    return self._step_limit_exceeded(run)
+                delay = self._retry_delay(run, e)
+                if delay is None:
+                    return self._step_failed(run, e)
+                if not await self._wait_before_retry_async(delay, is_cleanup):
+                    return self._step_cancelled(run)
+            except Exception as e:
+                return self._step_crashed(run, e)
+
+    async def _wait_before_retry_async(self, delay: float, is_cleanup: bool) -> bool:
+        """Waits for a retry backoff. Returns False if the step was cancelled meanwhile."""
+        end = time.time() + delay
+        while not self._cancelling(is_cleanup) and time.time() < end:
+            await asyncio.sleep(min(0.1, end - time.time()))
+        return not self._cancelling(is_cleanup)
+
+    async def _run_command_async(self, run: Dict[str, Any], command: str,
+                                 on_chunk: Callable[[str, str], None]) -> int:
+        """Runs one command of a step as an asyncio subprocess and returns its exit code."""
+        pipes = {"stdout": asyncio.subprocess.PIPE, "stderr": asyncio.subprocess.PIPE, "env": run["env"],
+                 "cwd": run["cwd"], **process_group_kwargs()}
+        process = None
+        cmd_list = _command_argv(command)
+        if cmd_list:
+            try:
+                process = await asyncio.create_subprocess_exec(*cmd_list, **pipes)
+            except OSError:
+                # If the program can't be started directly, let the shell try
+                process = None
+        if process is None:
+            process = await asyncio.create_subprocess_shell(command, **pipes)
+
+        apply_cpu_limit(process.pid, run["limits"])
+        self._processes.add(process)
+        self._watch_limits(run, process.pid)
+        # The event loop reaps the process, so the usage comes from the samples alone
+        self._watch_usage(run, process.pid)
+        try:
+            # A stop may have been requested while the process was starting
+            if self._cancelling(run["is_cleanup"]):
+                self._terminate_processes()
+            await stream_async_process_output(process, on_chunk, chunk_size=self.output_chunk_size)
+            if run["usage"]:
+                # Last look at the finished command before the event loop reaps it
+                self.sampler.sample_now(process.pid)
+            return await process.wait()
+        finally:
+            self.watchdog.unwatch(process.pid)
+            self._processes.discard(process)
+            self._unwatch_usage(run, process.pid)
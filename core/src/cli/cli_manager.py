@@ -4,9 +4,12 @@ Avoids code duplication for argument parsing between scripts.
 """
 import argparse
 import logging
+import os
 import sys
 from typing import Dict, Any
 
+from core.src.engine.notifications import NOTIFICATION_FLUSH_TIMEOUT
+
 
 class CLIManager:
     """Centralized manager for command line arguments."""
@@ -23,6 +26,60 @@ class CLIManager:
                           help='Run parallel steps if defined')
         parser.add_argument('--continue', dest='continue_on_error', action='store_true', 
                           help='Continue execution even if there are errors')
+        parser.add_argument('--max-workers', type=int, default=None,
+                          help='Maximum number of steps running at the same time (with --parallel)')
+        parser.add_argument('--resource', action='append', metavar='LABEL=CAPACITY',
+                          help='Capacity of a named step resource, e.g. docker=2 (overrides the pipeline)')
+        parser.add_argument('--engine', default='threads', choices=['threads', 'asyncio'],
+                          help='Execution engine: a thread per running step, or one asyncio event loop')
+        parser.add_argument('--no-cache', action='store_true',
+                          help='Always run steps, ignoring cached results of unchanged inputs')
+        parser.add_argument('--since', metavar='REF',
+                          help='Only run steps whose paths: filter matches files changed since this git ref')
+        parser.add_argument('--resume', metavar='RUN_ID',
+                          help='Resume a failed or interrupted run: skip the steps it completed and run the rest')
+        parser.add_argument('--watch', action='store_true',
+                          help='Keep running: rerun the steps whose paths:/inputs: match files changed in the pipeline directory')
+        parser.add_argument('--metrics', action='store_true',
+                          help='Record the CPU time, peak memory and I/O of every step in the report (Linux)')
+        parser.add_argument('--notification-timeout', type=float, default=NOTIFICATION_FLUSH_TIMEOUT, metavar='SECONDS',
+                          help='Seconds to wait at exit for notification hooks still running before dropping them '
+                               f'(default: {NOTIFICATION_FLUSH_TIMEOUT:g})')
+        parser.add_argument('--agents', metavar='ADDRESS',
+                          help='Run steps on localforge-agent workers connecting to this address '
+                               '(tcp://host:port or unix:///path); any other address than loopback or a Unix '
+                               'socket requires --agent-token')
+        parser.add_argument('--agent-token', default=os.environ.get('LOCALFORGE_AGENT_TOKEN'),
+                          help='Shared secret agents must present (default: $LOCALFORGE_AGENT_TOKEN); '
+                               'required when --agents is not a loopback address or Unix socket, since agents '
+                               'receive the step commands and environment, secrets included')
+        parser.add_argument('--agent-timeout', type=float, default=60.0,
+                          help='Seconds to wait for a matching agent before failing a step')
+        parser.add_argument('--log-level', default='INFO', 
+                          choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], 
+                          help='Logging level')
+        return parser
+    
+    @staticmethod
+    def create_agent_parser() -> argparse.ArgumentParser:
+        """Creates the argument parser for pipeline agents."""
+        parser = argparse.ArgumentParser(description='Runs pipeline steps sent by a LocalForge coordinator')
+        parser.add_argument('--connect', '-c', required=True, metavar='ADDRESS',
+                          help='Coordinator address (tcp://host:port or unix:///path)')
+        parser.add_argument('--name',
+                          help='Agent name shown in logs and reports (default: hostname and PID)')
+        parser.add_argument('--labels', '-l', default='',
+                          help='Comma-separated labels matched against the runs_on: of steps')
+        parser.add_argument('--slots', type=int, default=1,
+                          help='Number of steps this agent runs at the same time')
+        parser.add_argument('--workdir',
+                          help='Directory steps run in when the coordinator directory does not exist here')
+        parser.add_argument('--token', default=os.environ.get('LOCALFORGE_AGENT_TOKEN'),
+                          help='Shared secret expected by the coordinator (default: $LOCALFORGE_AGENT_TOKEN)')
+        parser.add_argument('--no-cache', action='store_true',
+                          help='Always run steps, ignoring cached results of unchanged inputs')
+        parser.add_argument('--once', action='store_true',
+                          help='Exit when the coordinator disconnects instead of reconnecting')
         parser.add_argument('--log-level', default='INFO', 
                           choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], 
                           help='Logging level')
@@ -42,6 +99,22 @@ class CLIManager:
                     sys.exit(1)
         return env_vars
     
+    @staticmethod
+    def parse_resource_limits(resource_args: list) -> Dict[str, int]:
+        """Parses resource capacities from command line arguments."""
+        limits = {}
+        if resource_args:
+            for resource in resource_args:
+                try:
+                    label, capacity = resource.split('=', 1)
+                    limits[label] = int(capacity)
+                    if limits[label] < 1:
+                        raise ValueError(capacity)
+                except ValueError:
+                    logging.error(f"Invalid resource capacity: {resource}. Use LABEL=CAPACITY with a positive integer.")
+                    sys.exit(1)
+        return limits
+    
     @staticmethod
     def get_log_level(level_str: str) -> int:
         """Converts log level string to logging constant."""
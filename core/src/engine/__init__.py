@@ -0,0 +1,6 @@
+"""
+Engine package with the building blocks used by the pipeline runner.
+"""
+from .scheduler import StepScheduler, build_step_graph, default_max_workers
+
+__all__ = ['StepScheduler', 'build_step_graph', 'default_max_workers']
@@ -0,0 +1,400 @@
+"""
+Artifacts passed between pipeline steps.
+A step declares the files it produces with `artifacts:` and a later step
+the ones it consumes with `uses_artifacts:`:
+
+    - step: build
+      artifacts:
+        dist: frontend/dist        # name: path, relative to the step's working directory
+    - step: package
+      uses_artifacts: [dist]       # placed back at frontend/dist
+    - step: test
+      uses_artifacts:
+        dist: e2e/dist             # or at another path, relative to this step's working directory
+
+When a step succeeds its artifacts are collected into a per-run store and
+consumers get them from there. Files are cloned rather than rebuilt: a
+reflink (copy-on-write clone) when the filesystem supports it, else an
+in-kernel copy_file_range, and only as a last resort a regular copy. They
+are never hardlinked, so a step writing to its copy in place (appending,
+truncating) can't change the stored artifact or another consumer's copy.
+
+Consumers sharing a destination (by default the producer's own path) place
+it once: a destination still holding what was collected or last placed is
+left alone, and otherwise a fresh copy is staged next to it and swapped in.
+
+The jobs of a matrix step each produce their own artifacts, named after
+the job: `dist (python=3.11)`.
+"""
+import os
+import shutil
+import logging
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Artifact stores, relative to the pipeline directory
+ARTIFACTS_DIR = os.path.join(".localforge", "artifacts")
+# Stores of previous runs kept next to the current one
+KEPT_RUNS = 5
+# ioctl cloning a whole file (Linux: btrfs, XFS, bcachefs...)
+FICLONE = 0x40049409
+_COPY_BLOCK = 64 * 1024 * 1024
+
+
+def step_artifacts(step: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Returns the artifacts a step produces, by name.
+
+    `artifacts:` is a mapping of name to path, or a list of paths named
+    after their last component.
+
+    Raises:
+        ValueError: If the declaration is malformed
+    """
+    return _artifact_mapping(step, 'artifacts', required_paths=True)
+
+
+def step_artifact_uses(step: Dict[str, Any]) -> Dict[str, Optional[str]]:
+    """
+    Returns the artifacts a step consumes, by name, with their destination.
+
+    The destination is None when the artifact goes back to the path it was
+    collected from.
+
+    Raises:
+        ValueError: If the declaration is malformed
+    """
+    return _artifact_mapping(step, 'uses_artifacts', required_paths=False)
+
+
+def _artifact_mapping(step: Dict[str, Any], key: str, required_paths: bool) -> Dict[str, Any]:
+    value = step.get(key)
+    if not value:
+        return {}
+    if isinstance(value, str):
+        value = [value]
+    if isinstance(value, list):
+        if required_paths:
+            return {os.path.basename(os.path.normpath(str(path))): str(path) for path in value}
+        return {str(name): None for name in value}
+    if isinstance(value, dict):
+        mapping = {str(name): (str(path) if path else None) for name, path in value.items()}
+        if required_paths and not all(mapping.values()):
+            raise ValueError(f"every entry of '{key}' needs a path")
+        return mapping
+    raise ValueError(f"invalid {key}: {value!r} (use a list or a mapping)")
+
+
+def link_file(src: str, dst: str) -> str:
+    """
+    Places a private copy of a file at `dst`, sharing storage with `src` where the filesystem allows it.
+
+    Tries a reflink, then copy_file_range, then a plain copy.
+
+    Returns:
+        str: Method used: "reflink", "copy_file_range" or "copy"
+    """
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        if fcntl is not None:
+            try:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+                shutil.copymode(src, dst)
+                return "reflink"
+            except OSError:
+                pass
+        if hasattr(os, 'copy_file_range'):
+            try:
+                size = os.fstat(fsrc.fileno()).st_size
+                copied = 0
+                while copied < size:
+                    sent = os.copy_file_range(fsrc.fileno(), fdst.fileno(), min(_COPY_BLOCK, size - copied))
+                    if sent == 0:
+                        break
+                    copied += sent
+                if copied == size:
+                    shutil.copymode(src, dst)
+                    return "copy_file_range"
+                fsrc.seek(0)
+                fdst.seek(0)
+                fdst.truncate()
+            except OSError:
+                fsrc.seek(0)
+                fdst.seek(0)
+                fdst.truncate()
+        shutil.copyfileobj(fsrc, fdst, _COPY_BLOCK)
+    shutil.copymode(src, dst)
+    return "copy"
+
+
+def link_tree(src: str, dst: str) -> Dict[str, int]:
+    """
+    Places a file or directory tree at `dst` with link_file().
+
+    Files already at `dst` are replaced, even when they are hardlinks of the
+    source. Symlinks are recreated as symlinks.
+
+    Returns:
+        dict: Number of files per method, plus `files` and `bytes` totals
+    """
+    stats = {"files": 0, "bytes": 0}
+
+    def place(src_file, dst_file):
+        if os.path.lexists(dst_file):
+            os.unlink(dst_file)
+        if os.path.islink(src_file):
+            os.symlink(os.readlink(src_file), dst_file)
+            method = "symlink"
+        else:
+            method = link_file(src_file, dst_file)
+            stats["bytes"] += os.path.getsize(src_file)
+        stats[method] = stats.get(method, 0) + 1
+        stats["files"] += 1
+
+    if os.path.isdir(src) and not os.path.islink(src):
+        for root, dirs, files in os.walk(src):
+            target_root = os.path.join(dst, os.path.relpath(root, src))
+            os.makedirs(target_root, exist_ok=True)
+            for name in dirs:
+                # os.walk doesn't descend into directory symlinks, recreate them as links
+                if os.path.islink(os.path.join(root, name)):
+                    place(os.path.join(root, name), os.path.join(target_root, name))
+            for name in files:
+                place(os.path.join(root, name), os.path.join(target_root, name))
+    else:
+        os.makedirs(os.path.dirname(dst) or '.', exist_ok=True)
+        place(src, dst)
+    return stats
+
+
+def tree_state(path: str) -> Optional[Dict[str, Tuple]]:
+    """
+    Size and modification time of every file of a tree (symlinks by target),
+    to tell whether it changed since it was placed. None if it doesn't exist.
+    """
+    def entry(file_path):
+        if os.path.islink(file_path):
+            return ("link", os.readlink(file_path))
+        stat = os.stat(file_path)
+        return (stat.st_size, stat.st_mtime_ns)
+
+    try:
+        if not os.path.isdir(path) or os.path.islink(path):
+            return {"": entry(path)}
+        state = {}
+        for root, dirs, files in os.walk(path):
+            for name in files + [name for name in dirs if os.path.islink(os.path.join(root, name))]:
+                file_path = os.path.join(root, name)
+                state[os.path.relpath(file_path, path)] = entry(file_path)
+        return state
+    except OSError:
+        return None
+
+
+def replace_tree(src: str, dst: str) -> Dict[str, int]:
+    """
+    Replaces `dst` by a copy of `src` (see link_tree), staged next to it and renamed
+    into place, so `dst` never holds a partial tree.
+
+    Returns:
+        dict: Number of files per method, plus `files` and `bytes` totals
+    """
+    parent = os.path.dirname(dst) or '.'
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=f".{os.path.basename(dst)}.", dir=parent)
+    try:
+        staged = os.path.join(staging, "new")
+        stats = link_tree(src, staged)
+        if os.path.lexists(dst):
+            # A directory can't be renamed over a non-empty one: move the old tree aside first
+            os.rename(dst, os.path.join(staging, "old"))
+        os.replace(staged, dst)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return stats
+
+
+class ArtifactStore:
+    """Artifacts collected during one pipeline run."""
+
+    def __init__(self, root: str, run_id: str):
+        """
+        Initializes the store of a run.
+
+        Args:
+            root: Directory holding the stores of all runs
+            run_id: ID of the run
+        """
+        self.root = root
+        self.path = os.path.join(root, run_id)
+        self._artifacts: Dict[str, Dict[str, Any]] = {}
+        # Destination -> tree_state() after the last placement there, and the lock serializing placements
+        self._placed: Dict[str, Dict[str, Tuple]] = {}
+        self._target_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def collect(self, step_name: str, artifacts: Dict[str, str], base_dir: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Collects the artifacts produced by a step.
+
+        Args:
+            step_name: Producing step
+            artifacts: Name -> path, relative to base_dir
+            base_dir: Working directory of the step
+
+        Returns:
+            dict: Name -> stored artifact details (`path`, `files`, `bytes`, methods)
+
+        Raises:
+            ValueError: If an artifact is missing
+        """
+        collected = {}
+        for name, path in artifacts.items():
+            source = os.path.normpath(os.path.join(base_dir, path))
+            if not os.path.lexists(source):
+                raise ValueError(f"step {step_name} did not produce artifact '{name}' ({path})")
+            stored = os.path.join(self.path, name, os.path.basename(source))
+            if os.path.lexists(os.path.dirname(stored)):
+                shutil.rmtree(os.path.dirname(stored))
+            stats = link_tree(source, stored)
+            details = dict(stats, path=path, source=source, step=step_name)
+            state = tree_state(source)
+            with self._lock:
+                self._artifacts[name] = dict(details, stored=stored)
+                self._placed[source] = state
+            collected[name] = details
+            logging.info(f"Stored artifact '{name}' of step {step_name}: {stats['files']} files, {stats['bytes']} bytes")
+        return collected
+
+    def restore(self, step_name: str, uses: Dict[str, Optional[str]], base_dir: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Places the artifacts a step consumes in its working directory.
+
+        Args:
+            step_name: Consuming step
+            uses: Name -> destination relative to base_dir, or None for the original location
+            base_dir: Working directory of the step
+
+        Returns:
+            dict: Name -> placement details (`path`, `files`, `bytes`, methods)
+
+        Raises:
+            ValueError: If an artifact has not been produced
+        """
+        restored = {}
+        for name, destination in uses.items():
+            with self._lock:
+                artifact = self._artifacts.get(name)
+            if not artifact:
+                raise ValueError(f"artifact '{name}' used by step {step_name} has not been produced "
+                                 f"(did its producing step fail or not run?)")
+            target = (os.path.normpath(os.path.join(base_dir, destination)) if destination
+                      else artifact["source"])
+            with self._lock:
+                target_lock = self._target_locks.setdefault(target, threading.Lock())
+            # Parallel consumers of one destination place it once instead of rewriting it under each other
+            with target_lock:
+                with self._lock:
+                    placed = self._placed.get(target)
+                if placed is not None and tree_state(target) == placed:
+                    restored[name] = {"files": len(placed), "bytes": 0, "unchanged": len(placed), "path": target}
+                    logging.info(f"Artifact '{name}' for step {step_name} is already at {target}")
+                    continue
+                stats = replace_tree(artifact["stored"], target)
+                state = tree_state(target)
+                with self._lock:
+                    self._placed[target] = state
+            restored[name] = dict(stats, path=target)
+            logging.info(f"Placed artifact '{name}' for step {step_name} at {target}")
+        return restored
+
+    def adopt(self, step_name: str, artifacts: Dict[str, str], base_dir: str) -> bool:
+        """
+        Registers the artifacts a step collected earlier in this run, before it was resumed.
+
+        Args:
+            step_name: Producing step
+            artifacts: Name -> path, relative to base_dir
+            base_dir: Working directory of the step
+
+        Returns:
+            bool: False if one of them is no longer in the store
+        """
+        adopted = {}
+        for name, path in artifacts.items():
+            source = os.path.normpath(os.path.join(base_dir, path))
+            stored = os.path.join(self.path, name, os.path.basename(source))
+            if not os.path.lexists(stored):
+                return False
+            adopted[name] = {"path": path, "source": source, "step": step_name, "stored": stored}
+        with self._lock:
+            self._artifacts.update(adopted)
+        return True
+
+    def carry_over(self, step_name: str, artifacts: Dict[str, str], base_dir: str) -> bool:
+        """
+        Copies into this run's store the artifacts of a step skipped because none of
+        its `paths:` changed, from the latest earlier run that stored them all.
+
+        Args:
+            step_name: Producing step
+            artifacts: Name -> path, relative to base_dir
+            base_dir: Working directory of the step
+
+        Returns:
+            bool: False if no earlier run stored them (the step must run)
+        """
+        try:
+            runs = sorted((entry for entry in os.listdir(self.root) if os.path.join(self.root, entry) != self.path),
+                          reverse=True)
+        except FileNotFoundError:
+            return False
+        sources = {name: os.path.normpath(os.path.join(base_dir, path)) for name, path in artifacts.items()}
+        for run in runs:
+            earlier = {name: os.path.join(self.root, run, name, os.path.basename(source))
+                       for name, source in sources.items()}
+            if not all(os.path.lexists(path) for path in earlier.values()):
+                continue
+            carried = {}
+            for name, source in sources.items():
+                stored = os.path.join(self.path, name, os.path.basename(source))
+                if os.path.lexists(os.path.dirname(stored)):
+                    shutil.rmtree(os.path.dirname(stored))
+                link_tree(earlier[name], stored)
+                carried[name] = {"path": artifacts[name], "source": source, "step": step_name, "stored": stored}
+            with self._lock:
+                self._artifacts.update(carried)
+            logging.info(f"Carried over the artifacts of step {step_name} from run {run}")
+            return True
+        return False
+
+    def prune(self, keep: int = KEPT_RUNS) -> None:
+        """Removes the stores of older runs, keeping the `keep` most recent ones besides this one."""
+        try:
+            runs = sorted(entry for entry in os.listdir(self.root)
+                          if os.path.join(self.root, entry) != self.path)
+        except FileNotFoundError:
+            return
+        for entry in runs[:max(0, len(runs) - keep)]:
+            shutil.rmtree(os.path.join(self.root, entry), ignore_errors=True)
+
+
+def producers(nodes: List[Dict[str, Any]]) -> Dict[str, str]:
+    """
+    Maps every artifact name to the graph node producing it.
+
+    Raises:
+        ValueError: If several steps produce the same artifact
+    """
+    produced_by: Dict[str, str] = {}
+    for node in nodes:
+        for name in step_artifacts(node["step"]):
+            if name in produced_by:
+                raise ValueError(f"Artifact '{name}' is produced by both {produced_by[name]} and {node['name']}")
+            produced_by[name] = node["name"]
+    return produced_by
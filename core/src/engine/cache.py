@@ -0,0 +1,154 @@
+"""
+Content-addressed cache of step results.
+A step that declares `inputs:` (file globs) is keyed on the content of those
+files, its command list and the environment the pipeline gives it: the
+pipeline's variables, the step's `env:` and the variables it names in
+`env_inputs:`. The rest of the inherited environment (SSH_*, DISPLAY, a
+different shell or the web UI's process) doesn't invalidate entries. When a
+previous successful run produced the same key, the stored result is replayed
+instead of running the commands again.
+"""
+import os
+import glob
+import json
+import hashlib
+import logging
+import tempfile
+from typing import Any, Dict, List, Optional
+
+# Default cache location, relative to the pipeline directory
+CACHE_DIR = os.path.join(".localforge", "cache")
+# Bump when the key derivation or the entry format changes
+CACHE_VERSION = 3
+_READ_BLOCK = 1024 * 1024
+
+
+def step_inputs(step: Dict[str, Any]) -> List[str]:
+    """Returns the `inputs:` globs declared by a step."""
+    inputs = step.get('inputs') or []
+    if isinstance(inputs, str):
+        return [inputs]
+    return [str(pattern) for pattern in inputs]
+
+
+def step_env_inputs(step: Dict[str, Any]) -> List[str]:
+    """Returns the names of the inherited environment variables a step's result depends on (`env_inputs:`)."""
+    names = step.get('env_inputs') or []
+    if isinstance(names, str):
+        return [names]
+    return [str(name) for name in names]
+
+
+def keyed_env(step: Dict[str, Any], pipeline_env: Optional[Dict[str, str]], env: Dict[str, str]) -> Dict[str, Optional[str]]:
+    """
+    Returns the variables a step's cache key depends on.
+
+    Args:
+        step: Step definition
+        pipeline_env: Variables given to the pipeline run
+        env: Effective environment of the step, for the `env_inputs:` names
+
+    Returns:
+        dict: Name -> value (None for an `env_inputs:` variable that is not set)
+    """
+    keyed: Dict[str, Optional[str]] = {str(key): str(value) for key, value in (pipeline_env or {}).items()}
+    keyed.update({str(key): str(value) for key, value in (step.get('env') or {}).items()})
+    for name in step_env_inputs(step):
+        keyed[name] = env.get(name)
+    return keyed
+
+
+def expand_inputs(patterns: List[str], base_dir: str) -> List[str]:
+    """
+    Expands input globs into a sorted list of files.
+
+    Args:
+        patterns: Glob patterns, relative to base_dir unless absolute
+        base_dir: Directory the patterns are resolved from
+
+    Returns:
+        list: Relative (or absolute, for absolute patterns) file paths
+    """
+    files = set()
+    for pattern in patterns:
+        absolute = os.path.isabs(pattern)
+        full_pattern = pattern if absolute else os.path.join(base_dir, pattern)
+        for path in glob.glob(full_pattern, recursive=True):
+            if os.path.isfile(path):
+                files.add(path if absolute else os.path.relpath(path, base_dir).replace(os.sep, '/'))
+    return sorted(files)
+
+
+class StepCache:
+    """Stores and replays step results by content hash."""
+
+    def __init__(self, cache_dir: str):
+        """
+        Initializes the cache.
+
+        Args:
+            cache_dir: Directory where cache entries are stored
+        """
+        self.cache_dir = cache_dir
+
+    def compute_key(self, step: Dict[str, Any], commands: List[str], env: Dict[str, str], base_dir: str) -> str:
+        """
+        Computes the cache key of a step.
+
+        Args:
+            step: Step definition with an `inputs:` key
+            commands: Commands the step would run
+            env: Variables the step's result depends on (see keyed_env)
+            base_dir: Directory the input globs are resolved from
+
+        Returns:
+            str: Hex digest identifying the step's inputs
+        """
+        digest = hashlib.sha256()
+        patterns = step_inputs(step)
+        header = {
+            "version": CACHE_VERSION,
+            "commands": [str(command) for command in commands],
+            "inputs": patterns,
+            "working_directory": str(step.get('working_directory') or '.'),
+            "env": sorted(env.items()),
+        }
+        digest.update(json.dumps(header, sort_keys=True).encode('utf-8'))
+
+        for rel_path in expand_inputs(patterns, base_dir):
+            digest.update(b'\0file\0' + rel_path.encode('utf-8') + b'\0')
+            path = rel_path if os.path.isabs(rel_path) else os.path.join(base_dir, rel_path)
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(_READ_BLOCK), b''):
+                    digest.update(block)
+        return digest.hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def load(self, key: str) -> Optional[Dict[str, Any]]:
+        """Returns the stored result for a key, or None on a miss."""
+        path = self._entry_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            if entry.get("version") != CACHE_VERSION:
+                return None
+            return entry.get("result")
+        except Exception as e:
+            logging.warning(f"Ignoring unreadable cache entry {path}: {e}")
+            return None
+
+    def store(self, key: str, result: Dict[str, Any]) -> None:
+        """Stores a successful step result under a key."""
+        path = self._entry_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({"version": CACHE_VERSION, "result": result}, f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logging.warning(f"Could not store cache entry {path}: {e}")
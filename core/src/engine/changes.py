@@ -0,0 +1,125 @@
+"""
+Change detection for incremental pipelines.
+Computes the files changed since a git ref and matches them against the
+`paths:` filters declared by steps (and, in watch mode, their `inputs:`).
+"""
+import os
+import re
+import logging
+import subprocess
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from core.src.engine.cache import step_inputs
+
+
+def step_paths(step: Dict[str, Any]) -> List[str]:
+    """Returns the `paths:` filters declared by a step."""
+    paths = step.get('paths') or []
+    if isinstance(paths, str):
+        return [paths]
+    return [str(pattern) for pattern in paths]
+
+
+def _git(args: List[str], cwd: str) -> List[str]:
+    """Runs a git command and returns its non-empty output lines."""
+    result = subprocess.run(
+        ["git"] + args,
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+        encoding='utf-8',
+        errors='replace',
+        check=True
+    )
+    return [line for line in result.stdout.splitlines() if line.strip()]
+
+
+def git_changed_files(since: str, base_dir: str) -> List[str]:
+    """
+    Lists the files changed since a git ref, including uncommitted and untracked ones.
+
+    Args:
+        since: Git ref (branch, tag, commit) to compare against
+        base_dir: Directory inside the repository; returned paths are relative to it
+
+    Returns:
+        list: Sorted changed file paths, relative to base_dir with '/' separators
+
+    Raises:
+        subprocess.CalledProcessError: If git fails (unknown ref, not a repository...)
+        FileNotFoundError: If git is not installed
+    """
+    top_level = _git(["rev-parse", "--show-toplevel"], base_dir)[0]
+    changed = set(_git(["diff", "--name-only", since, "--"], top_level))
+    changed.update(_git(["ls-files", "--others", "--exclude-standard"], top_level))
+
+    files = set()
+    for path in changed:
+        absolute = os.path.join(top_level, path)
+        files.add(os.path.relpath(absolute, base_dir).replace(os.sep, '/'))
+    return sorted(files)
+
+
+@lru_cache(maxsize=256)
+def _pattern_regex(pattern: str) -> "re.Pattern":
+    """Translates a glob with `**` support into a compiled regular expression."""
+    pattern = pattern.replace('\\', '/')
+    if pattern.startswith('./'):
+        pattern = pattern[2:]
+    if pattern.endswith('/'):
+        pattern += '**'
+    regex = ''
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            regex += '(?:.*/)?'
+            i += 3
+        elif pattern.startswith('**', i):
+            regex += '.*'
+            i += 2
+        elif pattern[i] == '*':
+            regex += '[^/]*'
+            i += 1
+        elif pattern[i] == '?':
+            regex += '[^/]'
+            i += 1
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+    return re.compile(regex + r'\Z')
+
+
+def path_matches(path: str, patterns: List[str]) -> bool:
+    """Returns True if a relative path matches any of the glob patterns."""
+    return any(_pattern_regex(pattern).match(path) for pattern in patterns)
+
+
+def step_is_affected(step: Dict[str, Any], changed_files: Optional[List[str]],
+                     include_inputs: bool = False) -> bool:
+    """
+    Tells whether a step has to run for a set of changed files.
+
+    Steps without `paths:` (nor `inputs:`, with `include_inputs`) always
+    run, as do all steps when no change set is known.
+    """
+    patterns = step_paths(step) + (step_inputs(step) if include_inputs else [])
+    if changed_files is None or not patterns:
+        return True
+    return any(path_matches(path, patterns) for path in changed_files)
+
+
+def detect_changes(since: Optional[str], base_dir: str) -> Optional[List[str]]:
+    """
+    Computes the change set for a run, or None to run every step.
+
+    Git errors are logged and disable filtering instead of failing the run.
+    """
+    if not since:
+        return None
+    try:
+        return git_changed_files(since, base_dir)
+    except (subprocess.CalledProcessError, OSError, IndexError) as e:
+        stderr = getattr(e, 'stderr', '') or ''
+        logging.warning(f"Could not compute changes since {since}, running all steps: {stderr.strip() or e}")
+        return None
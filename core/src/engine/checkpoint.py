@@ -0,0 +1,132 @@
+"""
+Run checkpoints.
+While a pipeline runs, every finished step result is appended to a
+checkpoint file (`.localforge/runs/<run_id>.jsonl` in the pipeline
+directory), after a header holding the pipeline file and the run's
+environment variables. `--resume <run_id>` reloads it: steps that completed
+are not run again, the failed and unfinished ones run under the same run ID,
+so they find the artifacts and step logs of the first attempt.
+
+The file is append-only JSON lines, so recording a step costs one write
+however long the run is, and a run killed mid-way leaves a readable file.
+"""
+import os
+import json
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+from core.src.engine.artifacts import KEPT_RUNS
+
+# Checkpoints, relative to the pipeline directory
+CHECKPOINT_DIR = os.path.join(".localforge", "runs")
+# Checkpoints of previous runs kept next to the current one: as many as their artifact stores
+KEPT_CHECKPOINTS = KEPT_RUNS
+# Statuses of steps a resumed run doesn't execute again
+COMPLETED_STATUSES = ("success", "skipped")
+
+
+def pipeline_digest(pipeline_file: str) -> Optional[str]:
+    """SHA-256 of a pipeline file, to notice it changed between a run and its resumption."""
+    try:
+        with open(pipeline_file, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+class RunCheckpoint:
+    """Checkpoint file of one pipeline run."""
+
+    def __init__(self, root: str, run_id: str):
+        """
+        Initializes the checkpoint of a run.
+
+        Args:
+            root: Directory holding the checkpoints of all runs
+            run_id: ID of the run
+        """
+        self.root = root
+        self.run_id = run_id
+        self.path = os.path.join(root, f"{run_id}.jsonl")
+        self._lock = threading.Lock()
+        self._file = None
+
+    def start(self, pipeline_file: str, env_vars: Optional[Dict[str, str]], resumed: bool = False) -> None:
+        """
+        Opens the checkpoint for appending and records the run header.
+
+        Args:
+            pipeline_file: Pipeline being run
+            env_vars: Environment variables given to the run
+            resumed: Whether this is a resumption of the run
+        """
+        os.makedirs(self.root, exist_ok=True)
+        # The header holds the run's environment: keep it private to the user
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        self._file = os.fdopen(fd, 'a')
+        self._write({"type": "run", "run_id": self.run_id, "pipeline_file": os.path.abspath(pipeline_file),
+                     "pipeline_digest": pipeline_digest(pipeline_file), "env": dict(env_vars or {}),
+                     "resumed": resumed})
+
+    def record(self, result: Dict[str, Any]) -> None:
+        """Appends a finished step result."""
+        if self._file is not None:
+            self._write({"type": "step", "result": result})
+
+    def _write(self, entry: Dict[str, Any]) -> None:
+        line = json.dumps(entry, default=str)
+        with self._lock:
+            try:
+                self._file.write(line + "\n")
+                self._file.flush()
+            except (OSError, ValueError) as e:
+                logging.warning(f"Could not write the checkpoint of run {self.run_id}: {e}")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def load(self) -> Dict[str, Any]:
+        """
+        Reads the checkpoint.
+
+        Returns:
+            dict: `pipeline_file`, `pipeline_digest` and `env` of the first run header,
+                  and `results`: the last recorded result of every step, by name
+
+        Raises:
+            ValueError: If there is no checkpoint for the run
+        """
+        if not os.path.isfile(self.path):
+            raise ValueError(f"No checkpoint for run {self.run_id} in {self.root}")
+        state: Dict[str, Any] = {"results": {}}
+        with open(self.path, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # The last line of a killed run may be cut short
+                    continue
+                if entry.get("type") == "run" and "pipeline_file" not in state:
+                    state.update(pipeline_file=entry.get("pipeline_file"),
+                                 pipeline_digest=entry.get("pipeline_digest"), env=entry.get("env") or {})
+                elif entry.get("type") == "step":
+                    state["results"][entry["result"]["step"]] = entry["result"]
+        return state
+
+    def prune(self, keep: int = KEPT_CHECKPOINTS) -> None:
+        """Removes the checkpoints of older runs, keeping the `keep` most recent ones besides this one."""
+        try:
+            runs = sorted(entry for entry in os.listdir(self.root)
+                          if entry.endswith(".jsonl") and os.path.join(self.root, entry) != self.path)
+        except FileNotFoundError:
+            return
+        for entry in runs[:max(0, len(runs) - keep)]:
+            try:
+                os.unlink(os.path.join(self.root, entry))
+            except OSError:
+                pass
@@ -0,0 +1,377 @@
+"""
+Distributed execution of pipeline steps.
+The coordinator side (AgentPool) listens on a TCP or Unix socket for
+`localforge-agent` workers and hands them steps to run. Agents stream the
+progress events of each step back, followed by its result, as
+newline-delimited JSON messages.
+"""
+import os
+import hmac
+import json
+import ipaddress
+import time
+import uuid
+import socket
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from core.src.engine.limits import parse_duration
+
+PROTOCOL_VERSION = 1
+DEFAULT_AGENT_PORT = 7700
+# Largest message accepted on the wire (one output chunk plus envelope is far below this)
+MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+# Seconds between two checks of a running job's agent connection and of the stop flag
+JOB_POLL_INTERVAL = 0.5
+# Seconds an agent gets to report a step it was asked to stop, or to enforce its `timeout:`
+AGENT_STOP_TIMEOUT = 15.0
+# TCP keepalive of agent connections: idle seconds, probe interval, failed probes (a dead host drops in ~1 min)
+AGENT_KEEPALIVE = (30, 10, 3)
+
+
+def parse_address(address: str) -> Tuple[int, Any]:
+    """
+    Parses an agent address.
+
+    Args:
+        address: `unix:///path/to/socket`, `tcp://host:port` or `host:port`
+
+    Returns:
+        tuple: (socket family, address for bind/connect)
+    """
+    if address.startswith('unix://'):
+        return socket.AF_UNIX, address[len('unix://'):]
+    if address.startswith('tcp://'):
+        address = address[len('tcp://'):]
+    host, _, port = address.rpartition(':')
+    return socket.AF_INET, (host or '127.0.0.1', int(port or DEFAULT_AGENT_PORT))
+
+
+def is_loopback_address(family: int, address: Any) -> bool:
+    """Tells whether a parsed agent address (see parse_address) is only reachable from this machine."""
+    if family == socket.AF_UNIX:
+        return True
+    host = address[0]
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        # A host name: loopback only if every address it resolves to is
+        try:
+            resolved = socket.getaddrinfo(host, None)
+        except OSError:
+            return False
+        return bool(resolved) and all(ipaddress.ip_address(info[4][0]).is_loopback for info in resolved)
+
+
+def step_agent_labels(step: Dict[str, Any]) -> List[str]:
+    """Returns the agent labels a step requires (`runs_on:`)."""
+    labels = step.get('runs_on') or []
+    if isinstance(labels, str):
+        return [labels]
+    return [str(label) for label in labels]
+
+
+class MessageChannel:
+    """Newline-delimited JSON messages over a stream socket."""
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self._reader = sock.makefile('rb')
+        self._send_lock = threading.Lock()
+
+    def send(self, message: Dict[str, Any]) -> None:
+        """Sends a message; safe to call from several threads."""
+        data = json.dumps(message).encode('utf-8') + b'\n'
+        with self._send_lock:
+            self.sock.sendall(data)
+
+    def receive(self) -> Optional[Dict[str, Any]]:
+        """Returns the next message, or None when the connection is closed."""
+        try:
+            line = self._reader.readline(MAX_MESSAGE_SIZE)
+        except OSError:
+            return None
+        if not line:
+            return None
+        return json.loads(line.decode('utf-8'))
+
+    def close(self) -> None:
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._reader.close()
+        self.sock.close()
+
+
+class AgentPool:
+    """Coordinator side: accepts agents and dispatches steps to them by label."""
+
+    def __init__(self, address: str, token: Optional[str] = None, agent_timeout: float = 60.0):
+        """
+        Initializes the pool.
+
+        Args:
+            address: Address to listen on (see parse_address)
+            token: Shared secret agents must present; required unless the address is loopback or a Unix socket,
+                since agents receive the step commands and environment (secrets included)
+            agent_timeout: Seconds to wait for a matching agent before failing a step
+        """
+        self.address = address
+        self.token = token
+        self.agent_timeout = agent_timeout
+        self._server: Optional[socket.socket] = None
+        self._agents: Dict[str, Dict[str, Any]] = {}
+        self._condition = threading.Condition()
+        self._closed = False
+
+    def start(self) -> None:
+        """
+        Starts listening for agents in a background thread.
+
+        Raises:
+            ValueError: If the address is reachable from other machines and no token is set
+        """
+        family, bind_address = parse_address(self.address)
+        if not self.token and not is_loopback_address(family, bind_address):
+            raise ValueError(f"Refusing to accept agents on {self.address} without a token: anyone reaching it "
+                             f"would receive the step commands and environment (set --agent-token or "
+                             f"$LOCALFORGE_AGENT_TOKEN, or listen on a loopback address or Unix socket)")
+        server = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_UNIX:
+            if os.path.exists(bind_address):
+                os.unlink(bind_address)
+        else:
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(bind_address)
+        server.listen()
+        self._server = server
+        logging.info(f"Waiting for agents on {self.address}")
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def close(self) -> None:
+        """Stops listening and disconnects every agent."""
+        with self._condition:
+            self._closed = True
+            agents = list(self._agents.values())
+            self._condition.notify_all()
+        if self._server:
+            self._server.close()
+            family, bind_address = parse_address(self.address)
+            if family == socket.AF_UNIX and os.path.exists(bind_address):
+                os.unlink(bind_address)
+        for agent in agents:
+            agent["channel"].close()
+
+    def agents(self) -> List[Dict[str, Any]]:
+        """Returns a summary of the connected agents."""
+        with self._condition:
+            return [{"name": agent["name"], "labels": agent["labels"], "slots": agent["slots"], "busy": agent["busy"]}
+                    for agent in self._agents.values()]
+
+    def _accept_loop(self) -> None:
+        while not self._closed:
+            try:
+                sock, _ = self._server.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._serve_agent, args=(sock,), daemon=True).start()
+
+    @staticmethod
+    def _enable_keepalive(sock: socket.socket) -> None:
+        """Lets the kernel notice agents whose host died without closing the connection."""
+        if sock.family == socket.AF_UNIX:
+            return
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        idle, interval, count = AGENT_KEEPALIVE
+        for option, value in (("TCP_KEEPIDLE", idle), ("TCP_KEEPINTVL", interval), ("TCP_KEEPCNT", count)):
+            if hasattr(socket, option):
+                sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+
+    def _serve_agent(self, sock: socket.socket) -> None:
+        """Registers an agent and routes its messages to the jobs it runs."""
+        self._enable_keepalive(sock)
+        channel = MessageChannel(sock)
+        try:
+            hello = channel.receive()
+        except ValueError:
+            hello = None
+        if not hello or hello.get("type") != "hello" or hello.get("version") != PROTOCOL_VERSION:
+            logging.warning("Rejecting agent: invalid handshake")
+            channel.close()
+            return
+        if self.token and not hmac.compare_digest(str(hello.get("token") or "").encode('utf-8'),
+                                                  self.token.encode('utf-8')):
+            logging.warning(f"Rejecting agent {hello.get('name')}: invalid token")
+            channel.send({"type": "rejected", "reason": "invalid token"})
+            channel.close()
+            return
+
+        agent_id = uuid.uuid4().hex
+        agent = {
+            "id": agent_id,
+            "name": hello.get("name") or agent_id[:8],
+            "labels": [str(label) for label in hello.get("labels") or []],
+            "slots": max(1, int(hello.get("slots") or 1)),
+            "busy": 0,
+            "channel": channel,
+            "jobs": {}
+        }
+        with self._condition:
+            self._agents[agent_id] = agent
+            self._condition.notify_all()
+        channel.send({"type": "welcome"})
+        logging.info(f"Agent {agent['name']} connected (labels: {agent['labels']}, slots: {agent['slots']})")
+
+        try:
+            while True:
+                message = channel.receive()
+                if message is None:
+                    break
+                job = agent["jobs"].get(message.get("job_id"))
+                if not job:
+                    continue
+                if message.get("type") == "event":
+                    event = dict(message.get("event") or {})
+                    event["agent"] = agent["name"]
+                    job["emit"](event)
+                elif message.get("type") == "result":
+                    job["result"] = message.get("result")
+                    job["done"].set()
+        except (OSError, ValueError) as e:
+            logging.warning(f"Connection to agent {agent['name']} failed: {e}")
+        finally:
+            with self._condition:
+                self._agents.pop(agent_id, None)
+                self._condition.notify_all()
+            for job in list(agent["jobs"].values()):
+                if not job["done"].is_set():
+                    job["result"] = None
+                    job["done"].set()
+            channel.close()
+            logging.info(f"Agent {agent['name']} disconnected")
+
+    def _acquire_agent(self, labels: List[str]) -> Optional[Dict[str, Any]]:
+        """Waits for the least busy agent with the labels and a free slot."""
+        def eligible():
+            return [agent for agent in self._agents.values()
+                    if set(labels) <= set(agent["labels"]) and agent["busy"] < agent["slots"]]
+
+        with self._condition:
+            self._condition.wait_for(lambda: self._closed or eligible(), timeout=self.agent_timeout)
+            candidates = [] if self._closed else eligible()
+            if not candidates:
+                return None
+            agent = min(candidates, key=lambda candidate: candidate["busy"] / candidate["slots"])
+            agent["busy"] += 1
+            return agent
+
+    def _release_agent(self, agent: Dict[str, Any]) -> None:
+        with self._condition:
+            agent["busy"] -= 1
+            self._condition.notify_all()
+
+    def _connected(self, agent: Dict[str, Any]) -> bool:
+        with self._condition:
+            return not self._closed and agent["id"] in self._agents
+
+    def _wait_for_result(self, agent: Dict[str, Any], job: Dict[str, Any], step: Dict[str, Any],
+                         should_stop: Optional[Callable[[], bool]]) -> Optional[Tuple[str, str]]:
+        """
+        Waits for the result of a job while its agent is connected.
+
+        Returns:
+            tuple: (status, error) if the job was abandoned, None once its result arrived
+        """
+        deadline = None
+        if step.get('timeout') is not None:
+            # The agent enforces the timeout; a hung one is given up on a little later
+            deadline = time.monotonic() + parse_duration(step['timeout']) + AGENT_STOP_TIMEOUT
+        stop_deadline = None
+        while not job["done"].wait(JOB_POLL_INTERVAL):
+            if not self._connected(agent):
+                break
+            now = time.monotonic()
+            if stop_deadline is None and should_stop and should_stop():
+                stop_deadline = now + AGENT_STOP_TIMEOUT
+            if stop_deadline is not None and now > stop_deadline:
+                return "cancelled", f"Agent {agent['name']} did not stop the step within {AGENT_STOP_TIMEOUT:.0f}s"
+            if deadline is not None and now > deadline:
+                return "timeout", f"Agent {agent['name']} did not report the step within its timeout"
+        if job["result"] is None:
+            return "error", f"Agent {agent['name']} disconnected while running the step"
+        return None
+
+    def run_step(self, step: Dict[str, Any], env_vars: Optional[Dict[str, str]], cwd: Optional[str],
+                 emit: Callable[[Dict[str, Any]], None], is_cleanup: bool = False,
+                 should_stop: Optional[Callable[[], bool]] = None) -> Dict[str, Any]:
+        """
+        Runs a step on an agent, forwarding its progress events.
+
+        Args:
+            step: Step definition
+            env_vars: Pipeline-level environment variables
+            cwd: Working directory suggested to the agent
+            emit: Function receiving each progress event
+            is_cleanup: Whether the step is a cleanup step
+            should_stop: Tells whether the step is being stopped; the agent is then
+                         given AGENT_STOP_TIMEOUT seconds to report it
+
+        Returns:
+            dict: Step result, with the name of the agent that ran it
+        """
+        step_name = step['step']
+        labels = step_agent_labels(step)
+        agent = self._acquire_agent(labels)
+        if agent is None:
+            error = f"No agent with labels {labels} available after {self.agent_timeout:.0f}s"
+            logging.error(f"Step {step_name}: {error}")
+            emit({"event": "step_failure", "step": step_name, "error": error})
+            return {"step": step_name, "status": "error", "duration": "0.00s", "output": None, "error": error}
+
+        job_id = uuid.uuid4().hex
+        job = {"emit": emit, "done": threading.Event(), "result": None}
+        agent["jobs"][job_id] = job
+        abandoned = ("error", f"Could not send the step to agent {agent['name']}")
+        try:
+            logging.info(f"Dispatching step {step_name} to agent {agent['name']}")
+            agent["channel"].send({
+                "type": "run",
+                "job_id": job_id,
+                "step": step,
+                "env_vars": env_vars or {},
+                "cwd": cwd,
+                "is_cleanup": is_cleanup
+            })
+            abandoned = self._wait_for_result(agent, job, step, should_stop)
+        except OSError as e:
+            logging.error(f"Could not send step {step_name} to agent {agent['name']}: {e}")
+        finally:
+            agent["jobs"].pop(job_id, None)
+            self._release_agent(agent)
+
+        if abandoned:
+            status, error = abandoned
+            logging.error(f"Step {step_name}: {error}")
+            if status == "cancelled":
+                emit({"event": "step_cancelled", "step": step_name, "reason": error, "agent": agent["name"]})
+            else:
+                emit({"event": "step_failure", "step": step_name, "error": error, "agent": agent["name"]})
+            return {"step": step_name, "status": status, "duration": "0.00s", "output": None,
+                    "error": error, "agent": agent["name"]}
+        result = job["result"]
+        result["agent"] = agent["name"]
+        return result
+
+    def stop_all(self) -> None:
+        """Asks every agent to stop the steps it is running."""
+        with self._condition:
+            agents = list(self._agents.values())
+        for agent in agents:
+            try:
+                agent["channel"].send({"type": "stop"})
+            except OSError:
+                pass
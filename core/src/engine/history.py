@@ -0,0 +1,113 @@
+"""
+Run history built from recorded runs (see run_store.py) or, for runs
+recorded before the run store existed, from stored pipeline reports.
+Used to compute flake scores (how often a step only passed on retry, or
+failed and passed with the very same inputs) and the typical duration of
+each step, which the scheduler uses to start the longest paths first.
+"""
+import os
+import glob
+import json
+import logging
+import statistics
+from typing import Any, Dict, List, Optional
+
+# Number of recent reports taken into account
+HISTORY_SIZE = 50
+# Step statuses that say something about flakiness
+_DECISIVE_STATUSES = ("success", "error", "timeout", "resource_exceeded")
+
+
+def load_reports(reports_dir: str, pipeline_file: str, limit: int = HISTORY_SIZE) -> List[Dict[str, Any]]:
+    """
+    Loads the most recent reports of a pipeline.
+
+    Args:
+        reports_dir: Directory holding the pipeline_report_*.json files
+        pipeline_file: Pipeline the reports must belong to
+        limit: Maximum number of reports returned
+
+    Returns:
+        list: Reports, oldest first
+    """
+    name = os.path.basename(pipeline_file)
+    reports = []
+    for path in sorted(glob.glob(os.path.join(reports_dir, "pipeline_report_*.json")), reverse=True):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                report = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.debug(f"Ignoring unreadable report {path}: {e}")
+            continue
+        if os.path.basename(str(report.get("pipeline_file", ""))) != name:
+            continue
+        reports.append(report)
+        if len(reports) >= limit:
+            break
+    reports.reverse()
+    return reports
+
+
+def flake_scores(runs: List[List[Dict[str, Any]]]) -> Dict[str, float]:
+    """
+    Computes the flake score of every step.
+
+    A run of a step counts as flaky when it passed after a failed attempt, or
+    when it failed while another run with the same inputs (`cache_key`) passed.
+
+    Args:
+        runs: Step results of each run
+
+    Returns:
+        dict: Step name -> fraction of its runs that were flaky, for steps with flaky runs
+    """
+    passed_keys = {(result["step"], result["cache_key"])
+                   for results in runs for result in results
+                   if result.get("status") == "success" and result.get("cache_key")}
+
+    totals: Dict[str, int] = {}
+    flaky: Dict[str, int] = {}
+    for results in runs:
+        for result in results:
+            if result.get("status") not in _DECISIVE_STATUSES or result.get("cache_hit") or result.get("resumed"):
+                continue
+            name = result["step"]
+            totals[name] = totals.get(name, 0) + 1
+            failed_with_passing_inputs = (result["status"] != "success" and result.get("cache_key")
+                                          and (name, result["cache_key"]) in passed_keys)
+            if result.get("flaky") or failed_with_passing_inputs:
+                flaky[name] = flaky.get(name, 0) + 1
+    return {name: round(count / totals[name], 3) for name, count in flaky.items()}
+
+
+def _seconds(duration: Any) -> Optional[float]:
+    """Parses a report duration such as "12.34s"."""
+    try:
+        return float(str(duration).rstrip('s'))
+    except ValueError:
+        return None
+
+
+def step_durations(runs: List[List[Dict[str, Any]]], samples: int = 10) -> Dict[str, float]:
+    """
+    Estimates how long every step takes.
+
+    Only runs that actually executed the step count: cache hits, skipped and
+    cancelled steps, and steps carried over by a resumed run, say nothing about its duration.
+
+    Args:
+        runs: Step results of each run, oldest first
+        samples: Most recent durations considered per step
+
+    Returns:
+        dict: Step name -> median of its recent durations, in seconds
+    """
+    history: Dict[str, List[float]] = {}
+    for results in runs:
+        for result in results:
+            if result.get("status") not in _DECISIVE_STATUSES or result.get("cache_hit") or result.get("resumed"):
+                continue
+            seconds = _seconds(result.get("duration"))
+            if seconds is not None:
+                history.setdefault(result["step"], []).append(seconds)
+    return {name: statistics.median(durations[-samples:]) for name, durations in history.items()}
@@ -0,0 +1,184 @@
+"""
+Per-step execution limits.
+Steps can declare `timeout:` (wall clock, whole step), `max_memory:` (resident
+memory of the command's process group) and `max_cpu_time:` (CPU seconds per
+process). CPU time is enforced by the kernel through RLIMIT_CPU, set on the
+command with prlimit() right after it started (not in a preexec_fn, which can
+deadlock the child of a threaded runner); the wall clock and memory limits by
+a watchdog thread that terminates the whole process group when they are
+exceeded.
+"""
+import os
+import re
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from core.src.engine.process import terminate_process_group
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Seconds between two watchdog checks
+WATCHDOG_INTERVAL = 0.25
+# Extra CPU seconds between SIGXCPU (soft limit) and SIGKILL (hard limit)
+CPU_LIMIT_GRACE = 5
+
+_DURATION_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600}
+_SIZE_UNITS = {"": 1, "b": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+
+
+def parse_duration(value: Any) -> float:
+    """
+    Parses a duration such as 90, "90s", "5m" or "1.5h" into seconds.
+
+    Raises:
+        ValueError: If the value is not a positive duration
+    """
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([smh]?)\s*', str(value).lower())
+    if not match or float(match.group(1)) <= 0:
+        raise ValueError(f"invalid duration: {value!r} (use e.g. 30, 30s, 5m, 1h)")
+    return float(match.group(1)) * _DURATION_UNITS[match.group(2)]
+
+
+def parse_size(value: Any) -> int:
+    """
+    Parses a memory size such as 536870912, "512M", "512MB" or "2G" into bytes.
+
+    Raises:
+        ValueError: If the value is not a positive size
+    """
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([bkmgt]?)(?:i?b)?\s*', str(value).lower())
+    if not match or float(match.group(1)) <= 0:
+        raise ValueError(f"invalid memory size: {value!r} (use e.g. 512M, 2G)")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2)])
+
+
+def step_limits(step: Dict[str, Any]) -> Dict[str, float]:
+    """
+    Returns the limits declared by a step.
+
+    Returns:
+        dict: Any of `timeout` (seconds), `max_memory` (bytes) and `max_cpu_time` (seconds)
+
+    Raises:
+        ValueError: If a limit has an invalid value
+    """
+    limits = {}
+    if step.get('timeout') is not None:
+        limits['timeout'] = parse_duration(step['timeout'])
+    if step.get('max_memory') is not None:
+        limits['max_memory'] = parse_size(step['max_memory'])
+    if step.get('max_cpu_time') is not None:
+        limits['max_cpu_time'] = parse_duration(step['max_cpu_time'])
+    return limits
+
+
+def cpu_limit_supported() -> bool:
+    """Tells whether max_cpu_time can be enforced on this platform (prlimit, Linux)."""
+    return resource is not None and hasattr(resource, 'prlimit')
+
+
+def apply_cpu_limit(pid: int, limits: Dict[str, float]) -> None:
+    """
+    Sets the CPU time limit, if any, on a command that just started.
+
+    The processes it spawns from then on inherit the limit.
+    """
+    if 'max_cpu_time' not in limits or not cpu_limit_supported():
+        return
+    soft = int(max(1, limits['max_cpu_time']))
+    try:
+        resource.prlimit(pid, resource.RLIMIT_CPU, (soft, soft + CPU_LIMIT_GRACE))
+    except ProcessLookupError:
+        # The command already exited
+        pass
+    except OSError as e:
+        logging.warning(f"Could not set the CPU time limit of process {pid}: {e}")
+
+
+def _rss_by_process_group() -> Dict[int, int]:
+    """Returns the resident memory, in bytes, of every process group (Linux /proc)."""
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    totals: Dict[int, int] = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'rb') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # Fields after the command name, which may contain spaces: state, ppid, pgrp, ... rss
+        fields = stat[stat.rfind(b')') + 2:].split()
+        pgid = int(fields[2])
+        totals[pgid] = totals.get(pgid, 0) + int(fields[21]) * page_size
+    return totals
+
+
+def memory_watch_supported() -> bool:
+    """Tells whether max_memory can be enforced on this platform."""
+    return os.path.isdir('/proc/self') and hasattr(os, 'sysconf')
+
+
+class LimitWatchdog:
+    """Single background thread enforcing wall-clock and memory limits of running commands."""
+
+    def __init__(self, interval: float = WATCHDOG_INTERVAL):
+        self.interval = interval
+        self._watches: Dict[int, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def watch(self, pid: int, deadline: Optional[float], max_memory: Optional[int],
+              on_exceeded: Callable[[str, str], None]) -> None:
+        """
+        Starts watching the process group of a command.
+
+        Args:
+            pid: PID of the command, leader of its process group
+            deadline: time.time() after which the group is terminated, if any
+            max_memory: Resident memory of the group, in bytes, above which it is terminated
+            on_exceeded: Called once with (status, message) before the group is terminated
+        """
+        if deadline is None and max_memory is None:
+            return
+        with self._lock:
+            self._watches[pid] = {"deadline": deadline, "max_memory": max_memory, "on_exceeded": on_exceeded}
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="limit-watchdog", daemon=True)
+                self._thread.start()
+
+    def unwatch(self, pid: int) -> None:
+        with self._lock:
+            self._watches.pop(pid, None)
+
+    def _loop(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                watches = list(self._watches.items())
+            now = time.time()
+            rss_by_group = {}
+            if any(watch["max_memory"] is not None for _, watch in watches):
+                try:
+                    rss_by_group = _rss_by_process_group()
+                except (OSError, ValueError, IndexError) as e:
+                    logging.debug(f"Could not sample process memory: {e}")
+
+            for pid, watch in watches:
+                exceeded = None
+                rss = rss_by_group.get(pid, 0)
+                if watch["deadline"] is not None and now >= watch["deadline"]:
+                    exceeded = ("timeout", "Step exceeded its timeout")
+                elif watch["max_memory"] is not None and rss > watch["max_memory"]:
+                    exceeded = ("resource_exceeded",
+                                f"Step exceeded its memory limit ({rss // 1024 ** 2} MiB > "
+                                f"{watch['max_memory'] // 1024 ** 2} MiB)")
+                if exceeded:
+                    self.unwatch(pid)
+                    watch["on_exceeded"](*exceeded)
+                    terminate_process_group(pid)
@@ -0,0 +1,69 @@
+"""
+Matrix expansion of pipeline steps.
+A step with a `matrix:` key is expanded into one job per combination of
+its parameters; each job receives its parameters as MATRIX_* env vars.
+"""
+import re
+import itertools
+from typing import Any, Dict, List
+
+from core.src.engine.artifacts import step_artifacts
+
+
+def matrix_env_name(key: str) -> str:
+    """Returns the environment variable holding a matrix parameter."""
+    return "MATRIX_" + re.sub(r'[^A-Za-z0-9]', '_', str(key)).upper()
+
+
+def _matrix_combinations(matrix: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Lists the parameter combinations of a matrix, minus its `exclude:` entries."""
+    matrix = dict(matrix)
+    excludes = matrix.pop('exclude', None) or []
+    if not matrix:
+        raise ValueError("matrix must define at least one parameter")
+
+    keys = list(matrix)
+    values = [value if isinstance(value, list) else [value] for value in matrix.values()]
+    combinations = [dict(zip(keys, combo)) for combo in itertools.product(*values)]
+
+    def excluded(combo):
+        return any(all(str(combo.get(key)) == str(value) for key, value in rule.items()) for rule in excludes)
+
+    return [combo for combo in combinations if not excluded(combo)]
+
+
+def expand_matrix(step: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Expands a step into its matrix jobs.
+
+    Args:
+        step: Step definition, with or without a `matrix:` key
+
+    Returns:
+        list: The step itself if it has no matrix, otherwise one step per
+              combination, named `name (key=value, ...)`, with the parameters
+              added to its `env:` and recorded under `matrix_values`; its
+              artifacts are renamed after the job (`dist (python=3.11)`)
+
+    Raises:
+        ValueError: If the matrix is empty or not a mapping, or the artifacts are malformed
+    """
+    matrix = step.get('matrix')
+    if not matrix:
+        return [step]
+    if not isinstance(matrix, dict):
+        raise ValueError(f"matrix of step {step.get('step')} must be a mapping of parameter lists")
+
+    jobs = []
+    for combo in _matrix_combinations(matrix):
+        job = {key: value for key, value in step.items() if key != 'matrix'}
+        label = ', '.join(f"{key}={value}" for key, value in combo.items())
+        job['step'] = f"{step['step']} ({label})"
+        job['env'] = dict(step.get('env') or {})
+        job['env'].update({matrix_env_name(key): str(value) for key, value in combo.items()})
+        job['matrix_of'] = step['step']
+        job['matrix_values'] = combo
+        if step.get('artifacts'):
+            job['artifacts'] = {f"{name} ({label})": path for name, path in step_artifacts(step).items()}
+        jobs.append(job)
+    return jobs
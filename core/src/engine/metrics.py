@@ -0,0 +1,238 @@
+"""
+Resource usage of pipeline steps.
+A sampler thread reads /proc for the process group of every running
+command and accumulates, per step, user/system CPU time, peak resident
+memory of the whole process tree, bytes read from and written to storage
+and context switches. When the runner reaps a command with wait4(), its
+exact rusage replaces the sampled CPU, I/O and context switch figures.
+"""
+import os
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional
+
+# Seconds between two samples
+SAMPLE_INTERVAL = 0.5
+# Seconds between two live `step_metrics` events of a step
+REPORT_INTERVAL = 2.0
+
+
+def metrics_supported() -> bool:
+    """Tells whether step usage can be sampled on this platform (Linux /proc)."""
+    return os.path.isdir('/proc/self') and hasattr(os, 'sysconf')
+
+
+def _read_int_fields(path: str, names) -> Dict[str, int]:
+    """Reads `name: value` lines of a /proc file."""
+    values = {}
+    try:
+        with open(path, 'r') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in names:
+                    values[key] = int(value.split()[0])
+    except (OSError, ValueError, IndexError):
+        pass
+    return values
+
+
+def _scan_processes(groups) -> Dict[int, Dict[int, Dict[str, Any]]]:
+    """
+    Reads the counters of every process in the given process groups.
+
+    Returns:
+        dict: Process group -> PID -> counters
+    """
+    ticks = os.sysconf('SC_CLK_TCK')
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    found: Dict[int, Dict[int, Dict[str, Any]]] = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'rb') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # Fields after the command name, which may contain spaces: state, ppid, pgrp, ...
+        fields = stat[stat.rfind(b')') + 2:].split()
+        pgid = int(fields[2])
+        if pgid not in groups:
+            continue
+        io = _read_int_fields(f'/proc/{entry}/io', ('read_bytes', 'write_bytes'))
+        status = _read_int_fields(f'/proc/{entry}/status', ('voluntary_ctxt_switches', 'nonvoluntary_ctxt_switches'))
+        found.setdefault(pgid, {})[int(entry)] = {
+            "ppid": int(fields[1]),
+            # Own CPU time, and the CPU time of the children it reaped
+            "cpu_user": int(fields[11]) / ticks + int(fields[13]) / ticks,
+            "cpu_system": int(fields[12]) / ticks + int(fields[14]) / ticks,
+            "rss": int(fields[21]) * page_size,
+            # Includes the children it reaped as well
+            "read_bytes": io.get('read_bytes', 0),
+            "write_bytes": io.get('write_bytes', 0),
+            "voluntary_ctx_switches": status.get('voluntary_ctxt_switches', 0),
+            "involuntary_ctx_switches": status.get('nonvoluntary_ctxt_switches', 0)
+        }
+    return found
+
+
+class StepUsage:
+    """Resource usage of one step, over all of its commands."""
+
+    _CUMULATIVE = ("cpu_user", "cpu_system", "read_bytes", "write_bytes")
+    _OWN = ("voluntary_ctx_switches", "involuntary_ctx_switches")
+
+    def __init__(self):
+        self.peak_rss = 0
+        self._totals = {key: 0 for key in self._CUMULATIVE + self._OWN}
+        # Per running command: last counters of each process seen in its group
+        self._groups: Dict[int, Dict[int, Dict[str, Any]]] = {}
+        self._lost: Dict[int, Dict[str, float]] = {}
+        self._last_report = time.time()
+        self._lock = threading.Lock()
+
+    def sample(self, pgid: int, processes: Dict[int, Dict[str, Any]]) -> None:
+        """Records a sample of the processes of a command's group."""
+        with self._lock:
+            seen = self._groups.setdefault(pgid, {})
+            lost = self._lost.setdefault(pgid, {key: 0 for key in self._totals})
+            for pid, counters in list(seen.items()):
+                if pid in processes:
+                    continue
+                # Exited: a parent still in the group reaped it and accounts for its CPU time
+                # and I/O; an orphan's last counters would be lost otherwise
+                keys = self._OWN if counters["ppid"] in processes else self._totals
+                for key in keys:
+                    lost[key] += counters[key]
+                del seen[pid]
+            seen.update(processes)
+            self.peak_rss = max(self.peak_rss, sum(counters["rss"] for counters in processes.values()))
+
+    def finish_command(self, pgid: int, rusage=None) -> None:
+        """
+        Adds the usage of a finished command to the step.
+
+        Args:
+            pgid: Process group of the command
+            rusage: resource.struct_rusage from wait4(), exact for the command and the
+                    children it waited for; the sampled counters are used without it
+        """
+        with self._lock:
+            sampled = self._group_usage(pgid)
+            self._groups.pop(pgid, None)
+            self._lost.pop(pgid, None)
+            if rusage is not None:
+                sampled.update({
+                    "cpu_user": rusage.ru_utime,
+                    "cpu_system": rusage.ru_stime,
+                    # Blocks of 512 bytes, the unit of /proc/<pid>/io read_bytes / write_bytes
+                    "read_bytes": rusage.ru_inblock * 512,
+                    "write_bytes": rusage.ru_oublock * 512,
+                    "voluntary_ctx_switches": rusage.ru_nvcsw,
+                    "involuntary_ctx_switches": rusage.ru_nivcsw
+                })
+                # ru_maxrss is in KiB on Linux: the largest single process of the tree
+                self.peak_rss = max(self.peak_rss, rusage.ru_maxrss * 1024)
+            for key in self._totals:
+                self._totals[key] += sampled[key]
+
+    def _group_usage(self, pgid: int) -> Dict[str, float]:
+        usage = dict(self._lost.get(pgid) or {key: 0 for key in self._totals})
+        for counters in self._groups.get(pgid, {}).values():
+            for key in self._totals:
+                usage[key] += counters[key]
+        return usage
+
+    def summary(self, duration: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Returns the usage so far.
+
+        Args:
+            duration: Wall-clock seconds of the step, to compute its CPU utilization
+
+        Returns:
+            dict: `cpu_user`, `cpu_system` (seconds), `peak_rss`, `read_bytes`, `write_bytes`
+                  (bytes), `voluntary_ctx_switches`, `involuntary_ctx_switches` and, with a
+                  duration, `cpu_utilization` (CPU seconds per second: 1.0 is one busy core)
+        """
+        with self._lock:
+            usage = dict(self._totals)
+            for pgid in self._groups:
+                for key, value in self._group_usage(pgid).items():
+                    usage[key] += value
+            usage["peak_rss"] = self.peak_rss
+        usage["cpu_user"] = round(usage["cpu_user"], 3)
+        usage["cpu_system"] = round(usage["cpu_system"], 3)
+        for key in ("read_bytes", "write_bytes", "voluntary_ctx_switches", "involuntary_ctx_switches"):
+            usage[key] = int(usage[key])
+        if duration:
+            usage["cpu_utilization"] = round((usage["cpu_user"] + usage["cpu_system"]) / duration, 2)
+        return usage
+
+    def due_report(self) -> bool:
+        """Tells whether a live report of this step is due, and records it as sent."""
+        now = time.time()
+        if now - self._last_report < REPORT_INTERVAL:
+            return False
+        self._last_report = now
+        return True
+
+
+class UsageSampler:
+    """Single background thread sampling the process groups of running commands."""
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self._watches: Dict[int, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def watch(self, pgid: int, usage: StepUsage, on_sample: Optional[Callable[[StepUsage], None]] = None) -> None:
+        """
+        Starts sampling the process group of a command.
+
+        Args:
+            pgid: Process group (the PID of the command)
+            usage: Usage of the step the command belongs to
+            on_sample: Called after each sample of the group
+        """
+        if not metrics_supported():
+            return
+        with self._lock:
+            self._watches[pgid] = {"usage": usage, "on_sample": on_sample}
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="usage-sampler", daemon=True)
+                self._thread.start()
+        # A first sample right away, so short commands are seen at least once
+        self.sample_now(pgid)
+
+    def sample_now(self, pgid: int) -> None:
+        """Samples a watched process group immediately, e.g. once its output is closed and it is about to exit."""
+        with self._lock:
+            watch = self._watches.get(pgid)
+        if watch:
+            self._sample({pgid: watch})
+
+    def unwatch(self, pgid: int) -> None:
+        with self._lock:
+            self._watches.pop(pgid, None)
+
+    def _sample(self, watches: Dict[int, Dict[str, Any]]) -> None:
+        try:
+            found = _scan_processes(set(watches))
+        except (OSError, ValueError, IndexError) as e:
+            logging.debug(f"Could not sample process usage: {e}")
+            return
+        for pgid, watch in watches.items():
+            watch["usage"].sample(pgid, found.get(pgid, {}))
+            if watch["on_sample"]:
+                watch["on_sample"](watch["usage"])
+
+    def _loop(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                watches = dict(self._watches)
+            if watches:
+                self._sample(watches)
@@ -0,0 +1,203 @@
+"""
+Pipeline notification hooks.
+Runs the `notifications:` block of a pipeline once its result is known:
+
+    notifications:
+      on_success: [echo "Deployed"]
+      on_failure: [./scripts/page-oncall.sh]
+      on_always:  [echo "Pipeline finished"]
+
+Hooks run concurrently on background threads, so a slow notifier never
+delays the pipeline result. Plain `echo` hooks are handled in-process
+instead of spawning a shell for each of them. When the CLI exits it gives
+the hooks still running a short flush period, then kills them and logs
+which ones were dropped.
+"""
+import os
+import shlex
+import logging
+import threading
+import subprocess
+import concurrent.futures
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from core.src.engine.process import process_group_kwargs, signal_process_group
+
+# Seconds a hook may run before its process group is killed
+NOTIFICATION_TIMEOUT = 30
+# Seconds the CLI waits at exit for hooks still running before dropping them (--notification-timeout)
+NOTIFICATION_FLUSH_TIMEOUT = 5.0
+# Hooks running at the same time
+MAX_NOTIFIERS = 8
+# Characters that make an echo depend on the shell (expansion, redirection, globbing...)
+_SHELL_CHARS = set('|&;<>()$`\\*?[]{}~#\n')
+
+
+def notification_hooks(pipeline_config: Dict[str, Any], success: bool) -> List[tuple]:
+    """
+    Returns the hooks to run for a pipeline result.
+
+    Returns:
+        list: (hook name, command) tuples, `on_success` or `on_failure` first, then `on_always`
+
+    Raises:
+        ValueError: If the notifications block is malformed
+    """
+    notifications = pipeline_config.get('notifications') or {}
+    if not isinstance(notifications, dict):
+        raise ValueError("'notifications' must be a mapping of on_success/on_failure/on_always")
+    hooks = []
+    for name in ('on_success' if success else 'on_failure', 'on_always'):
+        commands = notifications.get(name) or []
+        if isinstance(commands, str):
+            commands = [commands]
+        if not isinstance(commands, list):
+            raise ValueError(f"notifications.{name} must be a list of commands")
+        for command in commands:
+            if not isinstance(command, str):
+                # e.g. an unquoted `- echo "URL: http://..."`, which YAML reads as a mapping
+                logging.error(f"Skipping notifications.{name} entry {command!r}: not a command string "
+                              f"(quote entries containing ': ')")
+                continue
+            hooks.append((name, command))
+    return hooks
+
+
+def echo_message(command: str) -> Optional[str]:
+    """Returns what an `echo` command would print, or None if it needs a shell."""
+    if _SHELL_CHARS.intersection(command):
+        return None
+    try:
+        argv = shlex.split(command)
+    except ValueError:
+        return None
+    if not argv or argv[0] != 'echo' or (len(argv) > 1 and argv[1].startswith('-')):
+        return None
+    return ' '.join(argv[1:])
+
+
+class NotificationDispatcher:
+    """Runs notification hooks in the background."""
+
+    def __init__(self, max_workers: int = MAX_NOTIFIERS, timeout: float = NOTIFICATION_TIMEOUT):
+        """
+        Initializes the dispatcher.
+
+        Args:
+            max_workers: Hooks running at the same time
+            timeout: Seconds a hook may run
+        """
+        self.timeout = timeout
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers,
+                                                               thread_name_prefix="notification")
+        # Hook name and command of each submitted hook, and of each running hook process
+        self._futures: Dict[concurrent.futures.Future, Tuple[str, str]] = {}
+        self._processes: Dict[int, Tuple[str, str]] = {}
+        self._lock = threading.Lock()
+        self._dropping = False
+
+    def dispatch(self, hooks: List[tuple], env: Dict[str, str], cwd: str,
+                 emit: Callable[[Dict[str, Any]], None]) -> None:
+        """
+        Starts the hooks and returns immediately.
+
+        Args:
+            hooks: (hook name, command) tuples
+            env: Environment of the hook commands
+            cwd: Working directory of the hook commands
+            emit: Receives a `notification` progress event per hook
+        """
+        for hook, command in hooks:
+            message = echo_message(command)
+            if message is not None:
+                # Nothing to wait for: report it right away
+                print(message)
+                logging.info(f"Notification ({hook}): {message}")
+                emit({"event": "notification", "hook": hook, "command": command,
+                      "status": "success", "message": message})
+                continue
+            future = self._executor.submit(self._run_hook, hook, command, env, cwd, emit)
+            self._futures[future] = (hook, command)
+
+    def _run_hook(self, hook: str, command: str, env: Dict[str, str], cwd: str,
+                  emit: Callable[[Dict[str, Any]], None]) -> None:
+        status, output = "success", ""
+        try:
+            with self._lock:
+                if self._dropping:
+                    return
+                process = subprocess.Popen(command, shell=True, cwd=cwd, env=env, stdout=subprocess.PIPE,
+                                           stderr=subprocess.STDOUT, text=True, errors='replace',
+                                           **process_group_kwargs())
+                self._processes[process.pid] = (hook, command)
+            try:
+                output, _ = process.communicate(timeout=self.timeout)
+            except subprocess.TimeoutExpired:
+                signal_process_group(process.pid, force=True)
+                output, _ = process.communicate()
+                status = "timeout"
+            finally:
+                with self._lock:
+                    self._processes.pop(process.pid, None)
+            if self._dropping:
+                status = "dropped"
+            elif status == "success" and process.returncode != 0:
+                status = "error"
+        except OSError as e:
+            status, output = "error", str(e)
+        output = output.strip()
+        if status == "success":
+            logging.info(f"Notification ({hook}) `{command}` sent" + (f": {output}" if output else ""))
+        elif status != "dropped":
+            # close() logs the dropped hooks together
+            logging.warning(f"Notification ({hook}) `{command}` failed ({status}): {output}")
+        emit({"event": "notification", "hook": hook, "command": command, "status": status,
+              "message": output or f"{command} ({status})"})
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits for the running hooks.
+
+        Returns:
+            bool: True if every hook finished within the timeout
+        """
+        futures, self._futures = self._futures, {}
+        if not futures:
+            return True
+        _, not_done = concurrent.futures.wait(futures, timeout=timeout)
+        self._futures.update((future, futures[future]) for future in not_done)
+        return not not_done
+
+    def close(self, timeout: float = NOTIFICATION_FLUSH_TIMEOUT) -> List[str]:
+        """
+        Waits up to `timeout` seconds for the running hooks, then drops the rest:
+        queued hooks never start and running ones are killed.
+
+        Returns:
+            list: Descriptions of the dropped hooks
+        """
+        if self.wait(timeout):
+            self._executor.shutdown(wait=False)
+            return []
+        with self._lock:
+            self._dropping = True
+            running = dict(self._processes)
+        dropped = [f"{hook} `{command}` (killed)" for hook, command in running.values()]
+        for pid in running:
+            signal_process_group(pid, force=True)
+        for future, (hook, command) in self._futures.items():
+            if future.cancel() or (not future.done() and (hook, command) not in running.values()):
+                dropped.append(f"{hook} `{command}` (not started)")
+        self._futures = {}
+        self._executor.shutdown(wait=False)
+        logging.warning(f"Dropped {len(dropped)} notification hook(s) still pending after {timeout:g}s: "
+                        f"{', '.join(dropped)}")
+        return dropped
+
+
+def notification_env(env_vars: Optional[Dict[str, str]], success: bool) -> Dict[str, str]:
+    """Environment of the hooks: the pipeline environment plus PIPELINE_STATUS (success/failure)."""
+    env = os.environ.copy()
+    env.update(env_vars or {})
+    env['PIPELINE_STATUS'] = 'success' if success else 'failure'
+    return env
@@ -0,0 +1,311 @@
+"""
+Streaming capture of step output.
+Reads stdout and stderr of a running process as they are produced and
+hands them over in bounded, line-aligned chunks, keeping memory flat
+however much a command prints. The full output of a step goes to its log
+file; only its beginning and end are kept in memory for the report.
+"""
+import os
+import re
+import queue
+import asyncio
+import codecs
+import logging
+import threading
+import selectors
+from collections import deque
+from typing import Callable, Deque, List, Optional
+
+# Maximum size (in characters) of a single output chunk
+DEFAULT_CHUNK_SIZE = 8192
+# Characters of stdout/stderr kept in memory per step for the report
+DEFAULT_CAPTURE_LIMIT = 256 * 1024
+# Share of the capture limit spent on the beginning of the output
+HEAD_RATIO = 0.25
+# Bytes requested from a pipe per read
+READ_SIZE = 65536
+# Seconds after which a pending partial line is flushed anyway
+FLUSH_INTERVAL = 0.5
+
+
+class OutputTail:
+    """Keeps the last `limit` characters of a stream of text."""
+
+    def __init__(self, limit: int = DEFAULT_CAPTURE_LIMIT):
+        self.limit = limit
+        self.size = 0
+        self.truncated = False
+        self._parts: Deque[str] = deque()
+
+    def append(self, text: str) -> None:
+        """Adds text, dropping the oldest content beyond the limit."""
+        if not text:
+            return
+        self._parts.append(text)
+        self.size += len(text)
+        while self.size > self.limit and self._parts:
+            overflow = self.size - self.limit
+            oldest = self._parts[0]
+            if len(oldest) <= overflow:
+                self._parts.popleft()
+                self.size -= len(oldest)
+            else:
+                self._parts[0] = oldest[overflow:]
+                self.size -= overflow
+            self.truncated = True
+
+    def getvalue(self) -> str:
+        """Returns the retained text."""
+        return ''.join(self._parts)
+
+
+class OutputCapture:
+    """
+    Keeps the beginning and the end of a stream of text.
+
+    The first `limit * HEAD_RATIO` characters are kept as they come, the rest
+    of the limit holds the most recent output. getvalue() marks the gap.
+    """
+
+    def __init__(self, limit: int = DEFAULT_CAPTURE_LIMIT):
+        self.limit = limit
+        self.head_limit = int(limit * HEAD_RATIO)
+        self.total = 0
+        self._head: List[str] = []
+        self._head_size = 0
+        self._tail = OutputTail(limit - self.head_limit)
+
+    @property
+    def truncated(self) -> bool:
+        return self._tail.truncated
+
+    @property
+    def size(self) -> int:
+        return self._head_size + self._tail.size
+
+    def append(self, text: str) -> None:
+        """Adds text, dropping the middle of the output beyond the limit."""
+        if not text:
+            return
+        self.total += len(text)
+        if self._head_size < self.head_limit:
+            head = text[:self.head_limit - self._head_size]
+            self._head.append(head)
+            self._head_size += len(head)
+            text = text[len(head):]
+        self._tail.append(text)
+
+    def getvalue(self) -> str:
+        """Returns the retained text, with a marker where output was dropped."""
+        head, tail = ''.join(self._head), self._tail.getvalue()
+        omitted = self.total - self.size
+        if not omitted:
+            return head + tail
+        return f"{head}\n... [{omitted} characters omitted, see the step log] ...\n{tail}"
+
+
+def log_file_name(step_name: str) -> str:
+    """File name of a step log: the step name with unsafe characters replaced."""
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', step_name).strip('._') or 'step'
+
+
+class StepLog:
+    """Full output of a step, written to a file as it is produced."""
+
+    def __init__(self, log_dir: str, step_name: str):
+        """
+        Creates the log file of a step in `log_dir`.
+
+        Steps whose names map to the same file get numbered files.
+
+        Raises:
+            OSError: If the file can't be created
+        """
+        os.makedirs(log_dir, exist_ok=True)
+        base = log_file_name(step_name)
+        self.path = os.path.join(log_dir, f"{base}.log")
+        suffix = 1
+        while True:
+            try:
+                self._file = open(self.path, 'x', encoding='utf-8', errors='replace')
+                break
+            except FileExistsError:
+                suffix += 1
+                self.path = os.path.join(log_dir, f"{base}_{suffix}.log")
+
+    def write(self, text: str) -> None:
+        """Appends text to the log."""
+        if self._file:
+            self._file.write(text)
+
+    def close(self) -> None:
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+def open_step_log(log_dir: Optional[str], step_name: str) -> Optional[StepLog]:
+    """Opens the log of a step, or returns None without a log directory or if it can't be created."""
+    if not log_dir:
+        return None
+    try:
+        return StepLog(log_dir, step_name)
+    except OSError as e:
+        logging.warning(f"Could not create the log file of step {step_name}: {e}")
+        return None
+
+
+class _LineChunker:
+    """Decodes bytes from one pipe and emits them as line-aligned chunks."""
+
+    def __init__(self, stream: str, on_chunk: Callable[[str, str], None], chunk_size: int):
+        self.stream = stream
+        self.on_chunk = on_chunk
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.pending = ''
+
+    def feed(self, data: bytes, final: bool = False) -> None:
+        """Decodes new data and emits every complete line."""
+        text = self.pending + self.decoder.decode(data, final)
+        if final:
+            self.pending = ''
+            self._emit(text)
+            return
+        cut = text.rfind('\n') + 1
+        if cut == 0:
+            if len(text) < self.chunk_size:
+                self.pending = text
+                return
+            cut = len(text)
+        self.pending = text[cut:]
+        self._emit(text[:cut])
+
+    def flush(self) -> None:
+        """Emits a pending partial line."""
+        if self.pending:
+            text, self.pending = self.pending, ''
+            self._emit(text)
+
+    def _emit(self, text: str) -> None:
+        start = 0
+        while start < len(text):
+            end = start + self.chunk_size
+            if end < len(text):
+                # Cut after the last complete line of the window, mid-line only for longer lines
+                end = text.rfind('\n', start, end) + 1 or end
+            chunk = text[start:end]
+            start = end
+            if chunk.endswith('\n'):
+                chunk = chunk[:-1]
+            self.on_chunk(self.stream, chunk)
+
+
+def stream_process_output(process,
+                          on_chunk: Callable[[str, str], None],
+                          chunk_size: int = DEFAULT_CHUNK_SIZE) -> None:
+    """
+    Reads a process' stdout and stderr until both are closed.
+
+    The process must have been started with binary pipes. Chunks are
+    delivered in the order they were read, from the calling thread.
+
+    Args:
+        process: subprocess.Popen object with stdout/stderr pipes
+        on_chunk: Function called with (stream name, text) for every chunk
+        chunk_size: Maximum size of a chunk in characters
+    """
+    pipes = [(name, pipe) for name, pipe in (("stdout", process.stdout), ("stderr", process.stderr)) if pipe]
+    if os.name == 'nt':
+        _stream_with_threads(pipes, on_chunk, chunk_size)
+    else:
+        _stream_with_selector(pipes, on_chunk, chunk_size)
+
+
+def _stream_with_selector(pipes, on_chunk, chunk_size) -> None:
+    """Multiplexes the pipes from a single thread (Unix-like systems)."""
+    chunkers = []
+    with selectors.DefaultSelector() as selector:
+        for name, pipe in pipes:
+            chunker = _LineChunker(name, on_chunk, chunk_size)
+            chunkers.append(chunker)
+            selector.register(pipe, selectors.EVENT_READ, chunker)
+
+        while selector.get_map():
+            events = selector.select(timeout=FLUSH_INTERVAL)
+            if not events:
+                for chunker in chunkers:
+                    chunker.flush()
+                continue
+            for key, _ in events:
+                data = os.read(key.fd, READ_SIZE)
+                if data:
+                    key.data.feed(data)
+                else:
+                    selector.unregister(key.fileobj)
+                    key.fileobj.close()
+                    key.data.feed(b'', final=True)
+
+
+def _stream_with_threads(pipes, on_chunk, chunk_size) -> None:
+    """Reads each pipe from its own thread (Windows, where pipes can't be selected)."""
+    chunks = queue.Queue(maxsize=64)
+
+    def reader(chunker, pipe):
+        try:
+            while True:
+                data = os.read(pipe.fileno(), READ_SIZE)
+                if not data:
+                    break
+                chunks.put((chunker, data))
+        finally:
+            pipe.close()
+            chunks.put((chunker, None))
+
+    open_pipes = 0
+    for name, pipe in pipes:
+        chunker = _LineChunker(name, on_chunk, chunk_size)
+        threading.Thread(target=reader, args=(chunker, pipe), daemon=True).start()
+        open_pipes += 1
+
+    pending = set()
+    while open_pipes:
+        try:
+            chunker, data = chunks.get(timeout=FLUSH_INTERVAL)
+        except queue.Empty:
+            for chunker in pending:
+                chunker.flush()
+            continue
+        if data is None:
+            chunker.feed(b'', final=True)
+            pending.discard(chunker)
+            open_pipes -= 1
+        else:
+            chunker.feed(data)
+            pending.add(chunker)
+
+
+async def stream_async_process_output(process,
+                                      on_chunk: Callable[[str, str], None],
+                                      chunk_size: int = DEFAULT_CHUNK_SIZE) -> None:
+    """
+    Reads an asyncio subprocess' stdout and stderr until both are closed.
+
+    Same contract as stream_process_output(), for processes created with
+    asyncio.create_subprocess_exec/shell; chunks are delivered from the event loop.
+    """
+    async def pump(name, reader):
+        chunker = _LineChunker(name, on_chunk, chunk_size)
+        while True:
+            try:
+                data = await asyncio.wait_for(reader.read(READ_SIZE), FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                chunker.flush()
+                continue
+            if not data:
+                chunker.feed(b'', final=True)
+                return
+            chunker.feed(data)
+
+    readers = [pump(name, reader) for name, reader in (("stdout", process.stdout), ("stderr", process.stderr)) if reader]
+    await asyncio.gather(*readers)
@@ -0,0 +1,168 @@
+"""
+Shared loading of pipeline files.
+Parses pipelines with the C YAML loader when PyYAML was built with libyaml,
+normalizes them and caches the result in memory and on disk, keyed on the
+file path, mtime, size and content hash.
+"""
+import os
+import copy
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import yaml
+
+# C implementation of the safe loader, about 10x faster than the pure-Python one
+YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+# Bump when normalize_pipeline or the entry format changes
+LOADER_CACHE_VERSION = 1
+# Pipelines kept in memory
+MEMORY_CACHE_SIZE = 4096
+# Step list sections of a pipeline file
+STEP_SECTIONS = ('parallel_steps', 'pipeline', 'cleanup')
+
+
+def default_cache_dir() -> str:
+    """Directory of the on-disk cache ($LOCALFORGE_CACHE_DIR or ~/.cache/localforge)."""
+    base = os.environ.get('LOCALFORGE_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'localforge')
+    return os.path.join(base, 'pipelines')
+
+
+def normalize_pipeline(config: Any) -> Dict[str, Any]:
+    """
+    Normalizes a parsed pipeline.
+
+    Empty step sections become empty lists, and every step must be a mapping
+    with a `step` name.
+
+    Raises:
+        ValueError: If the pipeline is not a mapping or has malformed steps
+    """
+    if not isinstance(config, dict):
+        raise ValueError("pipeline file must contain a mapping")
+    for section in STEP_SECTIONS:
+        if section not in config:
+            continue
+        steps = config[section] or []
+        if not isinstance(steps, list):
+            raise ValueError(f"'{section}' must be a list of steps")
+        for step in steps:
+            if not isinstance(step, dict) or 'step' not in step:
+                raise ValueError(f"every entry of '{section}' must be a mapping with a 'step' name")
+            step['step'] = str(step['step'])
+        config[section] = steps
+    return config
+
+
+class PipelineLoader:
+    """Loads pipeline files through a memory and an on-disk cache."""
+
+    def __init__(self, cache_dir: Optional[str] = None, use_disk_cache: bool = True):
+        """
+        Initializes the loader.
+
+        Args:
+            cache_dir: Directory of the on-disk cache (default: default_cache_dir())
+            use_disk_cache: Persist parsed pipelines across processes
+        """
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.use_disk_cache = use_disk_cache
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, path: str) -> Dict[str, Any]:
+        """
+        Returns the normalized pipeline of a file.
+
+        The result is a private copy that callers may modify.
+
+        Raises:
+            OSError: If the file can't be read
+            yaml.YAMLError: If the file is not valid YAML
+            ValueError: If the file is not a valid pipeline
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            entry = self._memory.get(path)
+            if entry and entry["signature"] == signature:
+                self._memory.move_to_end(path)
+                return copy.deepcopy(entry["config"])
+
+        entry = self._load_disk_entry(path)
+        if not entry or (entry["mtime_ns"], entry["size"]) != signature:
+            with open(path, 'rb') as f:
+                content = f.read()
+            digest = hashlib.sha256(content).hexdigest()
+            # Same content under a new mtime (checkout, touch...) doesn't need parsing again
+            if not entry or entry["sha256"] != digest:
+                config = normalize_pipeline(yaml.load(content, Loader=YamlLoader))
+                entry = {"config": config}
+            entry.update({"version": LOADER_CACHE_VERSION, "mtime_ns": signature[0],
+                          "size": signature[1], "sha256": digest})
+            self._store_disk_entry(path, entry)
+
+        with self._lock:
+            self._memory[path] = {"signature": signature, "config": entry["config"]}
+            self._memory.move_to_end(path)
+            while len(self._memory) > MEMORY_CACHE_SIZE:
+                self._memory.popitem(last=False)
+        return copy.deepcopy(entry["config"])
+
+    def clear(self) -> None:
+        """Forgets the pipelines kept in memory."""
+        with self._lock:
+            self._memory.clear()
+
+    def _entry_path(self, path: str) -> str:
+        key = hashlib.sha256(path.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _load_disk_entry(self, path: str) -> Optional[Dict[str, Any]]:
+        if not self.use_disk_cache:
+            return None
+        entry_path = self._entry_path(path)
+        try:
+            with open(entry_path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.debug(f"Ignoring unreadable pipeline cache entry {entry_path}: {e}")
+            return None
+        if entry.get("version") != LOADER_CACHE_VERSION or entry.get("path") != path:
+            return None
+        return entry
+
+    def _store_disk_entry(self, path: str, entry: Dict[str, Any]) -> None:
+        if not self.use_disk_cache:
+            return
+        entry_path = self._entry_path(path)
+        try:
+            data = json.dumps(dict(entry, path=path))
+        except (TypeError, ValueError):
+            # YAML values without a JSON form (dates, sets...): keep this one in memory only
+            return
+        try:
+            os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(entry_path), suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, entry_path)
+        except OSError as e:
+            logging.debug(f"Could not store pipeline cache entry {entry_path}: {e}")
+
+
+# Loader shared by the runner, the CLI and the web UI
+pipeline_loader = PipelineLoader()
+
+
+def load_pipeline(path: str) -> Dict[str, Any]:
+    """Loads a pipeline file through the shared loader (see PipelineLoader.load)."""
+    return pipeline_loader.load(path)
@@ -0,0 +1,111 @@
+"""
+Process group management for step commands.
+Every command starts in its own process group (a new session on POSIX), so
+stopping a step reaches the whole tree it spawned: SIGTERM first, SIGKILL
+after a grace period.
+"""
+import os
+import signal
+import logging
+import subprocess
+import threading
+from typing import Any, Dict
+
+# Seconds a terminated process group gets before it is killed
+TERMINATE_GRACE_PERIOD = 5
+# Exit status of a CLI run stopped by Ctrl+C (128 + SIGINT)
+INTERRUPTED_EXIT_CODE = 130
+
+
+def process_group_kwargs() -> Dict[str, Any]:
+    """Returns the Popen / asyncio subprocess arguments starting a new process group."""
+    if os.name == 'nt':
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {"start_new_session": True}
+
+
+def wait_status_exit_code(status: int) -> int:
+    """
+    Exit code of a wait() status, like Popen.returncode: negative signal number
+    for a killed process (os.waitstatus_to_exitcode needs Python 3.9).
+    """
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def signal_process_group(pid: int, force: bool = False) -> bool:
+    """
+    Terminates the process group led by a step command.
+
+    Args:
+        pid: PID of the command, which is also its process group ID
+        force: Send SIGKILL instead of SIGTERM
+
+    Returns:
+        bool: False if the group no longer exists
+    """
+    try:
+        if os.name == 'nt':
+            # Windows has no process group signals: taskkill walks the tree instead
+            args = ["taskkill", "/T", "/PID", str(pid)] + (["/F"] if force else [])
+            return subprocess.run(args, capture_output=True).returncode == 0
+        os.killpg(pid, signal.SIGKILL if force else signal.SIGTERM)
+        return True
+    except OSError:
+        return False
+
+
+def process_group_alive(pid: int) -> bool:
+    """Tells whether any process of a group is still running."""
+    if os.name == 'nt':
+        return True
+    try:
+        os.killpg(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+def terminate_process_group(pid: int, grace_period: float = TERMINATE_GRACE_PERIOD) -> None:
+    """Sends SIGTERM to a process group and SIGKILL if it is still alive after the grace period."""
+    logging.info(f"Terminating process group {pid}...")
+    if not signal_process_group(pid):
+        return
+
+    def kill():
+        if process_group_alive(pid) and signal_process_group(pid, force=True):
+            logging.warning(f"Forced termination of process group {pid}")
+
+    timer = threading.Timer(grace_period, kill)
+    timer.daemon = True
+    timer.start()
+
+
+class ProcessGroupRegistry:
+    """Thread-safe set of the process groups of running step commands."""
+
+    def __init__(self):
+        self._pids = set()
+        self._lock = threading.Lock()
+
+    def add(self, pid: int) -> None:
+        with self._lock:
+            self._pids.add(pid)
+
+    def discard(self, pid: int) -> None:
+        with self._lock:
+            self._pids.discard(pid)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._pids)
+
+    def terminate_all(self, grace_period: float = TERMINATE_GRACE_PERIOD) -> None:
+        """Terminates every running process group. Does not block."""
+        with self._lock:
+            pids = list(self._pids)
+        for pid in pids:
+            terminate_process_group(pid, grace_period)
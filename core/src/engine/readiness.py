@@ -0,0 +1,205 @@
+"""
+Readiness waits of pipeline steps.
+A step with `wait_for:` polls until a service is ready instead of sleeping
+for a fixed time, then runs its commands (if any):
+
+    - step: wait_for_service
+      wait_for:
+        http: http://localhost:8080/health   # any 2xx/3xx response (or `status: 204`, `200-499`, `any`)
+        tcp: localhost:5432                  # a port accepting connections
+        file: build/ready.flag               # a file existing, relative to the step directory
+        log:                                 # a line matching a regex in a file or a command's output
+          file: logs/app.log                 # or: command: docker-compose logs web
+          pattern: "Listening on"
+        timeout: 2m                          # default 60s
+        interval: 0.5                        # first backoff, doubled up to 5s
+
+Every listed target must be ready. The wait fails with a `timeout` status.
+"""
+import os
+import re
+import time
+import socket
+import subprocess
+import urllib.error
+import urllib.request
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from core.src.engine.limits import parse_duration
+
+DEFAULT_TIMEOUT = 60.0
+DEFAULT_INTERVAL = 0.5
+# Upper bound of the wait between two probes
+MAX_INTERVAL = 5.0
+# Seconds a single probe may take
+PROBE_TIMEOUT = 5.0
+_TARGET_KINDS = ('http', 'tcp', 'file', 'log')
+
+
+def wait_spec(step: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Returns the normalized `wait_for:` of a step.
+
+    A plain string is shorthand for an HTTP URL, or a TCP `host:port`.
+
+    Returns:
+        dict: `targets` (list of (kind, value) tuples), `timeout`, `interval`
+              and `status` (range of accepted HTTP statuses or None), or None without `wait_for:`
+
+    Raises:
+        ValueError: If the specification is invalid
+    """
+    spec = step.get('wait_for')
+    if not spec:
+        return None
+    if isinstance(spec, str):
+        spec = {'http' if re.match(r'https?://', spec) else 'tcp': spec}
+    if not isinstance(spec, dict):
+        raise ValueError(f"invalid wait_for: {spec!r} (use a URL, host:port or a mapping)")
+
+    targets = []
+    for kind in _TARGET_KINDS:
+        if spec.get(kind) is None:
+            continue
+        value = spec[kind]
+        if kind == 'tcp':
+            value = _parse_tcp(value)
+        elif kind == 'log':
+            if not isinstance(value, dict) or not value.get('pattern') or not (value.get('file') or value.get('command')):
+                raise ValueError("wait_for log needs a `pattern` and a `file` or `command`")
+            value = {'pattern': re.compile(str(value['pattern'])), 'file': value.get('file'),
+                     'command': value.get('command')}
+        else:
+            value = str(value)
+        targets.append((kind, value))
+    if not targets:
+        raise ValueError(f"wait_for needs one of: {', '.join(_TARGET_KINDS)}")
+
+    return {
+        'targets': targets,
+        'timeout': parse_duration(spec['timeout']) if spec.get('timeout') else DEFAULT_TIMEOUT,
+        'interval': parse_duration(spec['interval']) if spec.get('interval') else DEFAULT_INTERVAL,
+        'status': _parse_status(spec['status']) if spec.get('status') is not None else None
+    }
+
+
+def _parse_status(value: Any) -> Tuple[int, int]:
+    """Parses `status:`: a code, a `low-high` range or `any` (the server answered at all)."""
+    text = str(value).strip().lower()
+    if text == 'any':
+        return 100, 599
+    low, _, high = text.partition('-')
+    if not low.strip().isdigit() or (high and not high.strip().isdigit()):
+        raise ValueError(f"invalid wait_for status: {value!r} (use e.g. 204, 200-499 or any)")
+    return int(low), int(high or low)
+
+
+def _parse_tcp(value: Any) -> Tuple[str, int]:
+    host, _, port = str(value).rpartition(':')
+    if not port.isdigit():
+        raise ValueError(f"invalid wait_for tcp: {value!r} (use host:port)")
+    return host.strip('[]') or 'localhost', int(port)
+
+
+def describe_target(kind: str, value: Any) -> str:
+    """Human-readable form of a wait target."""
+    if kind == 'tcp':
+        return f"tcp {value[0]}:{value[1]}"
+    if kind == 'log':
+        source = value['file'] or f"output of `{value['command']}`"
+        return f"/{value['pattern'].pattern}/ in {source}"
+    return f"{kind} {value}"
+
+
+def probe(kind: str, value: Any, cwd: str, env: Optional[Dict[str, str]] = None,
+          expected_status: Optional[Tuple[int, int]] = None) -> Tuple[bool, str]:
+    """
+    Checks a wait target once.
+
+    Returns:
+        tuple: (ready, detail of the last observation)
+    """
+    try:
+        if kind == 'http':
+            try:
+                with urllib.request.urlopen(value, timeout=PROBE_TIMEOUT) as response:
+                    code = response.status
+            except urllib.error.HTTPError as e:
+                code = e.code
+            low, high = expected_status or (200, 399)
+            ready = low <= code <= high
+            return ready, f"HTTP {code}"
+        if kind == 'tcp':
+            with socket.create_connection(value, timeout=PROBE_TIMEOUT):
+                return True, "port open"
+        if kind == 'file':
+            path = os.path.join(cwd, value)
+            return os.path.exists(path), "file present" if os.path.exists(path) else "file missing"
+        if kind == 'log':
+            if value['file']:
+                with open(os.path.join(cwd, value['file']), 'r', encoding='utf-8', errors='replace') as f:
+                    text = f.read()
+            else:
+                text = subprocess.run(value['command'], shell=True, cwd=cwd, env=env, capture_output=True,
+                                      text=True, errors='replace', timeout=PROBE_TIMEOUT).stdout
+            found = value['pattern'].search(text)
+            return bool(found), f"matched {found.group(0)!r}" if found else "no match yet"
+    except (OSError, ValueError, subprocess.SubprocessError) as e:
+        return False, str(getattr(e, 'reason', None) or e)
+    raise ValueError(f"unknown wait target: {kind}")
+
+
+def wait_until_ready(spec: Dict[str, Any], cwd: str, env: Optional[Dict[str, str]] = None,
+                     should_stop: Callable[[], bool] = lambda: False,
+                     on_progress: Optional[Callable[[str], None]] = None,
+                     deadline: Optional[float] = None) -> Tuple[bool, str]:
+    """
+    Polls the targets of a wait with exponential backoff until all are ready.
+
+    Args:
+        spec: Wait specification (see wait_spec)
+        cwd: Directory relative paths are resolved from
+        env: Environment of log commands
+        should_stop: Returns True to abandon the wait
+        on_progress: Called with a message when a target's state changes
+        deadline: Optional time.time() the wait must end by (e.g. the step timeout)
+
+    Returns:
+        tuple: (ready, summary message)
+    """
+    start = time.time()
+    end = start + spec['timeout']
+    if deadline is not None:
+        end = min(end, deadline)
+    interval = spec['interval']
+    pending: List[Tuple[str, Any]] = list(spec['targets'])
+    last_detail: Dict[str, str] = {}
+
+    while True:
+        still_pending = []
+        for kind, value in pending:
+            name = describe_target(kind, value)
+            ready, detail = probe(kind, value, cwd, env, spec['status'])
+            if ready:
+                if on_progress:
+                    on_progress(f"{name} ready after {time.time() - start:.2f}s ({detail})")
+            else:
+                if on_progress and last_detail.get(name) != detail:
+                    on_progress(f"Waiting for {name}: {detail}")
+                last_detail[name] = detail
+                still_pending.append((kind, value))
+        pending = still_pending
+        if not pending:
+            return True, f"Ready after {time.time() - start:.2f}s"
+
+        now = time.time()
+        if now >= end:
+            names = ', '.join(f"{describe_target(kind, value)} ({last_detail[describe_target(kind, value)]})"
+                              for kind, value in pending)
+            return False, f"Still waiting after {now - start:.2f}s for {names}"
+        sleep_until = min(now + interval, end)
+        while time.time() < sleep_until:
+            if should_stop():
+                return False, "Wait cancelled"
+            time.sleep(max(0.0, min(0.1, sleep_until - time.time())))
+        interval = min(interval * 2, MAX_INTERVAL)
@@ -0,0 +1,61 @@
+"""
+Retry policies of pipeline steps.
+A step with `retry:` runs its commands again when they fail, waiting an
+exponentially growing backoff between attempts:
+
+    retry:
+      attempts: 3          # total attempts, including the first one
+      backoff: 2           # seconds before the 2nd attempt, doubled after each one
+      on_exit_codes: [7]   # only retry these exit codes (default: any failure)
+
+`retry: 3` is a shorthand for `retry: {attempts: 3}`.
+"""
+from typing import Any, Dict, Optional
+
+from core.src.engine.limits import parse_duration
+
+# Upper bound of a single backoff wait
+MAX_BACKOFF = 300
+
+
+def retry_policy(step: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Returns the normalized retry policy of a step.
+
+    Returns:
+        dict: `attempts` (int), `backoff` (seconds) and `on_exit_codes`
+              (list or None for any code), or None if the step isn't retried
+
+    Raises:
+        ValueError: If the policy is invalid
+    """
+    retry = step.get('retry')
+    if retry is None or retry is False:
+        return None
+    if isinstance(retry, bool) or not isinstance(retry, (int, dict)):
+        raise ValueError(f"invalid retry: {retry!r} (use a number of attempts or a mapping)")
+    if isinstance(retry, int):
+        retry = {'attempts': retry}
+
+    attempts = retry.get('attempts', 2)
+    if not isinstance(attempts, int) or isinstance(attempts, bool) or attempts < 1:
+        raise ValueError(f"invalid retry attempts: {attempts!r} (use a positive integer)")
+    backoff = parse_duration(retry['backoff']) if retry.get('backoff') else 0.0
+    codes = retry.get('on_exit_codes')
+    if codes is not None:
+        codes = [int(code) for code in (codes if isinstance(codes, list) else [codes])]
+    if attempts == 1:
+        return None
+    return {'attempts': attempts, 'backoff': backoff, 'on_exit_codes': codes}
+
+
+def should_retry(policy: Optional[Dict[str, Any]], attempt: int, exit_code: int) -> bool:
+    """Tells whether a step whose `attempt`-th attempt failed with `exit_code` runs again."""
+    if not policy or attempt >= policy['attempts']:
+        return False
+    return policy['on_exit_codes'] is None or exit_code in policy['on_exit_codes']
+
+
+def backoff_delay(policy: Dict[str, Any], attempt: int) -> float:
+    """Seconds to wait after the `attempt`-th failed attempt."""
+    return min(policy['backoff'] * 2 ** (attempt - 1), MAX_BACKOFF)
@@ -0,0 +1,285 @@
+"""
+Run store.
+Every finished run is appended to a SQLite database (WAL mode, so readers
+such as the web UI never block the runner): one row per run, per step
+result and per command. The CLI and the web UI share one store per user
+(see default_store_path), so each pipeline has a single history whatever
+started its runs. Rows are never updated. The tables are indexed by
+pipeline, status and time, so the history of a pipeline, its statistics
+and the recent step results used for flake scores and critical-path
+estimates are indexed queries however many runs are stored.
+"""
+import os
+import json
+import uuid
+import sqlite3
+import datetime
+from contextlib import closing
+from typing import Any, Dict, List, Optional
+
+from core.src.engine.history import _seconds
+
+# Default store, relative to the home directory; LOCALFORGE_RUN_STORE overrides it
+RUN_STORE_FILE = os.path.join(".localforge", "runs.db")
+RUN_STORE_ENV = "LOCALFORGE_RUN_STORE"
+# Bump when the schema changes incompatibly
+SCHEMA_VERSION = 1
+# Seconds a writer waits for another one to commit
+_BUSY_TIMEOUT = 10.0
+# Step statuses counted as completed and as failed in the run rows
+_COMPLETED_STATUSES = ("success", "skipped")
+_FAILED_STATUSES = ("error", "timeout", "resource_exceeded")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT,
+    pipeline TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    duration REAL,
+    status TEXT NOT NULL,
+    total_steps INTEGER NOT NULL DEFAULT 0,
+    completed_steps INTEGER NOT NULL DEFAULT 0,
+    failed_steps INTEGER NOT NULL DEFAULT 0,
+    report_file TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_by_pipeline ON runs (pipeline, started_at);
+CREATE INDEX IF NOT EXISTS runs_by_status ON runs (status, started_at);
+CREATE INDEX IF NOT EXISTS runs_by_time ON runs (started_at);
+
+CREATE TABLE IF NOT EXISTS steps (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run INTEGER NOT NULL REFERENCES runs (id),
+    step TEXT NOT NULL,
+    status TEXT,
+    started_at REAL,
+    duration REAL,
+    attempts INTEGER,
+    flaky INTEGER NOT NULL DEFAULT 0,
+    cache_hit INTEGER NOT NULL DEFAULT 0,
+    cache_key TEXT,
+    resumed INTEGER NOT NULL DEFAULT 0,
+    agent TEXT,
+    error TEXT,
+    metrics TEXT
+);
+CREATE INDEX IF NOT EXISTS steps_by_run ON steps (run);
+CREATE INDEX IF NOT EXISTS steps_by_name ON steps (step, started_at);
+CREATE INDEX IF NOT EXISTS steps_by_status ON steps (status, started_at);
+
+CREATE TABLE IF NOT EXISTS commands (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    step INTEGER NOT NULL REFERENCES steps (id),
+    command TEXT NOT NULL,
+    attempt INTEGER,
+    started_at REAL,
+    duration REAL,
+    exit_code INTEGER
+);
+CREATE INDEX IF NOT EXISTS commands_by_step ON commands (step);
+"""
+
+
+def default_store_path() -> str:
+    """Path of the run store used by the CLI and the web UI."""
+    return os.environ.get(RUN_STORE_ENV) or os.path.join(os.path.expanduser("~"), RUN_STORE_FILE)
+
+
+def new_run_id() -> str:
+    """Returns the ID of a new run: its start time, then a random suffix."""
+    return f"{datetime.datetime.now():%Y%m%d_%H%M%S}_{uuid.uuid4().hex[:6]}"
+
+
+def _isoformat(timestamp: Optional[float]) -> Optional[str]:
+    return datetime.datetime.fromtimestamp(timestamp).isoformat(timespec="seconds") if timestamp else None
+
+
+class RunStore:
+    """Append-only SQLite store of pipeline runs."""
+
+    def __init__(self, path: str):
+        """
+        Opens a store, creating it if needed.
+
+        Args:
+            path: Database file
+
+        Raises:
+            sqlite3.Error: If the database can't be opened or was written by a newer version
+        """
+        self.path = os.path.abspath(path)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with closing(self._connect()) as db:
+            # Persistent: set once, for every later connection
+            db.execute("PRAGMA journal_mode=WAL")
+            version = db.execute("PRAGMA user_version").fetchone()[0]
+            if version > SCHEMA_VERSION:
+                raise sqlite3.DatabaseError(f"{self.path} has schema version {version}, "
+                                            f"this version supports up to {SCHEMA_VERSION}")
+            with db:
+                db.executescript(_SCHEMA)
+                db.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    def _connect(self) -> sqlite3.Connection:
+        # One short-lived connection per operation: callers are runner and web server threads
+        db = sqlite3.connect(self.path, timeout=_BUSY_TIMEOUT)
+        db.row_factory = sqlite3.Row
+        # Durable across crashes of the process in WAL mode, and cheaper than FULL
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def record_run(self, report: Dict[str, Any], started_at: float, duration: Optional[float],
+                   report_file: Optional[str] = None, error: Optional[str] = None) -> int:
+        """
+        Appends a finished run with its step results and commands.
+
+        Args:
+            report: Pipeline report (`run_id`, `pipeline_file`, `steps`, `success`)
+            started_at: Start of the run, epoch seconds
+            duration: Seconds the run took
+            report_file: JSON report written for the run, if any
+            error: Why the run failed before running its steps
+
+        Returns:
+            int: Row ID of the run
+        """
+        results = report.get("steps") or []
+        if error:
+            status = "error"
+        else:
+            status = "success" if report.get("success") else "failed"
+        with closing(self._connect()) as db, db:
+            cursor = db.execute(
+                "INSERT INTO runs (run_id, pipeline, started_at, duration, status, total_steps, completed_steps,"
+                " failed_steps, report_file, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (report.get("run_id"), os.path.abspath(str(report.get("pipeline_file"))), started_at, duration,
+                 status, len(results),
+                 sum(1 for result in results if result.get("status") in _COMPLETED_STATUSES),
+                 sum(1 for result in results if result.get("status") in _FAILED_STATUSES),
+                 report_file, error))
+            run = cursor.lastrowid
+            commands = []
+            for result in results:
+                timing = result.get("timing") or {}
+                attempts = result.get("attempts")
+                cursor = db.execute(
+                    "INSERT INTO steps (run, step, status, started_at, duration, attempts, flaky, cache_hit,"
+                    " cache_key, resumed, agent, error, metrics) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (run, result["step"], result.get("status"), timing.get("start"),
+                     _seconds(result.get("duration")),
+                     len(attempts) if isinstance(attempts, list) else attempts,
+                     bool(result.get("flaky")), bool(result.get("cache_hit")), result.get("cache_key"),
+                     bool(result.get("resumed")), result.get("agent"), result.get("error"),
+                     json.dumps(result["metrics"]) if result.get("metrics") else None))
+                step = cursor.lastrowid
+                for command in timing.get("commands") or []:
+                    ended = command.get("end_monotonic")
+                    commands.append((step, command["command"], command.get("attempt"), command.get("start"),
+                                     ended - command["start_monotonic"] if ended is not None else None,
+                                     command.get("exit_code")))
+            db.executemany("INSERT INTO commands (step, command, attempt, started_at, duration, exit_code)"
+                           " VALUES (?, ?, ?, ?, ?, ?)", commands)
+        return run
+
+    def recent_step_results(self, pipeline_file: str, limit: int) -> List[List[Dict[str, Any]]]:
+        """
+        Step results of the most recent runs of a pipeline, for history.flake_scores and step_durations.
+
+        Returns:
+            list: Per run, oldest first, the results (`step`, `status`, `duration`,
+                  `cache_key`, `cache_hit`, `flaky`, `resumed`) in execution order
+        """
+        with closing(self._connect()) as db:
+            rows = db.execute(
+                "SELECT steps.run, step, steps.status, steps.duration, cache_key, cache_hit, flaky, resumed"
+                " FROM steps JOIN (SELECT id FROM runs WHERE pipeline = ? ORDER BY started_at DESC LIMIT ?) AS recent"
+                " ON steps.run = recent.id ORDER BY steps.run, steps.id",
+                (os.path.abspath(pipeline_file), limit)).fetchall()
+        runs: Dict[int, List[Dict[str, Any]]] = {}
+        for row in rows:
+            runs.setdefault(row["run"], []).append({
+                "step": row["step"], "status": row["status"], "duration": row["duration"],
+                "cache_key": row["cache_key"], "cache_hit": bool(row["cache_hit"]),
+                "flaky": bool(row["flaky"]), "resumed": bool(row["resumed"])
+            })
+        return [runs[run] for run in sorted(runs)]
+
+    def history(self, limit: int = 10, pipeline_file: Optional[str] = None,
+                status: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Most recent runs, oldest first.
+
+        Args:
+            limit: Maximum number of runs
+            pipeline_file: Only runs of this pipeline
+            status: Only runs with this status ("success", "failed" or "error")
+
+        Returns:
+            list: Run summaries
+        """
+        conditions, parameters = [], []
+        if pipeline_file:
+            conditions.append("pipeline = ?")
+            parameters.append(os.path.abspath(pipeline_file))
+        if status:
+            conditions.append("status = ?")
+            parameters.append(status)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with closing(self._connect()) as db:
+            rows = db.execute(f"SELECT * FROM runs {where} ORDER BY started_at DESC LIMIT ?",
+                              parameters + [limit]).fetchall()
+        return [self._summary(row) for row in reversed(rows)]
+
+    @staticmethod
+    def _summary(row: sqlite3.Row) -> Dict[str, Any]:
+        duration = row["duration"]
+        summary = {
+            "run_id": row["run_id"],
+            "pipeline_file": row["pipeline"],
+            "start_time": _isoformat(row["started_at"]),
+            "end_time": _isoformat(row["started_at"] + duration if duration is not None else None),
+            "duration": f"{duration:.2f}s" if duration is not None else None,
+            "duration_seconds": duration,
+            "success": row["status"] == "success",
+            "status": row["status"],
+            "total_steps": row["total_steps"],
+            "completed_steps": row["completed_steps"],
+            "failed_steps": row["failed_steps"],
+            "report_file": row["report_file"]
+        }
+        if row["error"]:
+            summary["error"] = row["error"]
+        return summary
+
+    def stats(self, pipeline_file: Optional[str] = None, since: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Run statistics.
+
+        Args:
+            pipeline_file: Only runs of this pipeline
+            since: Only runs started after this time, epoch seconds
+
+        Returns:
+            dict: `total_runs`, `success_rate` (percent), `avg_duration` (seconds) and `last_run`
+        """
+        conditions, parameters = [], []
+        if pipeline_file:
+            conditions.append("pipeline = ?")
+            parameters.append(os.path.abspath(pipeline_file))
+        if since is not None:
+            conditions.append("started_at >= ?")
+            parameters.append(since)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with closing(self._connect()) as db:
+            total, successful, avg_duration = db.execute(
+                f"SELECT COUNT(*), SUM(status = 'success'), AVG(duration) FROM runs {where}", parameters).fetchone()
+            last = db.execute(f"SELECT * FROM runs {where} ORDER BY started_at DESC LIMIT 1", parameters).fetchone()
+        if not total:
+            return {"total_runs": 0, "success_rate": 0, "avg_duration": 0}
+        return {
+            "total_runs": total,
+            "success_rate": round(successful / total * 100, 1),
+            "avg_duration": round(avg_duration or 0, 1),
+            "last_run": self._summary(last)
+        }
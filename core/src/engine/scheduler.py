@@ -0,0 +1,420 @@
+"""
+Dependency-graph scheduling for pipeline steps.
+Turns a pipeline configuration into a graph of steps linked by their
+`needs:` declarations and runs it on a bounded pool of worker threads.
+"""
+import os
+import time
+import heapq
+import asyncio
+import logging
+import concurrent.futures
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from core.src.engine.matrix import expand_matrix
+from core.src.engine.artifacts import producers, step_artifact_uses, step_artifacts
+from core.src.engine.trace import mark
+
+
+# Step statuses that fail the run (and halt it without continue_on_error)
+FAILURE_STATUSES = ("error", "timeout", "resource_exceeded")
+
+def default_max_workers() -> int:
+    """Returns the default worker limit, mirroring ThreadPoolExecutor's default."""
+    return min(32, (os.cpu_count() or 1) + 4)
+
+
+def _normalize_needs(step: Dict[str, Any]) -> Optional[List[str]]:
+    """Returns the explicit `needs:` list of a step, or None if it declares none."""
+    if 'needs' not in step:
+        return None
+    needs = step['needs']
+    if needs is None:
+        return []
+    if isinstance(needs, str):
+        return [needs]
+    return [str(name) for name in needs]
+
+
+def _normalize_resources(step: Dict[str, Any]) -> Dict[str, int]:
+    """Returns the resource units a step holds while running, by label."""
+    resources = step.get('resources') or {}
+    if isinstance(resources, str):
+        resources = [resources]
+    if isinstance(resources, list):
+        return {str(label): 1 for label in resources}
+    return {str(label): int(units) for label, units in resources.items()}
+
+
+def build_step_graph(pipeline_config: Dict[str, Any], include_parallel: bool = True) -> List[Dict[str, Any]]:
+    """
+    Builds the dependency graph of a pipeline.
+
+    Steps in `parallel_steps` have no implicit dependencies. Steps in
+    `pipeline` without a `needs:` key depend on the previous step of the
+    list (the first one on every parallel step), so old-style pipelines
+    become a simple chain. A step with `needs:` depends only on the listed steps.
+    Steps with a `matrix:` are expanded into one node per job; depending on
+    a matrix step means depending on all of its jobs. A step with
+    `uses_artifacts:` also depends on the steps producing those artifacts.
+
+    Args:
+        pipeline_config: Parsed pipeline YAML
+        include_parallel: Whether `parallel_steps` are part of the run
+
+    Returns:
+        list: Graph nodes in declaration order, each a dict with
+              `name`, `step`, `needs`, `resources` and `stage` keys
+
+    Raises:
+        ValueError: If step names are duplicated, unknown or form a cycle,
+                    or if artifacts are unknown or produced twice
+    """
+    parallel_steps = (pipeline_config.get('parallel_steps') or []) if include_parallel else []
+    sequential_steps = pipeline_config.get('pipeline') or []
+    skipped_names = set()
+    if not include_parallel:
+        skipped_names = {step.get('step') for step in pipeline_config.get('parallel_steps') or []}
+
+    nodes = []
+    # Names a `needs:` entry can refer to; a matrix step stands for all its jobs
+    aliases: Dict[str, List[str]] = {}
+
+    def add_nodes(step, needs, stage):
+        if step['step'] in aliases:
+            raise ValueError(f"Duplicate step name in pipeline: {step['step']}")
+        jobs = expand_matrix(step)
+        for job in jobs:
+            nodes.append({"name": job['step'], "step": job, "needs": list(needs),
+                          "resources": _normalize_resources(job), "stage": stage})
+            aliases.setdefault(job['step'], []).append(job['step'])
+        if step.get('matrix'):
+            aliases.setdefault(step['step'], []).extend(job['step'] for job in jobs)
+        return [job['step'] for job in jobs]
+
+    for step in parallel_steps:
+        add_nodes(step, _normalize_needs(step) or [], "parallel")
+
+    previous = [node["name"] for node in nodes]
+    for step in sequential_steps:
+        needs = _normalize_needs(step)
+        if needs is None:
+            needs = previous
+        previous = add_nodes(step, needs, "sequential")
+
+    names = set()
+    for node in nodes:
+        if node["name"] in names:
+            raise ValueError(f"Duplicate step name in pipeline: {node['name']}")
+        names.add(node["name"])
+
+    for node in nodes:
+        unknown = [name for name in node["needs"] if name not in aliases and name not in skipped_names]
+        if unknown:
+            raise ValueError(f"Step {node['name']} needs unknown steps: {', '.join(unknown)}")
+        # Dependencies on parallel steps that are not run this time are dropped
+        needs = []
+        for name in node["needs"]:
+            for target in aliases.get(name, []):
+                if target not in needs:
+                    needs.append(target)
+        node["needs"] = needs
+
+    # Consumers of an artifact wait for its producer
+    produced_by = producers(nodes)
+    skipped_artifacts = {name for step in pipeline_config.get('parallel_steps') or []
+                         if step.get('step') in skipped_names
+                         for job in expand_matrix(step) for name in step_artifacts(job)}
+    for node in nodes:
+        for name in step_artifact_uses(node["step"]):
+            producer = produced_by.get(name)
+            if producer is None and name not in skipped_artifacts:
+                per_job = [produced for produced in produced_by if produced.startswith(f"{name} (")]
+                if per_job:
+                    raise ValueError(f"Step {node['name']} uses artifact {name} of a matrix step, which has one per job: "
+                                     f"use {', '.join(repr(produced) for produced in per_job)}")
+                raise ValueError(f"Step {node['name']} uses unknown artifact: {name}")
+            if producer and producer != node["name"] and producer not in node["needs"]:
+                node["needs"].append(producer)
+
+    _check_acyclic(nodes)
+    return nodes
+
+
+def _check_acyclic(nodes: List[Dict[str, Any]]) -> None:
+    """Raises ValueError if the step graph contains a dependency cycle."""
+    _topological_order(nodes)
+
+
+def _topological_order(nodes: List[Dict[str, Any]]) -> List[str]:
+    """
+    Returns the step names ordered so that every step comes after its dependencies.
+
+    Raises:
+        ValueError: If the step graph contains a dependency cycle
+    """
+    order = []
+    remaining = {node["name"]: set(node["needs"]) for node in nodes}
+    while remaining:
+        ready = [name for name, needs in remaining.items() if not needs]
+        if not ready:
+            raise ValueError(f"Dependency cycle between steps: {', '.join(sorted(remaining))}")
+        order.extend(ready)
+        for name in ready:
+            del remaining[name]
+        for needs in remaining.values():
+            needs.difference_update(ready)
+    return order
+
+
+class StepScheduler:
+    """
+    Runs a step graph, starting each step as soon as its dependencies finish.
+
+    Besides the global worker limit, steps may hold units of named resources
+    (`resources: [docker]`); the scheduler never runs more steps on a resource
+    than its capacity. Labels without a configured capacity have capacity 1.
+
+    With step durations from previous runs, ready steps start by decreasing
+    length of the longest path they begin (critical path first, which is
+    longest-processing-time-first among independent steps); ties and runs
+    without history keep declaration order.
+
+    Every result gets a `timing` entry with the time its step became ready
+    and its `queue_wait`: the seconds it then waited for a worker or a resource.
+    """
+
+    def __init__(self, nodes: List[Dict[str, Any]], max_workers: Optional[int] = None,
+                 continue_on_error: bool = False, resource_limits: Optional[Dict[str, int]] = None,
+                 durations: Optional[Dict[str, float]] = None):
+        """
+        Initializes the scheduler.
+
+        Args:
+            nodes: Graph nodes as returned by build_step_graph()
+            max_workers: Maximum number of steps running at the same time
+            continue_on_error: Keep scheduling dependents of failed steps
+            resource_limits: Capacity of each named resource
+            durations: Expected seconds per step name (e.g. history.step_durations());
+                       steps without one are assumed to take the average known duration
+
+        Raises:
+            ValueError: If a step needs more units of a resource than its capacity
+        """
+        self.nodes = nodes
+        self.max_workers = max(1, max_workers or default_max_workers())
+        self.continue_on_error = continue_on_error
+        self.resource_limits = dict(resource_limits or {})
+        for node in nodes:
+            for label, units in node.get("resources", {}).items():
+                capacity = self.resource_limits.setdefault(label, 1)
+                if units > capacity:
+                    raise ValueError(f"Step {node['name']} needs {units} units of resource "
+                                     f"'{label}' but its capacity is {capacity}")
+        self.priorities = self._path_lengths(durations or {})
+
+    def _path_lengths(self, durations: Dict[str, float]) -> Dict[str, float]:
+        """Expected duration of the longest path starting at each step."""
+        known = [durations[node["name"]] for node in self.nodes if node["name"] in durations]
+        default = sum(known) / len(known) if known else 0.0
+        dependents: Dict[str, List[str]] = {node["name"]: [] for node in self.nodes}
+        for node in self.nodes:
+            for name in node["needs"]:
+                dependents[name].append(node["name"])
+
+        lengths: Dict[str, float] = {}
+        # Dependents come later in a topological order: walk it backwards
+        for name in reversed(_topological_order(self.nodes)):
+            tail = max((lengths[dependent] for dependent in dependents[name]), default=0.0)
+            lengths[name] = durations.get(name, default) + tail
+        return lengths
+
+    def critical_path(self) -> Tuple[List[str], float]:
+        """
+        Returns the longest expected path through the graph.
+
+        Returns:
+            tuple: (step names along the path, expected seconds)
+        """
+        if not self.nodes:
+            return [], 0.0
+        by_name = {node["name"]: node for node in self.nodes}
+        dependents: Dict[str, List[str]] = {name: [] for name in by_name}
+        for node in self.nodes:
+            for name in node["needs"]:
+                dependents[name].append(node["name"])
+        roots = [node["name"] for node in self.nodes if not node["needs"]]
+        current = max(roots, key=lambda name: self.priorities[name])
+        path = [current]
+        while dependents[current]:
+            current = max(dependents[current], key=lambda name: self.priorities[name])
+            path.append(current)
+        return path, self.priorities[path[0]]
+
+    def _start(self) -> None:
+        """Resets the bookkeeping for a new run."""
+        self._index = {node["name"]: position for position, node in enumerate(self.nodes)}
+        self._waiting = {node["name"]: set(node["needs"]) for node in self.nodes}
+        self._dependents: Dict[str, List[str]] = {node["name"]: [] for node in self.nodes}
+        for node in self.nodes:
+            for name in node["needs"]:
+                self._dependents[name].append(node["name"])
+
+        self._ready: List[Tuple[float, int, str]] = []
+        self._timing: Dict[str, Dict[str, Any]] = {}
+        for name, needs in self._waiting.items():
+            if not needs:
+                self._push_ready(name)
+
+        self._results: List[Dict[str, Any]] = []
+        self._success = True
+        self._halted = False
+        self._in_use = {label: 0 for label in self.resource_limits}
+
+    def _push_ready(self, name: str) -> None:
+        """Queues a step whose dependencies are done: longest remaining path first, then declaration order."""
+        self._timing[name] = mark("ready")
+        heapq.heappush(self._ready, (-self.priorities[name], self._index[name], name))
+
+    def _fits(self, name: str) -> bool:
+        """Tells whether the resources of a step are available."""
+        resources = self.nodes[self._index[name]].get("resources", {})
+        return all(self._in_use[label] + units <= self.resource_limits[label] for label, units in resources.items())
+
+    def _take_ready(self, running: int, should_stop: Optional[Callable[[], bool]]) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """
+        Takes the first ready step, by priority, whose resources are free.
+
+        Returns:
+            tuple: (step name, step definition), or None if nothing may start now
+        """
+        if not self._ready or running >= self.max_workers or self._halted:
+            return None
+        if should_stop is not None and should_stop():
+            return None
+
+        blocked = []
+        found = None
+        while self._ready:
+            item = heapq.heappop(self._ready)
+            if self._fits(item[2]):
+                found = item
+                break
+            blocked.append(item)
+        for item in blocked:
+            heapq.heappush(self._ready, item)
+        if found is None:
+            return None
+
+        name = found[2]
+        timing = self._timing[name]
+        timing["queue_wait"] = round(time.monotonic() - timing["ready_monotonic"], 6)
+        node = self.nodes[self._index[name]]
+        for label, units in node.get("resources", {}).items():
+            self._in_use[label] += units
+        return name, node["step"]
+
+    def _complete(self, name: str, result: Dict[str, Any],
+                  on_halt: Optional[Callable[[Dict[str, Any]], None]]) -> None:
+        """Records a step result and releases its resources and the steps waiting on it."""
+        for label, units in self.nodes[self._index[name]].get("resources", {}).items():
+            self._in_use[label] -= units
+        result["timing"] = dict(self._timing.get(name, {}), **(result.get("timing") or {}))
+        self._results.append(result)
+
+        if result["status"] in FAILURE_STATUSES:
+            self._success = False
+            if not self.continue_on_error:
+                if not self._halted and on_halt:
+                    on_halt(result)
+                self._halted = True
+                return
+        elif result["status"] not in ("success", "skipped"):
+            # Cancelled steps don't unlock their dependents and the run is incomplete
+            self._success = False
+            return
+
+        for dependent in self._dependents[name]:
+            self._waiting[dependent].discard(name)
+            if not self._waiting[dependent]:
+                self._push_ready(dependent)
+
+    @staticmethod
+    def _crash_result(name: str, exc: BaseException) -> Dict[str, Any]:
+        """Result recorded for a step whose execution raised."""
+        logging.error(f"Step {name} generated an exception: {exc}")
+        return {"step": name, "status": "error", "duration": "0.00s", "output": None, "error": str(exc)}
+
+    def run(self,
+            execute: Callable[[Dict[str, Any]], Dict[str, Any]],
+            should_stop: Optional[Callable[[], bool]] = None,
+            on_halt: Optional[Callable[[Dict[str, Any]], None]] = None) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Executes the graph on a thread pool.
+
+        Args:
+            execute: Function running one step definition and returning its result
+            should_stop: Optional function telling whether to stop starting new steps
+            on_halt: Optional function called with the result that halted the run
+
+        Returns:
+            tuple: (results in completion order, overall success)
+        """
+        self._start()
+        running: Dict[concurrent.futures.Future, str] = {}
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers,
+                                                   thread_name_prefix="step-worker") as executor:
+            while self._ready or running:
+                while True:
+                    taken = self._take_ready(len(running), should_stop)
+                    if taken is None:
+                        break
+                    name, step = taken
+                    running[executor.submit(execute, step)] = name
+                if not running:
+                    break
+
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as exc:
+                        result = self._crash_result(name, exc)
+                    self._complete(name, result, on_halt)
+
+        return self._results, self._success
+
+    async def run_async(self,
+                        execute: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+                        should_stop: Optional[Callable[[], bool]] = None,
+                        on_halt: Optional[Callable[[Dict[str, Any]], None]] = None) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Executes the graph as tasks of the running event loop.
+
+        Same contract as run(), with `execute` returning a coroutine.
+        """
+        self._start()
+        running: Dict[asyncio.Task, str] = {}
+
+        while self._ready or running:
+            while True:
+                taken = self._take_ready(len(running), should_stop)
+                if taken is None:
+                    break
+                name, step = taken
+                running[asyncio.ensure_future(execute(step))] = name
+            if not running:
+                break
+
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                name = running.pop(task)
+                try:
+                    result = task.result()
+                except Exception as exc:
+                    result = self._crash_result(name, exc)
+                self._complete(name, result, on_halt)
+
+        return self._results, self._success
@@ -0,0 +1,157 @@
+"""
+Run timelines.
+Steps and commands record their start and end, both wall-clock (epoch
+seconds) and monotonic, the worker that ran them and how long they waited
+in the ready queue. After a run they are exported as a Chrome trace-event
+file next to the report (open it in chrome://tracing or ui.perfetto.dev):
+one lane per worker with nested step, wait_for and command slices, queue
+waits as async slices, and counters of running and queued steps.
+"""
+import os
+import time
+import json
+from typing import Any, Dict, List, Optional
+
+# Characters of a command kept as the name of its trace slice
+MAX_SLICE_NAME = 80
+_PID = 1
+
+
+def mark(prefix: str) -> Dict[str, float]:
+    """Returns the current wall-clock and monotonic times as `<prefix>` and `<prefix>_monotonic`."""
+    return {prefix: round(time.time(), 6), f"{prefix}_monotonic": round(time.monotonic(), 6)}
+
+
+def close_span(span: Dict[str, Any], end: Optional[Dict[str, float]] = None) -> None:
+    """Gives a span its end time unless it has one already."""
+    if "end_monotonic" not in span:
+        span.update(end or mark("end"))
+
+
+def trace_file_for(report_file: str) -> str:
+    """Path of the trace of a report: pipeline_report_<ts>.json -> pipeline_trace_<ts>.json."""
+    directory, name = os.path.split(report_file)
+    return os.path.join(directory, name.replace("pipeline_report_", "pipeline_trace_", 1))
+
+
+def _us(seconds: float) -> int:
+    return int(round(seconds * 1_000_000))
+
+
+def _assign_lanes(steps: List[Dict[str, Any]]) -> Dict[int, tuple]:
+    """
+    Places every step on a lane of its worker.
+
+    Thread workers never run two steps at once; steps sharing a worker that
+    overlap (asyncio tasks on one event loop) get one lane each.
+
+    Returns:
+        dict: Index in `steps` -> (worker, lane number)
+    """
+    lane_ends: Dict[str, List[float]] = {}
+    lanes = {}
+    for index, result in sorted(enumerate(steps), key=lambda item: item[1]["timing"]["start_monotonic"]):
+        timing = result["timing"]
+        ends = lane_ends.setdefault(timing.get("worker") or "worker", [])
+        for lane, end in enumerate(ends):
+            if end <= timing["start_monotonic"]:
+                break
+        else:
+            lane = len(ends)
+            ends.append(0.0)
+        ends[lane] = timing.get("end_monotonic", timing["start_monotonic"])
+        lanes[index] = (timing.get("worker") or "worker", lane)
+    return lanes
+
+
+def build_trace(report: Dict[str, Any], origin_monotonic: float) -> Dict[str, Any]:
+    """
+    Builds the Chrome trace of a run.
+
+    Args:
+        report: Pipeline report, whose step results carry `timing`
+        origin_monotonic: Monotonic time the run started at (time 0 of the trace)
+
+    Returns:
+        dict: Trace in the JSON object format (`traceEvents`, `displayTimeUnit`, `otherData`)
+    """
+    events: List[Dict[str, Any]] = [{
+        "ph": "M", "name": "process_name", "pid": _PID, "tid": 0,
+        "args": {"name": f"Pipeline {os.path.basename(str(report.get('pipeline_file')))}"}
+    }]
+    steps = [result for result in report.get("steps") or []
+             if "start_monotonic" in (result.get("timing") or {})]
+    lanes = _assign_lanes(steps)
+    tids: Dict[tuple, int] = {}
+    # (time, +1/-1) changes of the running and queued step counts
+    running_changes, queued_changes = [], []
+
+    def ts(monotonic):
+        return _us(monotonic - origin_monotonic)
+
+    for index, result in enumerate(steps):
+        timing = result["timing"]
+        worker, lane = lanes[index]
+        if (worker, lane) not in tids:
+            tids[(worker, lane)] = len(tids) + 1
+            events.append({"ph": "M", "name": "thread_name", "pid": _PID, "tid": tids[(worker, lane)],
+                           "args": {"name": worker if lane == 0 else f"{worker} #{lane + 1}"}})
+            events.append({"ph": "M", "name": "thread_sort_index", "pid": _PID, "tid": tids[(worker, lane)],
+                           "args": {"sort_index": tids[(worker, lane)]}})
+        tid = tids[(worker, lane)]
+        start = timing["start_monotonic"]
+        end = timing.get("end_monotonic", start)
+        args = {key: result[key] for key in ("status", "duration", "cache_hit", "agent", "metrics", "error")
+                if result.get(key) is not None}
+        if "queue_wait" in timing:
+            args["queue_wait"] = f"{timing['queue_wait']:.3f}s"
+        events.append({"ph": "X", "cat": "step", "name": result["step"], "pid": _PID, "tid": tid,
+                       "ts": ts(start), "dur": _us(end - start), "args": args})
+        running_changes += [(start, 1), (end, -1)]
+
+        wait = timing.get("wait_for")
+        if wait and "start_monotonic" in wait:
+            events.append({"ph": "X", "cat": "wait", "name": "wait_for", "pid": _PID, "tid": tid,
+                           "ts": ts(wait["start_monotonic"]),
+                           "dur": _us(wait.get("end_monotonic", end) - wait["start_monotonic"]),
+                           "args": {"ready": wait.get("ready")}})
+        for command in timing.get("commands") or []:
+            name = command["command"]
+            if len(name) > MAX_SLICE_NAME:
+                name = name[:MAX_SLICE_NAME - 3] + "..."
+            events.append({"ph": "X", "cat": "command", "name": name, "pid": _PID, "tid": tid,
+                           "ts": ts(command["start_monotonic"]),
+                           "dur": _us(command.get("end_monotonic", end) - command["start_monotonic"]),
+                           "args": {"command": command["command"], "attempt": command.get("attempt"),
+                                    "exit_code": command.get("exit_code")}})
+
+        if timing.get("queue_wait") and "ready_monotonic" in timing:
+            dispatched = timing["ready_monotonic"] + timing["queue_wait"]
+            slice_id = f"queue-{index}"
+            events.append({"ph": "b", "cat": "queue", "name": f"{result['step']} (queued)", "id": slice_id,
+                           "pid": _PID, "tid": 0, "ts": ts(timing["ready_monotonic"])})
+            events.append({"ph": "e", "cat": "queue", "name": f"{result['step']} (queued)", "id": slice_id,
+                           "pid": _PID, "tid": 0, "ts": ts(dispatched)})
+            queued_changes += [(timing["ready_monotonic"], 1), (dispatched, -1)]
+
+    for name, changes in (("running steps", running_changes), ("queued steps", queued_changes)):
+        count = 0
+        # Ends before starts at the same instant, so back-to-back steps don't count twice
+        for moment, change in sorted(changes):
+            count += change
+            events.append({"ph": "C", "name": name, "pid": _PID, "tid": 0, "ts": ts(moment),
+                           "args": {"steps": count}})
+
+    return {
+        "traceEvents": events,
+        "displayTimeUnit": "ms",
+        "otherData": {key: report.get(key) for key in ("run_id", "pipeline_file", "start_time", "duration", "success")}
+    }
+
+
+def write_trace(path: str, trace: Dict[str, Any]) -> None:
+    """Writes a trace file, replacing any previous one atomically."""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(trace, f)
+    os.replace(temp_path, path)
@@ -0,0 +1,249 @@
+"""
+File watching for `--watch` mode.
+Reports the files changed under the pipeline directory, as paths relative
+to it, so they can be matched against the `paths:` and `inputs:` filters of
+steps. On Linux the kernel pushes changes through inotify; elsewhere (or
+when inotify is unavailable, e.g. out of watches) the tree is polled.
+Bursts of changes, such as an editor saving several files or a formatter
+rewriting them, are debounced into one change set.
+"""
+import os
+import time
+import errno
+import ctypes
+import struct
+import select
+import logging
+import ctypes.util
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+# Quiet period closing a change set, in seconds
+WATCH_DEBOUNCE = 0.3
+# Interval between two scans of the polling watcher, in seconds
+POLL_INTERVAL = 1.0
+# Directories never watched: written by the runner itself, tool caches and installed dependencies
+# (node_modules alone can exceed the inotify watch limit and churns on every install)
+IGNORED_DIRS = frozenset({".git", ".hg", ".svn", ".localforge", "reports", "logs", "__pycache__",
+                          ".pytest_cache", ".mypy_cache", ".tox", ".venv", "venv", "node_modules"})
+
+# inotify(7) constants
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = os.O_CLOEXEC
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+_WATCH_MASK = (_IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO
+               | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF)
+# struct inotify_event header: wd, mask, cookie, len
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def _ignored(name: str) -> bool:
+    return name in IGNORED_DIRS
+
+
+class _InotifyWatcher:
+    """Watches a directory tree with one inotify watch per directory (Linux)."""
+
+    def __init__(self, root: str):
+        """
+        Raises:
+            OSError: If inotify is unavailable or the watch limit is reached
+        """
+        libc_name = ctypes.util.find_library("c")
+        if not libc_name:
+            raise OSError(errno.ENOSYS, "libc not found")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self._libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self._libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.root = root
+        self.fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # Watch descriptor -> directory relative to the root ('' for the root)
+        self._dirs: Dict[int, str] = {}
+        try:
+            self._watch_tree("")
+        except OSError:
+            os.close(self.fd)
+            raise
+
+    def _watch_tree(self, relative: str) -> None:
+        """Watches a directory and its subdirectories."""
+        path = os.path.join(self.root, relative) if relative else self.root
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), _WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error in (errno.ENOENT, errno.ENOTDIR):
+                # Removed before we got to it
+                return
+            raise OSError(error, f"inotify_add_watch failed for {path}")
+        self._dirs[wd] = relative
+        try:
+            entries = list(os.scandir(path))
+        except OSError:
+            return
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False) and not _ignored(entry.name):
+                self._watch_tree(os.path.join(relative, entry.name) if relative else entry.name)
+
+    def read(self, timeout: float) -> Optional[Set[str]]:
+        """
+        Waits up to `timeout` seconds for changes.
+
+        Returns:
+            set: Changed paths (empty if none), or None if events were lost
+        """
+        readable, _, _ = select.select([self.fd], [], [], max(0.0, timeout))
+        if not readable:
+            return set()
+        changed: Set[str] = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                offset += length
+                if mask & _IN_Q_OVERFLOW:
+                    return None
+                if mask & _IN_IGNORED:
+                    self._dirs.pop(wd, None)
+                    continue
+                directory = self._dirs.get(wd)
+                if directory is None or not name or _ignored(name):
+                    continue
+                relative = os.path.join(directory, name) if directory else name
+                changed.add(relative.replace(os.sep, '/'))
+                if mask & _IN_ISDIR and mask & (_IN_CREATE | _IN_MOVED_TO):
+                    # New subtrees are watched, and the files already in them count as changed
+                    self._watch_tree(relative)
+                    changed.update(_tree_files(self.root, relative))
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class _PollingWatcher:
+    """Watches a directory tree by comparing modification times and sizes between scans."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self._snapshot = self._scan()
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        snapshot = {}
+        for relative in _tree_files(self.root, ""):
+            try:
+                stat = os.lstat(os.path.join(self.root, relative))
+            except OSError:
+                continue
+            snapshot[relative] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def read(self, timeout: float) -> Optional[Set[str]]:
+        """Waits up to `timeout` seconds (at most one poll interval) and returns the changed paths."""
+        time.sleep(max(0.0, min(timeout, POLL_INTERVAL)))
+        snapshot = self._scan()
+        changed = {path for path in snapshot.keys() | self._snapshot.keys()
+                   if snapshot.get(path) != self._snapshot.get(path)}
+        self._snapshot = snapshot
+        return changed
+
+    def close(self) -> None:
+        pass
+
+
+def _tree_files(root: str, relative: str) -> List[str]:
+    """Files under a directory of the tree, relative to the root, outside of ignored directories."""
+    files = []
+    for directory, subdirs, names in os.walk(os.path.join(root, relative) if relative else root):
+        subdirs[:] = [name for name in subdirs if not _ignored(name)]
+        base = os.path.relpath(directory, root)
+        for name in names:
+            files.append((name if base == os.curdir else os.path.join(base, name)).replace(os.sep, '/'))
+    return files
+
+
+class FileWatcher:
+    """Debounced change sets of a directory tree."""
+
+    def __init__(self, root: str, polling: bool = False):
+        """
+        Starts watching a directory.
+
+        Args:
+            root: Directory to watch, recursively
+            polling: Poll even where inotify is available
+        """
+        self.root = os.path.abspath(root)
+        self._watcher = None
+        if not polling:
+            try:
+                self._watcher = _InotifyWatcher(self.root)
+            except (OSError, AttributeError) as e:
+                logging.warning(f"inotify unavailable ({e}), polling {self.root} every {POLL_INTERVAL}s")
+        if self._watcher is None:
+            self._watcher = _PollingWatcher(self.root)
+
+    @property
+    def method(self) -> str:
+        return "inotify" if isinstance(self._watcher, _InotifyWatcher) else "polling"
+
+    def drain(self) -> None:
+        """Forgets the changes seen so far, e.g. the files written by the run that just finished."""
+        self._watcher.read(0)
+
+    def wait(self, debounce: float = WATCH_DEBOUNCE, timeout: Optional[float] = None,
+             should_stop: Callable[[], bool] = lambda: False) -> Optional[List[str]]:
+        """
+        Waits for changes, then until none happened for `debounce` seconds.
+
+        Args:
+            debounce: Quiet period closing the change set
+            timeout: Give up after this many seconds without any change (None: wait forever)
+            should_stop: Returns True to give up, checked at least every POLL_INTERVAL seconds
+
+        Returns:
+            list: Sorted changed paths relative to the root ([] on timeout or stop),
+                  or None if changes were lost and everything must be considered changed
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        changed: Set[str] = set()
+        while not changed:
+            remaining = POLL_INTERVAL if deadline is None else min(POLL_INTERVAL, deadline - time.monotonic())
+            if remaining <= 0 or should_stop():
+                return []
+            batch = self._watcher.read(remaining)
+            if batch is None:
+                return None
+            changed |= batch
+        while True:
+            batch = self._watcher.read(debounce)
+            if batch is None:
+                return None
+            if not batch:
+                return sorted(changed)
+            changed |= batch
+
+    def close(self) -> None:
+        self._watcher.close()
+
+    def __enter__(self) -> "FileWatcher":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -38,7 +38,10 @@ pipeline:
 
   - step: wait_for_service
     description: "Wait for Django to be ready"
-    command: python -c "import time; time.sleep(15); print('Django development server ready!')"
+    wait_for:
+      http: http://localhost:8000/
+      status: any              # the server answers, whatever the route returns
+      timeout: 90s
 
   - step: create_superuser
     description: "Create Django superuser for development"
@@ -51,10 +54,10 @@ pipeline:
 notifications:
   on_success:
     - echo "🎉 Django development environment ready!"
-    - echo "🌐 Application: http://localhost:8000"
-    - echo "👤 Admin panel: http://localhost:8000/admin (admin/admin123)"
+    - 'echo "🌐 Application: http://localhost:8000"'
+    - 'echo "👤 Admin panel: http://localhost:8000/admin (admin/admin123)"'
     - echo "🔄 Services are running in background"
-    - echo "💡 To stop: docker-compose -f {compose_file} down"
+    - 'echo "💡 To stop: docker-compose -f {compose_file} down"'
   on_failure:
     - echo "💥 Django development setup failed"
   on_always:
@@ -74,40 +77,54 @@ environment:
 parallel_steps:
   - step: code_analysis
     description: "Code quality analysis"
+    resources: [compose]
     command: docker-compose -f {compose_file} run --rm django sh -c "flake8 . --count --statistics && pylint **/*.py --fail-under=8 || echo 'Code analysis completed'"
 
-# Full testing workflow
+# Full testing workflow - steps with `needs:` start as soon as those steps succeed;
+# docker-compose steps hold the `compose` resource, so they never race on the project's containers
 pipeline:
   - step: build
     description: "Build application containers"
+    needs: [code_analysis]
+    resources: [compose]
     command: docker-compose -f {compose_file} build
     
   - step: migrate
     description: "Run database migrations"
+    resources: [compose]
     command: docker-compose -f {compose_file} run --rm django python manage.py migrate
 
   - step: collect_static
     description: "Collect static files"
+    resources: [compose]
     command: docker-compose -f {compose_file} run --rm django python manage.py collectstatic --noinput
 
   - step: deploy
     description: "Deploy Django application for testing"
+    resources: [compose]
     command: docker-compose -f {compose_file} up -d
 
   - step: wait_for_service
     description: "Wait for Django to be ready"
-    command: python -c "import time; time.sleep(15); print('Django testing server ready!')"
+    wait_for:
+      http: http://localhost:8000/
+      status: any              # the server answers, whatever the route returns
+      timeout: 90s
 
   - step: run_tests
     description: "Run Django test suite"
+    resources: [compose]
     command: docker-compose -f {compose_file} run --rm django python manage.py test --verbosity=2
 
   - step: security_scan
     description: "Security vulnerability scan"
+    needs: [build]
+    resources: [compose]
     command: docker-compose -f {compose_file} run --rm django sh -c "bandit -r . --severity-level medium --confidence-level medium --format txt && safety check --short-report || echo 'Security scan completed'"
 
   - step: collect_results
     description: "Collect test reports and logs"
+    needs: [run_tests, security_scan]
     command: python -c "import os, shutil; os.makedirs('reports', exist_ok=True); print('Test results collection completed')"
 
 cleanup:
@@ -163,8 +180,11 @@ pipeline:
 
   - step: health_monitoring
     description: "Extended health check and monitoring setup"
+    wait_for:
+      http: http://localhost:8000/
+      status: any              # the server answers, whatever the route returns
+      timeout: 2m
     commands:
-      - python -c "import time; time.sleep(20); print('Performing extended health checks...')"
       - curl -f http://localhost:8000/
       - curl -f http://localhost:8000/admin/
 
@@ -175,9 +195,9 @@ pipeline:
 notifications:
   on_success:
     - echo "🚀 Production deployment successful!"
-    - echo "🌐 Application: http://localhost:8000"
-    - echo "👤 Admin panel: http://localhost:8000/admin"
-    - echo "📊 Monitor logs: docker-compose -f {compose_file} logs -f"
+    - 'echo "🌐 Application: http://localhost:8000"'
+    - 'echo "👤 Admin panel: http://localhost:8000/admin"'
+    - 'echo "📊 Monitor logs: docker-compose -f {compose_file} logs -f"'
   on_failure:
     - echo "💥 Production deployment failed"
 """
@@ -29,7 +29,10 @@ pipeline:
 
   - step: wait_for_service
     description: "Wait for Flask to be ready"
-    command: python -c "import time; time.sleep(10); print('Flask development server ready!')"
+    wait_for:
+      http: http://localhost:8080/
+      status: any              # the server answers, whatever the route returns
+      timeout: 60s
 
   - step: health_check
     description: "Verify Flask is responding"
@@ -38,9 +41,9 @@ pipeline:
 notifications:
   on_success:
     - echo "🎉 Flask development environment ready!"
-    - echo "🌐 Application: http://localhost:8080"
+    - 'echo "🌐 Application: http://localhost:8080"'
     - echo "🔄 Services are running in background"
-    - echo "💡 To stop: docker-compose down"
+    - 'echo "💡 To stop: docker-compose down"'
   on_failure:
     - echo "💥 Flask development setup failed"
   on_always:
@@ -59,32 +62,44 @@ environment:
 parallel_steps:
   - step: code_analysis
     description: "Code quality analysis"
+    resources: [compose]
     command: docker-compose run --rm --entrypoint sh manage -c "flake8 {project_name} --count --statistics && pylint {project_name}/**/*.py --fail-under=8 || echo 'Code analysis completed'"
 
-# Full testing workflow
+# Full testing workflow - steps with `needs:` start as soon as those steps succeed;
+# docker-compose steps hold the `compose` resource, so they never race on the project's containers
 pipeline:
   - step: build
     description: "Build application containers"
+    needs: [code_analysis]
+    resources: [compose]
     command: docker-compose build
     
   - step: deploy
     description: "Deploy Flask application for testing"
+    resources: [compose]
     command: docker-compose up -d flask-dev
 
   - step: wait_for_service
     description: "Wait for Flask to be ready"
-    command: python -c "import time; time.sleep(10); print('Flask testing server ready!')"
+    wait_for:
+      http: http://localhost:8080/
+      status: any              # the server answers, whatever the route returns
+      timeout: 60s
 
   - step: run_tests
     description: "Run Flask test suite"
+    resources: [compose]
     command: docker-compose run --rm --entrypoint pytest manage --verbose
 
   - step: security_scan
     description: "Security vulnerability scan"
+    needs: [build]
+    resources: [compose]
     command: docker-compose run --rm --entrypoint sh manage -c "bandit -r {project_name} --severity-level medium --confidence-level medium --format txt && safety check --short-report || echo 'Security scan completed'"
 
   - step: collect_results
     description: "Collect test reports and logs"
+    needs: [run_tests, security_scan]
     command: python -c "import os, shutil; os.makedirs('reports', exist_ok=True); print('Test results collection completed')"
 
 cleanup:
@@ -130,8 +145,11 @@ pipeline:
 
   - step: health_monitoring
     description: "Extended health check and monitoring setup"
+    wait_for:
+      http: http://localhost:8080/
+      status: any              # the server answers, whatever the route returns
+      timeout: 90s
     commands:
-      - python -c "import time; time.sleep(15); print('Performing extended health checks...')"
       - curl -f http://localhost:8080/
       - curl -f http://localhost:8080/health || echo "Health endpoint check completed"
 
@@ -142,8 +160,8 @@ pipeline:
 notifications:
   on_success:
     - echo "🚀 Production deployment successful!"
-    - echo "🌐 Application: http://localhost:8080"
-    - echo "📊 Monitor logs: docker-compose logs -f flask-prod"
+    - 'echo "🌐 Application: http://localhost:8080"'
+    - 'echo "📊 Monitor logs: docker-compose logs -f flask-prod"'
   on_failure:
     - echo "💥 Production deployment failed"
 """
@@ -127,7 +127,10 @@ pipeline:
 
   - step: wait_for_service
     description: "Wait for service to be ready"
-    command: python -c "import time; time.sleep(10); print('Service ready for development!')"
+    wait_for:
+      http: http://localhost:3000/health
+      status: any              # the server answers, whatever the route returns
+      timeout: 60s
 
   - step: health_check
     description: "Verify service is responding"
@@ -136,9 +139,9 @@ pipeline:
 notifications:
   on_success:
     - echo "🎉 Development environment ready!"
-    - echo "🌐 Application: http://localhost:3000"
+    - 'echo "🌐 Application: http://localhost:3000"'
     - echo "🔄 Services are running in background"
-    - echo "💡 To stop: docker-compose down"
+    - 'echo "💡 To stop: docker-compose down"'
   on_failure:
     - echo "💥 Development setup failed"
   on_always:
@@ -168,7 +171,10 @@ pipeline:
 
   - step: wait_for_service
     description: "Wait for service to be ready"
-    command: python -c "import time; time.sleep(10); print('Service ready for testing!')"
+    wait_for:
+      http: http://localhost:3000/health
+      status: any              # the server answers, whatever the route returns
+      timeout: 60s
 
   - step: integration_tests
     description: "Run integration tests"
@@ -219,8 +225,11 @@ pipeline:
 
   - step: health_monitoring
     description: "Extended health check and monitoring setup"
+    wait_for:
+      http: http://localhost:3000/health
+      status: any              # the server answers, whatever the route returns
+      timeout: 90s
     commands:
-      - python -c "import time; time.sleep(15); print('Performing extended health checks...')"
       - curl -f http://localhost:3000/health
       - curl -f http://localhost:3000/api/status
 
@@ -231,8 +240,8 @@ pipeline:
 notifications:
   on_success:
     - echo "🚀 Production deployment successful!"
-    - echo "🌐 Application: http://localhost:3000"
-    - echo "📊 Monitor logs: docker-compose logs -f app"
+    - 'echo "🌐 Application: http://localhost:3000"'
+    - 'echo "📊 Monitor logs: docker-compose logs -f app"'
   on_failure:
     - echo "💥 Production deployment failed"
 """
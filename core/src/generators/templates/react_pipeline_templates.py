@@ -32,9 +32,9 @@ pipeline:
 
   - step: health_check
     description: "Check that the dev server is running"
-    commands:
-      - python -c "import time; time.sleep(5); print('Waiting for the dev server...')"
-      - curl -f http://localhost:{port} || exit 1
+    wait_for:
+      http: http://localhost:{port}
+      timeout: 2m
 
 notifications:
   on_success:
@@ -138,9 +138,9 @@ pipeline:
 
   - step: health_check
     description: "Check that the application is running"
-    commands:
-      - python -c "import time; time.sleep(10); print('Waiting for the service to be available...')"
-      - curl -f http://localhost:{port} || exit 1
+    wait_for:
+      http: http://localhost:{port}
+      timeout: 60s
 
 notifications:
   on_success:
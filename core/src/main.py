@@ -1,18 +1,63 @@
 import os
 import logging
-import yaml
 import subprocess
-import concurrent.futures
 import datetime
 import sys
 import time
 import json
+import sqlite3
 import shlex
-from typing import Callable, Dict, Any, Optional
+import signal
+import threading
+from typing import Callable, Dict, Any, List, Optional
 
 # Import centralized logging
 from core.src.utils.log_manager import setup_logging
 from core.src.cli.cli_manager import CLIManager
+from core.src.engine.distributed import AgentPool
+from core.src.engine.changes import detect_changes, step_is_affected
+from core.src.engine.cache import StepCache, keyed_env, step_inputs, CACHE_DIR
+from core.src.engine.artifacts import ArtifactStore, step_artifact_uses, step_artifacts, ARTIFACTS_DIR
+from core.src.engine.output import (OutputCapture, OutputTail, open_step_log, stream_process_output,
+                                   DEFAULT_CAPTURE_LIMIT, DEFAULT_CHUNK_SIZE)
+from core.src.engine.scheduler import StepScheduler, build_step_graph, default_max_workers
+from core.src.engine.process import INTERRUPTED_EXIT_CODE, ProcessGroupRegistry, process_group_kwargs, wait_status_exit_code
+from core.src.engine.pipeline_loader import load_pipeline
+from core.src.engine.history import HISTORY_SIZE, flake_scores, load_reports, step_durations
+from core.src.engine.run_store import RunStore, default_store_path, new_run_id
+from core.src.engine.retry import backoff_delay, retry_policy, should_retry
+from core.src.engine.readiness import wait_spec, wait_until_ready
+from core.src.engine.notifications import (NotificationDispatcher, notification_env, notification_hooks,
+                                           NOTIFICATION_FLUSH_TIMEOUT)
+from core.src.engine.limits import (LimitWatchdog, apply_cpu_limit, cpu_limit_supported, memory_watch_supported,
+                                    step_limits)
+from core.src.engine.metrics import StepUsage, UsageSampler, metrics_supported
+from core.src.engine.trace import build_trace, close_span, mark, trace_file_for, write_trace
+from core.src.engine.checkpoint import CHECKPOINT_DIR, COMPLETED_STATUSES, RunCheckpoint, pipeline_digest
+from core.src.engine.watch import FileWatcher, WATCH_DEBOUNCE
+
+
+def _command_argv(command: str) -> Optional[List[str]]:
+    """
+    Returns the argument list of a command that can run without a shell.
+
+    Args:
+        command: Command string to execute
+
+    Returns:
+        list: Arguments for exec, or None if the command needs a shell
+    """
+    # Commands with pipes, redirects, variable expansion, etc. need shell=True
+    if any(char in command for char in ['|', '>', '<', '&', ';', '&&', '||', '`', '$']):
+        return None
+    # On Windows, we still need shell=True for many commands
+    if os.name == 'nt':
+        return None
+    try:
+        return shlex.split(command)
+    except ValueError:
+        # If splitting fails, fall back to shell=True
+        return None
 
 
 def _execute_command_safe(command: str, env: Dict[str, str], **kwargs) -> subprocess.Popen:
@@ -27,51 +72,96 @@ def _execute_command_safe(command: str, env: Dict[str, str], **kwargs) -> subpro
     Returns:
         subprocess.Popen: Process object
     """
-    # Try to parse simple commands without shell=True
-    try:
-        # For simple commands (single command without pipes, redirects, etc.)
-        # we can try to avoid shell=True
-        if not any(char in command for char in ['|', '>', '<', '&', ';', '&&', '||', '`', '$(']):
-            # Simple command, try to split it safely
-            if os.name == 'nt':  # Windows
-                # On Windows, we still need shell=True for many commands
-                # but we can add timeout to prevent hanging
-                kwargs['shell'] = True
-            else:  # Unix-like systems
-                # Try to split the command
-                try:
-                    cmd_list = shlex.split(command)
-                    kwargs.pop('shell', None)  # Remove shell=True
-                    return subprocess.Popen(cmd_list, env=env, **kwargs)
-                except (ValueError, OSError):
-                    # If splitting fails, fall back to shell=True
-                    kwargs['shell'] = True
-        else:
-            # Complex command with pipes/redirects, need shell=True
-            kwargs['shell'] = True
-            
-        return subprocess.Popen(command, env=env, **kwargs)
-        
-    except Exception:
-        # If anything fails, fall back to the original approach
-        kwargs['shell'] = True
-        return subprocess.Popen(command, env=env, **kwargs)
+    # Try to run simple commands without shell=True
+    cmd_list = _command_argv(command)
+    if cmd_list:
+        try:
+            kwargs.pop('shell', None)  # Remove shell=True
+            return subprocess.Popen(cmd_list, env=env, **kwargs)
+        except OSError:
+            # If the program can't be started directly, let the shell try
+            pass
+    kwargs['shell'] = True
+    return subprocess.Popen(command, env=env, **kwargs)
+
+
+def _step_commands(step: Dict[str, Any]) -> Optional[List[str]]:
+    """Returns the commands of a step - support for both formats - or None if it has none."""
+    if 'commands' in step:
+        # New format: list of commands
+        return step['commands'] if isinstance(step['commands'], list) else [step['commands']]
+    if 'command' in step:
+        # Legacy format: single command
+        return [step['command']]
+    return None
 
 
 class PipelineRunner:
-    """Encapsulates the logic to execute a CI/CD pipeline."""
+    """
+    Encapsulates the logic to execute a CI/CD pipeline.
+
+    A runner never changes process-wide state such as the working directory,
+    so several runners (one per pipeline) can execute concurrently from threads.
+    """
     
-    def __init__(self, progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None):
+    def __init__(self, progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 max_captured_output: int = DEFAULT_CAPTURE_LIMIT,
+                 output_chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 use_cache: bool = True,
+                 agent_pool=None,
+                 collect_metrics: bool = False,
+                 run_store: Optional[RunStore] = None):
         """
         Initializes the runner.
 
         Args:
             progress_callback: An optional function to call to report progress.
                               It should accept a dictionary with event details.
+            max_captured_output: Characters of stdout/stderr kept per step for the report
+                                 (the beginning and the end; the full output is in the step log)
+            output_chunk_size: Maximum size of each streamed `step_output` chunk
+            use_cache: Replay results of steps whose declared `inputs:` are unchanged
+            agent_pool: Optional AgentPool; when given, steps run on connected agents
+            collect_metrics: Sample the CPU, memory and I/O usage of every step (Linux only)
+            run_store: RunStore recording the runs; by default the one at default_store_path()
         """
         self.progress_callback = progress_callback
+        self.max_captured_output = max_captured_output
+        self.output_chunk_size = output_chunk_size
+        self.use_cache = use_cache
+        self.agent_pool = agent_pool
+        self.collect_metrics = collect_metrics and metrics_supported()
+        if collect_metrics and not self.collect_metrics:
+            logging.warning("Step metrics need /proc and are not collected on this platform")
+        self.run_store = run_store
+        # Store of the runs: run_store, or the default one once a run opened it
+        self.store = None
+        self.step_cache = None
+        self.artifact_store = None
+        self.checkpoint = None
+        # Results of the steps completed by the run being resumed, by step name
+        self.resumed_results = {}
+        # Step results of the recent runs of the current pipeline, loaded once per run (see _load_history)
+        self.history = []
+        self.pipeline_dir = None
+        self.run_id = None
+        # Wall-clock and monotonic start of the current run (see trace.mark)
+        self.run_started = None
+        # Directory of the step log files of the current run
+        self.log_dir = None
+        self.changed_files = None
+        # Set while watching: `inputs:` filter steps too, and parsed pipelines are reused
+        self.watching = False
+        self.parsed_pipelines = {}
         self.stop_requested = False
-        self.current_process = None
+        # Set when Ctrl+C stopped the run
+        self.interrupted = False
+        self.halted = False
+        # Process groups of the commands currently running, one per running step
+        self.processes = ProcessGroupRegistry()
+        self.watchdog = LimitWatchdog()
+        self.sampler = UsageSampler()
+        self.notifier = NotificationDispatcher()
         
     def _emit_progress(self, event_data: Dict[str, Any]):
         """Calls the progress callback if defined."""
@@ -85,28 +175,300 @@ class PipelineRunner:
         """Requests stopping the running pipeline."""
         logging.info("Pipeline stop requested")
         self.stop_requested = True
-        
-        # Terminate current process if it exists
-        if self.current_process and self.current_process.poll() is None:
-            try:
-                logging.info("Terminating current process...")
-                self.current_process.terminate()
-                # Give a moment for clean termination
-                try:
-                    self.current_process.wait(timeout=5)
-                except subprocess.TimeoutExpired:
-                    # If it doesn't terminate cleanly, force termination
-                    logging.warning("Forcing process termination...")
-                    self.current_process.kill()
-                    self.current_process.wait()
-            except Exception as e:
-                logging.error(f"Error terminating process: {e}")
-        
+        self._terminate_running()
         self._emit_progress({"event": "pipeline_stopped", "reason": "User requested stop"})
 
+    def _on_interrupt(self, signum, frame):
+        """
+        SIGINT handler of a run in the main thread.
+
+        Steps run in their own sessions, so the terminal's Ctrl+C doesn't reach
+        them: the first one stops the run like stop() (the report and the
+        checkpoint are still written), a second one interrupts at once.
+        """
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        self.interrupted = True
+        # stop() logs, prints and calls the progress callback: not from a signal handler
+        threading.Thread(target=self._interrupt, name="interrupt", daemon=True).start()
+
+    def _interrupt(self):
+        print("Interrupted, stopping the running steps (Ctrl+C again to quit at once)")
+        self.stop()
+
+    def _terminate_running(self):
+        """Terminates the process trees of every running step (SIGTERM, then SIGKILL after a grace period)."""
+        if self.agent_pool:
+            self.agent_pool.stop_all()
+        self.processes.terminate_all()
+
+    def _cancelling(self, is_cleanup: bool) -> bool:
+        """Tells whether running steps are being cancelled by a stop request or a failed sibling."""
+        return (self.stop_requested or self.halted) and not is_cleanup
+
     def execute_step(self, step: Dict[str, Any], env_vars: Optional[Dict[str, str]] = None, is_cleanup: bool = False) -> Dict[str, Any]:
         """Executes an individual pipeline step."""
+        started = mark("start")
+        return self._step_done(self._execute_step(step, env_vars, is_cleanup), started, is_cleanup)
+
+    def _execute_step(self, step: Dict[str, Any], env_vars: Optional[Dict[str, str]], is_cleanup: bool) -> Dict[str, Any]:
+        if self.agent_pool:
+            return self._execute_remote(step, env_vars, is_cleanup)
+
+        run = self._begin_step(step, env_vars, is_cleanup)
+        if "result" in run:
+            return run["result"]
+        if run["wait_for"] and not self._wait_for_ready(run):
+            return self._step_cancelled(run) if self._cancelling(is_cleanup) else self._step_limit_exceeded(run)
+
+        # Each iteration is one attempt; only steps with a retry policy loop
+        while True:
+            try:
+                # Execute each command sequentially
+                for i, command in enumerate(run["commands"]):
+                    # Check if stop was requested (except for cleanup steps)
+                    if self._cancelling(is_cleanup):
+                        return self._step_cancelled(run)
+                    if self._deadline_passed(run):
+                        return self._step_limit_exceeded(run)
+
+                    on_chunk, command_stderr = self._begin_command(run, i, command)
+                    return_code = self._run_command(run, command, on_chunk)
+                    self._check_return_code(run, i, command, return_code, command_stderr)
+
+                return self._step_succeeded(run)
+            except subprocess.CalledProcessError as e:
+                # A command killed by fail-fast or a stop request is cancelled, not failed
+                if self._cancelling(is_cleanup):
+                    return self._step_cancelled(run)
+                if self._limit_exceeded(run, e.returncode):
+                    return self._step_limit_exceeded(run)
+                delay = self._retry_delay(run, e)
+                if delay is None:
+                    return self._step_failed(run, e)
+                if not self._wait_before_retry(delay, is_cleanup):
+                    return self._step_cancelled(run)
+            except Exception as e:
+                return self._step_crashed(run, e)
+
+    def _worker_name(self) -> str:
+        """Name of the worker running the current step, recorded in its timing."""
+        return threading.current_thread().name
+
+    def _step_done(self, result: Dict[str, Any], started: Dict[str, float], is_cleanup: bool) -> Dict[str, Any]:
+        """
+        Completes and checkpoints the result of a step.
+
+        A result that didn't come from a local execution (skipped, cached,
+        remote...) gets the start and end of the call as its timing. The
+        timing an agent measured is on its own monotonic clock: it is kept as
+        `remote_timing`, the run's timeline uses the coordinator's.
+        """
+        if result.get("agent") and "timing" in result:
+            result["remote_timing"] = result.pop("timing")
+        if "timing" not in result:
+            worker = f"agent {result['agent']}" if result.get("agent") else self._worker_name()
+            result["timing"] = dict(started, **mark("end"), worker=worker)
+        if self.checkpoint and not is_cleanup and not result.get("resumed"):
+            self.checkpoint.record(result)
+        return result
+
+    def _wait_for_ready(self, run: Dict[str, Any]) -> bool:
+        """
+        Polls the `wait_for:` targets of a step until they are ready.
+
+        Returns:
+            bool: True when ready; False when the wait timed out (recorded as the
+                  step's exceeded limit) or the step was cancelled
+        """
+        spec = run["wait_for"]
+        span = run["timing"]["wait_for"] = mark("start")
+        timeout = run["limits"].get("timeout")
+        deadline = run["start_time"] + timeout if timeout is not None else None
+        ready, message = wait_until_ready(
+            spec, run["cwd"], env=run["env"],
+            should_stop=lambda: self._cancelling(run["is_cleanup"]),
+            on_progress=lambda text: self._step_message(run, text),
+            deadline=deadline
+        )
+        close_span(span)
+        span["ready"] = ready
+        self._step_message(run, message)
+        if not ready:
+            run["limit_exceeded"] = ("timeout", message)
+        return ready
+
+    def _step_message(self, run: Dict[str, Any], text: str):
+        """Adds a line produced by the runner itself to a step's output."""
+        run["stdout"].append(text + "\n")
+        if run["log"]:
+            run["log"].write(text + "\n")
+        logging.info(f"[{run['name']}] {text}")
+        self._emit_progress({"event": "step_output", "step": run["name"], "output": text, "stream": "stdout"})
+
+    def _retry_delay(self, run: Dict[str, Any], e: subprocess.CalledProcessError) -> Optional[float]:
+        """
+        Records a failed attempt and decides whether the step runs again.
+
+        Returns:
+            float: Seconds to wait before the next attempt, or None if the step fails
+        """
+        policy = run["retry"]
+        if not policy:
+            return None
+        attempt = len(run["attempts"]) + 1
+        self._record_attempt(run, "error", e.returncode)
+        if not should_retry(policy, attempt, e.returncode):
+            return None
+
+        delay = backoff_delay(policy, attempt)
+        logging.warning(f"Step {run['name']} failed with code {e.returncode} "
+                        f"(attempt {attempt}/{policy['attempts']}), retrying in {delay:g}s")
+        self._emit_progress({"event": "step_retry", "step": run["name"], "attempt": attempt + 1,
+                             "attempts": policy["attempts"], "exit_code": e.returncode, "delay": delay})
+        # The next attempt starts with fresh output; the log keeps every attempt
+        run["stdout"] = OutputCapture(self.max_captured_output)
+        run["stderr"] = OutputCapture(self.max_captured_output)
+        if run["log"]:
+            run["log"].write(f">>> Attempt {attempt + 1}/{policy['attempts']} in {delay:g}s "
+                             f"(exit code {e.returncode})\n")
+        run["attempt_start"] = time.time() + delay
+        return delay
+
+    def _wait_before_retry(self, delay: float, is_cleanup: bool) -> bool:
+        """Waits for a retry backoff. Returns False if the step was cancelled meanwhile."""
+        end = time.time() + delay
+        while not self._cancelling(is_cleanup) and time.time() < end:
+            time.sleep(min(0.1, end - time.time()))
+        return not self._cancelling(is_cleanup)
+
+    @staticmethod
+    def _record_attempt(run: Dict[str, Any], status: str, exit_code: Optional[int] = None):
+        """Appends the outcome of the current attempt to the run."""
+        attempt = {
+            "attempt": len(run["attempts"]) + 1,
+            "status": status,
+            "exit_code": exit_code,
+            "duration": f"{time.time() - run['attempt_start']:.2f}s"
+        }
+        if status != "success":
+            attempt["error"] = run["stderr"].getvalue().strip()[-500:] or None
+        run["attempts"].append(attempt)
+
+    def _execute_remote(self, step: Dict[str, Any], env_vars: Optional[Dict[str, str]], is_cleanup: bool) -> Dict[str, Any]:
+        """Executes a step on an agent of the pool, relaying its progress events."""
+        skipped = self._skip_result(step, is_cleanup)
+        if skipped:
+            return skipped
+        if self._cancelling(is_cleanup):
+            self._emit_progress({"event": "step_cancelled", "step": step['step'], "reason": "Stop requested"})
+            return {"step": step['step'], "status": "cancelled", "duration": "0.00s",
+                    "output": None, "error": "Cancelled by stop request"}
+        if step.get('artifacts') or step.get('uses_artifacts'):
+            logging.warning(f"Artifacts of step {step['step']} are not transferred to or from agents")
+        return self.agent_pool.run_step(step, env_vars, self.pipeline_dir, self._emit_progress, is_cleanup=is_cleanup,
+                                        should_stop=lambda: self._cancelling(is_cleanup))
+
+    def _run_command(self, run: Dict[str, Any], command: str, on_chunk: Callable[[str, str], None]) -> int:
+        """Runs one command of a step, streaming its output, and returns its exit code."""
+        # Use Popen with binary pipes so output can be streamed as it is produced;
+        # each command leads its own process group so its whole tree can be stopped
+        process = _execute_command_safe(
+            command,
+            run["env"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            bufsize=0,
+            cwd=run["cwd"],
+            **process_group_kwargs()
+        )
+        apply_cpu_limit(process.pid, run["limits"])
+        self.processes.add(process.pid)
+        self._watch_limits(run, process.pid)
+        self._watch_usage(run, process.pid)
+        rusage = None
+        try:
+            # A stop may have been requested while the process was starting
+            if self._cancelling(run["is_cleanup"]):
+                self.processes.terminate_all()
+            stream_process_output(process, on_chunk, chunk_size=self.output_chunk_size)
+            if not run["usage"]:
+                return process.wait()
+            # Reaping with wait4() gives the exact CPU, I/O and context switches of the command
+            _, status, rusage = os.wait4(process.pid, 0)
+            process.returncode = wait_status_exit_code(status)
+            return process.returncode
+        finally:
+            self.watchdog.unwatch(process.pid)
+            self.processes.discard(process.pid)
+            self._unwatch_usage(run, process.pid, rusage)
+
+    def _watch_limits(self, run: Dict[str, Any], pid: int):
+        """Lets the watchdog terminate a command's process group when the step exceeds its timeout or memory limit."""
+        limits = run["limits"]
+        deadline = run["start_time"] + limits["timeout"] if "timeout" in limits else None
+
+        def on_exceeded(status, message):
+            if status == "timeout":
+                message = f"Step timed out after {limits['timeout']:g}s"
+            run["limit_exceeded"] = (status, message)
+
+        self.watchdog.watch(pid, deadline, limits.get("max_memory"), on_exceeded)
+
+    def _watch_usage(self, run: Dict[str, Any], pid: int):
+        """Samples the resource usage of a command's process group, reporting it live every few seconds."""
+        if not run["usage"]:
+            return
+
+        def on_sample(usage):
+            if usage.due_report():
+                self._emit_progress({"event": "step_metrics", "step": run["name"],
+                                     "metrics": usage.summary(time.time() - run["start_time"])})
+
+        self.sampler.watch(pid, run["usage"], on_sample)
+
+    def _unwatch_usage(self, run: Dict[str, Any], pid: int, rusage=None):
+        """Stops sampling a finished command and adds its usage to the step."""
+        if run["usage"]:
+            self.sampler.unwatch(pid)
+            run["usage"].finish_command(pid, rusage)
+
+    def _deadline_passed(self, run: Dict[str, Any]) -> bool:
+        """Tells whether a step ran out of time between two commands."""
+        timeout = run["limits"].get("timeout")
+        if timeout is not None and time.time() - run["start_time"] >= timeout:
+            run["limit_exceeded"] = ("timeout", f"Step timed out after {timeout:g}s")
+            return True
+        return False
+
+    @staticmethod
+    def _limit_exceeded(run: Dict[str, Any], return_code: int) -> bool:
+        """Tells whether a failed command was stopped by one of the step limits."""
+        if run["limit_exceeded"]:
+            return True
+        max_cpu_time = run["limits"].get("max_cpu_time")
+        if max_cpu_time is not None and hasattr(signal, 'SIGXCPU'):
+            # Killed by RLIMIT_CPU: SIGXCPU at the soft limit, SIGKILL at the hard one
+            # (shells report signals as 128 + signal number)
+            cpu_signals = (signal.SIGXCPU, signal.SIGKILL)
+            if -return_code in cpu_signals or return_code - 128 in cpu_signals:
+                run["limit_exceeded"] = ("resource_exceeded", f"Step exceeded its CPU time limit of {max_cpu_time:g}s")
+                return True
+        return False
+
+    def _begin_step(self, step: Dict[str, Any], env_vars: Optional[Dict[str, str]], is_cleanup: bool) -> Dict[str, Any]:
+        """
+        Prepares the execution of a step.
+
+        Returns:
+            dict: Run state of the step. Contains a final `result` when the step
+                  doesn't need to run (skipped, cached or invalid).
+        """
         step_name = step['step']
+
+        skipped = self._skip_result(step, is_cleanup)
+        if skipped:
+            return {"result": skipped}
+
         logging.info(f"Executing step: {step_name}")
         print(f"Executing step: {step_name}")
         self._emit_progress({"event": "step_start", "step": step_name})
@@ -114,261 +476,811 @@ class PipelineRunner:
         env = os.environ.copy()
         if env_vars:
             env.update(env_vars)
+        # Step-level variables (including matrix parameters) win over global ones
+        if step.get('env'):
+            env.update({str(key): str(value) for key, value in step['env'].items()})
+
+        commands = _step_commands(step)
+        if commands is None and not step.get('wait_for'):
+            error_msg = f"Step {step_name} has no 'command', 'commands' or 'wait_for' defined"
+            return self._setup_failed(step_name, error_msg)
+        commands = commands or []
 
-        start_time = time.time()
-        
-        # Determine the commands to execute - support for both formats
-        commands = []
-        if 'commands' in step:
-            # New format: list of commands
-            commands = step['commands'] if isinstance(step['commands'], list) else [step['commands']]
-        elif 'command' in step:
-            # Legacy format: single command
-            commands = [step['command']]
-        else:
-            error_msg = f"Step {step_name} has no 'command' or 'commands' defined"
-            logging.error(error_msg)
-            self._emit_progress({"event": "step_failure", "step": step_name, "error": error_msg})
-            return {
-                "step": step_name,
-                "status": "error",
-                "duration": "0.00s",
-                "output": None,
-                "error": error_msg            }            # Execute each command sequentially
-        all_stdout = []
-        all_stderr = []
-        
         try:
-            for i, command in enumerate(commands):                # Check if stop was requested (except for cleanup steps)
-                if self.stop_requested and not is_cleanup:
-                    logging.info(f"Stop requested, cancelling step {step_name}")
-                    self._emit_progress({"event": "step_cancelled", "step": step_name, "reason": "Stop requested"})
-                    return {
-                        "step": step_name,
-                        "status": "cancelled",
-                        "duration": f"{time.time() - start_time:.2f}s",
-                        "output": None,                        "error": "Cancelled by stop request"
-                    }
-                
-                if len(commands) > 1:
-                    logging.info(f"Executing command {i+1}/{len(commands)}: {command}")
-                    self._emit_progress({"event": "step_output", "step": step_name, "output": f">>> Command {i+1}/{len(commands)}: {command}"})
-
-                # Use Popen to capture output in real-time
-                process = _execute_command_safe(
-                    command,
-                    env,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True,
-                    bufsize=1, # Line-buffered
-                    universal_newlines=True,
-                    encoding='utf-8',
-                    errors='replace'  # Replace problematic characters instead of failing
-                )
-                  # Save reference to current process
-                self.current_process = process
-
-                # Read stdout and stderr
-                stdout, stderr = process.communicate()
-                return_code = process.returncode
-                
-                # Clear process reference
-                self.current_process = None
-
-                if stdout:
-                    all_stdout.append(stdout.strip())
-                    logging.info(f"Command {i+1} output in {step_name}:\n{stdout}")
-                    self._emit_progress({"event": "step_output", "step": step_name, "output": stdout})
-
-                if return_code != 0:
-                    if stderr:
-                        all_stderr.append(stderr.strip())
-                        logging.error(f"Error in command {i+1} of {step_name}:\n{stderr}")
-                        self._emit_progress({"event": "step_error", "step": step_name, "error": stderr})
-
-                    # Throw exception to be caught below
-                    raise subprocess.CalledProcessError(return_code, command, output=stdout, stderr=stderr)
-
-            # If we get here, all commands executed successfully
-            duration = time.time() - start_time
-            combined_stdout = '\n'.join(all_stdout) if all_stdout else None
-            
-            logging.info(f"Step {step_name} completed successfully in {duration:.2f} seconds.")
-            self._emit_progress({"event": "step_success", "step": step_name, "duration": f"{duration:.2f}s"})
-
-            return {
-                "step": step_name,
-                "status": "success",
-                "duration": f"{duration:.2f}s",
-                "output": combined_stdout,
-                "error": None
-            }
-
-        except subprocess.CalledProcessError as e:
-            duration = time.time() - start_time
-            combined_stderr = '\n'.join(all_stderr) if all_stderr else str(e)
-            combined_stdout = '\n'.join(all_stdout) if all_stdout else None
-            
-            error_msg = f"Error executing step {step_name} (code: {e.returncode}): {e}"
-            logging.error(error_msg)
-            self._emit_progress({
-                "event": "step_failure",
-                "step": step_name,
-                "duration": f"{duration:.2f}s",
-                "error": combined_stderr
-            })
-
-            return {
-                "step": step_name,
-                "status": "error",
-                "duration": f"{duration:.2f}s",
-                "output": combined_stdout,
-                "error": combined_stderr
-            }
-        except Exception as e:
-            duration = time.time() - start_time
-            error_msg = f"Unexpected error executing step {step_name}: {e}"
-            logging.error(error_msg)
-            self._emit_progress({
-                "event": "step_failure",
-                "step": step_name,
-                "duration": f"{duration:.2f}s",
-                "error": str(e)
-            })
-            return {
-                "step": step_name,
-                "status": "error",
-                "duration": f"{duration:.2f}s",
-                "output": None,
-                "error": str(e)
-            }
-
-    def execute_pipeline(self, pipeline_file: str, parallel: bool = False, env_vars: Optional[Dict[str, str]] = None, continue_on_error: bool = False) -> bool:
-        """Executes the complete pipeline."""
+            wait_for = wait_spec(step)
+            limits = step_limits(step)
+            retry = retry_policy(step)
+            artifacts = step_artifacts(step)
+            artifact_uses = step_artifact_uses(step)
+        except ValueError as e:
+            error_msg = f"Step {step_name} has an invalid setting: {e}"
+            return self._setup_failed(step_name, error_msg)
+        base_dir = self.pipeline_dir or os.getcwd()
+        cwd = os.path.normpath(os.path.join(base_dir, str(step.get('working_directory') or '.')))
+        if not os.path.isdir(cwd):
+            error_msg = f"Working directory of step {step_name} does not exist: {cwd}"
+            return self._setup_failed(step_name, error_msg)
+        if "max_memory" in limits and not memory_watch_supported():
+            logging.warning(f"max_memory of step {step_name} is not enforced on this platform")
+        if "max_cpu_time" in limits and not cpu_limit_supported():
+            logging.warning(f"max_cpu_time of step {step_name} is not enforced on this platform")
+        if (artifacts or artifact_uses) and not self.artifact_store:
+            logging.warning(f"Artifacts of step {step_name} are ignored outside of a pipeline run")
+            artifacts, artifact_uses = {}, {}
+
+        # Inputs from earlier steps are in place before the step (and its cache key) looks at files
+        if artifact_uses:
+            try:
+                placed = self.artifact_store.restore(step_name, artifact_uses, cwd)
+            except (OSError, ValueError) as e:
+                return self._setup_failed(step_name, f"Could not place the artifacts of step {step_name}: {e}")
+            self._emit_progress({"event": "artifacts_restored", "step": step_name,
+                                 "artifacts": {name: details["path"] for name, details in placed.items()}})
+
+        # Replay a previous successful result if the declared inputs are unchanged
+        cache_key = None
+        if self.step_cache and step_inputs(step) and step.get('cache', True) and not is_cleanup:
+            try:
+                cache_key = self.step_cache.compute_key(step, commands, keyed_env(step, env_vars, env), base_dir)
+                cached = self.step_cache.load(cache_key)
+            except Exception as e:
+                logging.warning(f"Could not compute cache key for step {step_name}: {e}")
+                cache_key, cached = None, None
+            stored = None
+            if cached and artifacts:
+                try:
+                    stored = self._store_artifacts(step_name, artifacts, cwd)
+                except (OSError, ValueError) as e:
+                    # The outputs are gone from the workspace, run the step to produce them again
+                    logging.info(f"Not replaying step {step_name}: {e}")
+                    cached = None
+            if cached:
+                result = self._replay_cached_result(step_name, cached, cache_key)
+                if stored:
+                    result["artifacts"] = stored
+                return {"result": result}
+
+        started = mark("start")
+        start_time = started["start"]
+        return {
+            "name": step_name,
+            "step": step,
+            "commands": commands,
+            "env": env,
+            "cwd": cwd,
+            "cache_key": cache_key,
+            "is_cleanup": is_cleanup,
+            "limits": limits,
+            "limit_exceeded": None,
+            "retry": retry,
+            "wait_for": wait_for,
+            "artifacts": artifacts,
+            "attempts": [],
+            "start_time": start_time,
+            "attempt_start": start_time,
+            "stdout": OutputCapture(self.max_captured_output),
+            "stderr": OutputCapture(self.max_captured_output),
+            # Full output of the step, the captures above only keep its beginning and end
+            "log": open_step_log(self.log_dir, step_name),
+            "usage": StepUsage() if self.collect_metrics else None,
+            "timing": dict(started, worker=self._worker_name(), commands=[])
+        }
+
+    def _setup_failed(self, step_name: str, error_msg: str) -> Dict[str, Any]:
+        """Run state of a step that can't start, with its error result."""
+        logging.error(error_msg)
+        self._emit_progress({"event": "step_failure", "step": step_name, "error": error_msg})
+        return {"result": {
+            "step": step_name,
+            "status": "error",
+            "duration": "0.00s",
+            "output": None,
+            "error": error_msg
+        }}
+
+    def _store_artifacts(self, step_name: str, artifacts: Dict[str, str], cwd: str) -> Dict[str, Any]:
+        """
+        Collects the artifacts a step produced into the run's store.
+
+        Returns:
+            dict: Name -> stored artifact details, for the step result
+
+        Raises:
+            ValueError: If an artifact is missing
+            OSError: If an artifact can't be stored
+        """
+        stored = self.artifact_store.collect(step_name, artifacts, cwd)
+        self._emit_progress({"event": "artifacts_stored", "step": step_name,
+                             "artifacts": {name: details["files"] for name, details in stored.items()}})
+        return {name: {key: value for key, value in details.items() if key not in ("source", "step")}
+                for name, details in stored.items()}
+
+    def _skip_result(self, step: Dict[str, Any], is_cleanup: bool) -> Optional[Dict[str, Any]]:
+        """
+        Result of a step that doesn't run: completed by the run being resumed, or with
+        a `paths:` filter matching none of the changed files. None if it must run.
+        """
+        if is_cleanup:
+            return None
+        step_name = step['step']
+        completed = self.resumed_results.get(step_name)
+        if completed and self._adopt_artifacts(step):
+            logging.info(f"Skipping step {step_name}: completed before the run was resumed")
+            event = "step_skipped" if completed["status"] == "skipped" else "step_success"
+            self._emit_progress({"event": event, "step": step_name, "duration": completed.get("duration"),
+                                 "resumed": True, "reason": "Completed before the run was resumed"})
+            # The timing belongs to the first attempt (and its monotonic clock)
+            result = {key: value for key, value in completed.items() if key != "timing"}
+            result["resumed"] = True
+            return result
+        if step_is_affected(step, self.changed_files, include_inputs=self.watching):
+            return None
+        if not self._adopt_artifacts(step, earlier_run=True):
+            return None
+        logging.info(f"Skipping step {step_name}: no changes match its paths filter")
+        self._emit_progress({"event": "step_skipped", "step": step_name, "reason": "No matching changes"})
+        return {
+            "step": step_name,
+            "status": "skipped",
+            "duration": "0.00s",
+            "output": None,
+            "error": None
+        }
+
+    def _begin_command(self, run: Dict[str, Any], index: int, command: str):
+        """
+        Announces a command and builds the handler for its output.
+
+        Returns:
+            tuple: (chunk handler, OutputTail collecting the command's stderr)
+        """
+        step_name = run["name"]
+        commands = run["commands"]
+        log = run["log"]
+        run["timing"]["commands"].append(dict(mark("start"), command=command, attempt=len(run["attempts"]) + 1))
+        if len(commands) > 1:
+            logging.info(f"Executing command {index+1}/{len(commands)}: {command}")
+            self._emit_progress({"event": "step_output", "step": step_name, "output": f">>> Command {index+1}/{len(commands)}: {command}"})
+            if log:
+                log.write(f">>> Command {index+1}/{len(commands)}: {command}\n")
+
+        # Stream stdout and stderr in bounded chunks to the step log, keeping only
+        # the beginning and the end in memory
+        command_stderr = OutputTail(self.max_captured_output)
+
+        def on_chunk(stream, text):
+            if log:
+                log.write(text + "\n")
+            if stream == "stderr":
+                run["stderr"].append(text + "\n")
+                command_stderr.append(text + "\n")
+            else:
+                run["stdout"].append(text + "\n")
+            logging.debug(f"[{step_name}] {stream}: {text}")
+            self._emit_progress({"event": "step_output", "step": step_name, "output": text, "stream": stream})
+
+        return on_chunk, command_stderr
+
+    def _check_return_code(self, run: Dict[str, Any], index: int, command: str, return_code: int, command_stderr: OutputTail):
+        """Raises CalledProcessError if a command failed."""
+        span = run["timing"]["commands"][-1]
+        close_span(span)
+        span["exit_code"] = return_code
+        if return_code != 0:
+            stderr = command_stderr.getvalue()
+            if stderr:
+                logging.error(f"Error in command {index+1} of {run['name']}:\n{stderr}")
+                self._emit_progress({"event": "step_error", "step": run["name"], "error": stderr})
+
+            # Throw exception to be caught by the caller
+            raise subprocess.CalledProcessError(return_code, command, stderr=stderr)
+
+    def _step_cancelled(self, run: Dict[str, Any]) -> Dict[str, Any]:
+        """Result of a step cancelled by a stop request."""
+        step_name = run["name"]
+        logging.info(f"Stop requested, cancelling step {step_name}")
+        log_details = self._finish_step(run)
+        self._emit_progress({"event": "step_cancelled", "step": step_name, "reason": "Stop requested", **log_details})
+        return {
+            "step": step_name,
+            "status": "cancelled",
+            "duration": f"{time.time() - run['start_time']:.2f}s",
+            "output": None,
+            "error": "Cancelled by stop request",
+            **log_details
+        }
+
+    def _step_succeeded(self, run: Dict[str, Any]) -> Dict[str, Any]:
+        """Result of a step whose commands all executed successfully."""
+        step_name = run["name"]
+        stored = None
+        if run["artifacts"]:
+            try:
+                stored = self._store_artifacts(step_name, run["artifacts"], run["cwd"])
+            except (OSError, ValueError) as e:
+                return self._step_crashed(run, e)
+        duration = time.time() - run["start_time"]
+        combined_stdout = run["stdout"].getvalue().strip() or None
+
+        flaky = any(attempt["status"] != "success" for attempt in run["attempts"])
+        if run["retry"]:
+            self._record_attempt(run, "success", 0)
+
+        logging.info(f"Step {step_name} completed successfully in {duration:.2f} seconds.")
+        log_details = self._finish_step(run)
+        event = {"event": "step_success", "step": step_name, "duration": f"{duration:.2f}s", **log_details}
+        if flaky:
+            logging.warning(f"Step {step_name} only passed on attempt {len(run['attempts'])}, it may be flaky")
+            event["attempts"] = len(run["attempts"])
+        self._emit_progress(event)
+
+        result = {
+            "step": step_name,
+            "status": "success",
+            "duration": f"{duration:.2f}s",
+            "output": combined_stdout,
+            "error": None,
+            **log_details
+        }
+        if stored:
+            result["artifacts"] = stored
+        if run["retry"]:
+            result["attempts"] = run["attempts"]
+            result["flaky"] = flaky
+        if run["cache_key"]:
+            result["cache_hit"] = False
+            self.step_cache.store(run["cache_key"], result)
+        return result
+
+    def _step_failed(self, run: Dict[str, Any], e: subprocess.CalledProcessError) -> Dict[str, Any]:
+        """Result of a step with a failing command."""
+        step_name = run["name"]
+        duration = time.time() - run["start_time"]
+        combined_stderr = run["stderr"].getvalue().strip() or str(e)
+        combined_stdout = run["stdout"].getvalue().strip() or None
+
+        error_msg = f"Error executing step {step_name} (code: {e.returncode}): {e}"
+        logging.error(error_msg)
+        log_details = self._finish_step(run)
+        self._emit_progress({
+            "event": "step_failure",
+            "step": step_name,
+            "duration": f"{duration:.2f}s",
+            "error": combined_stderr,
+            **log_details
+        })
+
+        result = {
+            "step": step_name,
+            "status": "error",
+            "duration": f"{duration:.2f}s",
+            "output": combined_stdout,
+            "error": combined_stderr,
+            **log_details
+        }
+        return self._with_run_details(run, result)
+
+    def _step_limit_exceeded(self, run: Dict[str, Any]) -> Dict[str, Any]:
+        """Result of a step stopped by its timeout, memory or CPU time limit."""
+        step_name = run["name"]
+        status, message = run["limit_exceeded"]
+        duration = time.time() - run["start_time"]
+        combined_stderr = run["stderr"].getvalue().strip()
+        error = f"{message}\n{combined_stderr}" if combined_stderr else message
+
+        logging.error(f"Step {step_name}: {message}")
+        log_details = self._finish_step(run)
+        self._emit_progress({
+            "event": "step_failure",
+            "step": step_name,
+            "status": status,
+            "duration": f"{duration:.2f}s",
+            "error": error,
+            **log_details
+        })
+        if run["retry"]:
+            self._record_attempt(run, status)
+        result = {
+            "step": step_name,
+            "status": status,
+            "duration": f"{duration:.2f}s",
+            "output": run["stdout"].getvalue().strip() or None,
+            "error": error,
+            **log_details
+        }
+        return self._with_run_details(run, result)
+
+    @staticmethod
+    def _finish_step(run: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Closes the log of a step and totals its resource usage and timing.
+
+        Returns:
+            dict: `log_file`, `timing`, `metrics` when collected and, when the captured
+                  output lost its middle, `output_truncated`, to merge into the step result and event
+        """
+        timing = run["timing"]
+        close_span(timing)
+        # Commands interrupted by an exception end with their step
+        for span in timing["commands"]:
+            close_span(span, {"end": timing["end"], "end_monotonic": timing["end_monotonic"]})
+        details = {"timing": timing}
+        log = run["log"]
+        if log:
+            log.close()
+            details["log_file"] = log.path
+        if run["usage"]:
+            details["metrics"] = run["usage"].summary(time.time() - run["start_time"])
+        if run["stdout"].truncated or run["stderr"].truncated:
+            details["output_truncated"] = True
+        return details
+
+    @staticmethod
+    def _with_run_details(run: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+        """Adds the attempts and the inputs key of a failed step to its result."""
+        if run["retry"]:
+            result["attempts"] = run["attempts"]
+        if run["cache_key"]:
+            # Lets the flake score spot failures of inputs that passed elsewhere
+            result["cache_key"] = run["cache_key"]
+        return result
+
+    def _step_crashed(self, run: Dict[str, Any], e: Exception) -> Dict[str, Any]:
+        """Result of a step that raised an unexpected exception."""
+        step_name = run["name"]
+        duration = time.time() - run["start_time"]
+        error_msg = f"Unexpected error executing step {step_name}: {e}"
+        logging.error(error_msg)
+        log_details = self._finish_step(run)
+        self._emit_progress({
+            "event": "step_failure",
+            "step": step_name,
+            "duration": f"{duration:.2f}s",
+            "error": str(e),
+            **log_details
+        })
+        return {
+            "step": step_name,
+            "status": "error",
+            "duration": f"{duration:.2f}s",
+            "output": None,
+            "error": str(e),
+            **log_details
+        }
+
+    def _replay_cached_result(self, step_name: str, cached: Dict[str, Any], cache_key: str) -> Dict[str, Any]:
+        """Emits and returns a stored step result instead of running the step."""
+        logging.info(f"Step {step_name} inputs unchanged, replaying cached result {cache_key[:12]}")
+        output = cached.get("output")
+        if output:
+            for start in range(0, len(output), self.output_chunk_size):
+                self._emit_progress({"event": "step_output", "step": step_name,
+                                     "output": output[start:start + self.output_chunk_size], "stream": "stdout"})
+        self._emit_progress({"event": "step_success", "step": step_name, "duration": "0.00s", "cache_hit": True})
+        return {
+            "step": step_name,
+            "status": "success",
+            "duration": "0.00s",
+            "output": output,
+            "error": None,
+            "cache_hit": True,
+            "cache_key": cache_key,
+            "cached_duration": cached.get("duration")
+        }
+
+    def execute_pipeline(self, pipeline_file: str, parallel: bool = False, env_vars: Optional[Dict[str, str]] = None, continue_on_error: bool = False, max_workers: Optional[int] = None, since: Optional[str] = None, resource_limits: Optional[Dict[str, int]] = None, resume: Optional[str] = None, changed_files: Optional[List[str]] = None) -> bool:
+        """
+        Executes the complete pipeline.
+
+        Steps are scheduled as a dependency graph (see build_step_graph). Without
+        `parallel` the graph runs on a single worker, in declaration order.
+        With `since`, steps declaring `paths:` only run if a file changed since
+        that git ref matches one of their filters. `resource_limits` override the
+        capacities of the pipeline's `resources:` block. With `resume`, the ID of
+        an earlier run of the pipeline, the steps that run completed are skipped
+        and the others run again under its ID, with its environment variables.
+        `changed_files` (relative to the pipeline directory) filters steps like
+        `since` does, from a change set known already.
+        """
         self._emit_progress({"event": "pipeline_start", "pipeline_file": pipeline_file})
+        # signal.signal() only works in the main thread; other callers stop runs with stop()
+        previous_handler = None
+        if threading.current_thread() is threading.main_thread():
+            previous_handler = signal.signal(signal.SIGINT, self._on_interrupt) or signal.default_int_handler
         
-        # Get the pipeline file directory
-        pipeline_dir = os.path.dirname(os.path.abspath(pipeline_file))
-        original_cwd = os.getcwd()        
+        # Commands run in the pipeline file directory; the process working
+        # directory is never changed, so several runners can work at once
+        pipeline_path = os.path.abspath(pipeline_file)
+        pipeline_dir = os.path.dirname(pipeline_path)
         try:
-            # Change to pipeline directory to execute relative commands
-            os.chdir(pipeline_dir)
-            logging.info(f"Changing working directory to: {pipeline_dir}")
+            logging.info(f"Running pipeline in directory: {pipeline_dir}")
+            self.pipeline_dir = pipeline_dir
+            self.run_id = resume or new_run_id()
+            self.log_dir = os.path.join(pipeline_dir, "reports", "logs", self.run_id)
+            self.artifact_store = ArtifactStore(os.path.join(pipeline_dir, ARTIFACTS_DIR), self.run_id)
+            self.artifact_store.prune()
+            if self.store is None:
+                self.store = self.run_store or self._open_store()
+            self.checkpoint = RunCheckpoint(os.path.join(pipeline_dir, CHECKPOINT_DIR), self.run_id)
+            self.resumed_results = {}
+            if resume:
+                env_vars = self._resume_state(pipeline_path, env_vars)
+            self.checkpoint.start(pipeline_path, env_vars, resumed=bool(resume))
+            self.checkpoint.prune()
+            self.halted = False
+            self.step_cache = StepCache(os.path.join(pipeline_dir, CACHE_DIR)) if self.use_cache else None
+            if changed_files is not None:
+                self.changed_files = list(changed_files)
+                self._emit_progress({"event": "changes_detected", "since": None, "files": len(self.changed_files)})
+            else:
+                self.changed_files = detect_changes(since, pipeline_dir)
+                if self.changed_files is not None:
+                    logging.info(f"{len(self.changed_files)} files changed since {since}")
+                    self._emit_progress({"event": "changes_detected", "since": since, "files": len(self.changed_files)})
             
-            with open(pipeline_file, 'r', encoding='utf-8') as file:
-                pipeline_config = yaml.safe_load(file)
+            pipeline_config = self.parsed_pipelines.get(pipeline_path) or load_pipeline(pipeline_path)
+            # Feeds both the critical-path estimates and the flake scores of the report
+            self.history = self._load_history(pipeline_file)
                 
-            os.makedirs("reports", exist_ok=True)
-            pipeline_start_time = time.time()
-            results = []
-            final_success = True
+            os.makedirs(os.path.join(pipeline_dir, "reports"), exist_ok=True)
+            self.run_started = mark("start")
+            pipeline_start_time = self.run_started["start"]
             
-            # Parallel execution
-            if parallel and 'parallel_steps' in pipeline_config:
-                logging.info("Starting parallel step execution")
-                self._emit_progress({"event": "parallel_start"})
-                parallel_steps = pipeline_config.get('parallel_steps', [])
-                with concurrent.futures.ThreadPoolExecutor(max_workers=len(parallel_steps)) as executor:
-                    futures = {executor.submit(self.execute_step, step, env_vars): step for step in parallel_steps}
-                    for future in concurrent.futures.as_completed(futures):
-                        step_info = futures[future]
-                        try:
-                            result = future.result()
-                            results.append(result)
-                            if result["status"] == "error":
-                                final_success = False
-                                if not continue_on_error:
-                                    logging.error(f"Stopping pipeline due to error in parallel step: {result['step']}")
-                                    self._emit_progress({"event": "pipeline_halted", "reason": f"Error in parallel step: {result['step']}"})
-                                    # Cancel other futures (best effort)
-                                    for f in futures:
-                                        if not f.done():
-                                            f.cancel()
-                                    break # Exit the completed loop
-                        except Exception as exc:
-                            step_name = step_info.get('step', 'unknown')
-                            logging.error(f'Parallel step {step_name} generated an exception: {exc}')
-                            results.append({"step": step_name, "status": "error", "error": str(exc), "duration": "0s"})
-                            final_success = False
-                            if not continue_on_error:
-                                self._emit_progress({"event": "pipeline_halted", "reason": f"Exception in parallel step: {step_name}"})
-                                # Cancel other futures
-                                for f in futures:
-                                    if not f.done():
-                                        f.cancel()
-                                break
-                self._emit_progress({"event": "parallel_end"})
-                if not final_success and not continue_on_error:
-                    # Save report and exit if there was an error and execution should not continue
-                    self._save_report(pipeline_file, pipeline_start_time, results, final_success)
-                    return False
-
-            # Sequential execution
-            if 'pipeline' in pipeline_config and (final_success or continue_on_error):
-                logging.info("Starting sequential step execution")
-                self._emit_progress({"event": "sequential_start"})
-                for step in pipeline_config.get('pipeline', []):
-                    result = self.execute_step(step, env_vars)
-                    results.append(result)
-                    if result["status"] == "error":
-                        final_success = False
-                        if not continue_on_error:
-                            logging.error(f"Stopping pipeline due to error in step: {result['step']}")
-                            self._emit_progress({"event": "pipeline_halted", "reason": f"Error in step: {result['step']}"})
-                            break # Exit the sequential loop
-                self._emit_progress({"event": "sequential_end"})
-
-            # Execute cleanup steps if they exist
-            if 'cleanup' in pipeline_config:
-                logging.info("Starting cleanup steps")
-                self._emit_progress({"event": "cleanup_start"})
-                for cleanup_step in pipeline_config.get('cleanup', []):
-                    cleanup_result = self.execute_step(cleanup_step, env_vars, is_cleanup=True)
-                    results.append(cleanup_result)
-                    # Cleanup steps don't affect the overall pipeline success
-                self._emit_progress({"event": "cleanup_end"})
+            # Dependency-graph execution: parallel steps and `needs:` run concurrently,
+            # old-style pipelines become a simple chain
+            nodes = build_step_graph(pipeline_config, include_parallel=parallel)
+            workers = (max_workers or self._default_workers()) if parallel else 1
+            limits = dict(pipeline_config.get('resources') or {})
+            limits.update(resource_limits or {})
+            # With several workers, start the steps on the longest expected paths first
+            durations = step_durations(self.history) if workers > 1 else None
+            scheduler = StepScheduler(nodes, max_workers=workers, continue_on_error=continue_on_error,
+                                      resource_limits={label: int(capacity) for label, capacity in limits.items()},
+                                      durations=durations)
+            results, final_success = self._run_phases(pipeline_config, scheduler, env_vars)
 
             # Save final report
             self._save_report(pipeline_file, pipeline_start_time, results, final_success)
 
             if not final_success:
                 logging.error("Pipeline completed with errors")
-                self._emit_progress({"event": "pipeline_finished", "success": False})
+                print(f"Resume from the failed steps with: --resume {self.run_id}")
+                self._emit_progress({"event": "pipeline_finished", "success": False, "run_id": self.run_id})
             else:
                 logging.info("Pipeline completed successfully")
                 self._emit_progress({"event": "pipeline_finished", "success": True})
 
+            # Hooks run in the background, the result doesn't wait for them
+            self._notify(pipeline_config, final_success, env_vars)
             return final_success
             
+        except KeyboardInterrupt:
+            # Second Ctrl+C: don't wait for the steps to wind down
+            self.interrupted = True
+            self.stop_requested = True
+            self._terminate_running()
+            raise
         except Exception as e:
             logging.error(f"Error loading pipeline file {pipeline_file}: {e}")
             self._emit_progress({"event": "pipeline_error", "error": f"Error loading {pipeline_file}: {e}"})
             return False
         finally:
-            # Restore original directory
-            os.chdir(original_cwd)
+            if self.checkpoint:
+                self.checkpoint.close()
+            if previous_handler is not None:
+                signal.signal(signal.SIGINT, previous_handler)
+
+    def _resume_state(self, pipeline_path: str, env_vars: Optional[Dict[str, str]]) -> Dict[str, str]:
+        """
+        Loads the checkpoint of the run being resumed.
+
+        Returns:
+            dict: Environment variables of the run, overridden by the given ones
+
+        Raises:
+            ValueError: If the run has no checkpoint or belongs to another pipeline
+        """
+        state = self.checkpoint.load()
+        if state.get("pipeline_file") != pipeline_path:
+            raise ValueError(f"run {self.run_id} is a run of {state.get('pipeline_file')}, not of {pipeline_path}")
+        if state.get("pipeline_digest") != pipeline_digest(pipeline_path):
+            logging.warning(f"{pipeline_path} changed since run {self.run_id}; its completed steps are still skipped")
+
+        self.resumed_results = {name: result for name, result in state["results"].items()
+                                if result.get("status") in COMPLETED_STATUSES}
+        logging.info(f"Resuming run {self.run_id}: {len(self.resumed_results)} completed steps are skipped")
+        self._emit_progress({"event": "run_resumed", "run_id": self.run_id,
+                             "completed_steps": sorted(self.resumed_results)})
+        return dict(state.get("env") or {}, **(env_vars or {}))
+
+    def watch_pipeline(self, pipeline_file: str, debounce: float = WATCH_DEBOUNCE, polling: bool = False,
+                       **run_options) -> bool:
+        """
+        Runs a pipeline, then runs it again whenever files of its directory change, until interrupted or stopped.
+
+        After the first run, only the steps whose `paths:` or `inputs:` match a
+        changed file rerun (steps declaring neither always do). The parsed
+        pipeline is kept between runs and reloaded when the pipeline file
+        itself changes, which reruns every step. Files written while a run is
+        in progress don't trigger another one.
+
+        Args:
+            pipeline_file: Pipeline to run
+            debounce: Seconds without changes closing a change set
+            polling: Poll the directory even where inotify is available
+            **run_options: Options of execute_pipeline
+
+        Returns:
+            bool: Result of the last run
+        """
+        pipeline_path = os.path.abspath(pipeline_file)
+        pipeline_dir = os.path.dirname(pipeline_path)
+        pipeline_name = os.path.basename(pipeline_path)
+        success = False
+        changed = None
+        self.watching = True
+        try:
+            with FileWatcher(pipeline_dir, polling=polling) as watcher:
+                while not self.stop_requested:
+                    if changed is None or pipeline_name in changed:
+                        # First run, pipeline edited or changes lost: reload and run everything
+                        changed = None
+                        self.parsed_pipelines.pop(pipeline_path, None)
+                        try:
+                            self.parsed_pipelines[pipeline_path] = load_pipeline(pipeline_path)
+                        except Exception as e:
+                            # execute_pipeline reports it; wait for a fix
+                            logging.debug(f"Pipeline {pipeline_path} could not be loaded: {e}")
+                    success = self.execute_pipeline(pipeline_file, changed_files=changed, **run_options)
+                    # A resumed run is only resumed once, later runs get their own ID
+                    run_options.pop("resume", None)
+                    watcher.drain()
+                    print(f"Watching {pipeline_dir} for changes ({watcher.method}, Ctrl+C to stop)")
+                    self._emit_progress({"event": "watch_waiting", "directory": pipeline_dir})
+                    # stop() ends watch mode too, e.g. from the web UI
+                    changed = watcher.wait(debounce, should_stop=lambda: self.stop_requested)
+                    if self.stop_requested:
+                        print("Stopped watching")
+                        break
+                    if changed is None:
+                        logging.warning("File change events were lost, running every step")
+                    else:
+                        shown = ", ".join(changed[:5]) + (f" and {len(changed) - 5} more" if len(changed) > 5 else "")
+                        print(f"Changed: {shown}")
+        except KeyboardInterrupt:
+            # Steps run in their own process groups: the terminal's SIGINT didn't reach them
+            self.interrupted = True
+            self._terminate_running()
+            print("Stopped watching")
+        finally:
+            self.watching = False
+            self.parsed_pipelines.pop(pipeline_path, None)
+        return success
+
+    def _adopt_artifacts(self, step: Dict[str, Any], earlier_run: bool = False) -> bool:
+        """
+        Registers the artifacts of a step that is skipped; False if it must run after all.
+
+        Args:
+            step: Step completed before the run was resumed, or (earlier_run) whose
+                  `paths:` match no change, whose artifacts come from the last run storing them
+        """
+        try:
+            artifacts = step_artifacts(step)
+        except ValueError:
+            return False
+        if not artifacts:
+            return True
+        base_dir = self.pipeline_dir or os.getcwd()
+        cwd = os.path.normpath(os.path.join(base_dir, str(step.get('working_directory') or '.')))
+        try:
+            if earlier_run:
+                adopted = self.artifact_store.carry_over(step['step'], artifacts, cwd)
+            else:
+                adopted = self.artifact_store.adopt(step['step'], artifacts, cwd)
+        except OSError as e:
+            logging.warning(f"Could not reuse the artifacts of step {step['step']}: {e}")
+            adopted = False
+        if not adopted:
+            # Consumers need the artifacts of a skipped producer
+            logging.warning(f"Artifacts of step {step['step']} are no longer stored, it runs")
+        return adopted
+
+    def _notify(self, pipeline_config: Dict[str, Any], success: bool, env_vars: Optional[Dict[str, str]]):
+        """Starts the `notifications:` hooks matching the pipeline result."""
+        try:
+            hooks = notification_hooks(pipeline_config, success)
+        except ValueError as e:
+            logging.error(f"Invalid notifications block: {e}")
+            return
+        if hooks:
+            self.notifier.dispatch(hooks, notification_env(env_vars, success), self.pipeline_dir, self._emit_progress)
+
+    def wait_for_notifications(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits for the notification hooks of the last run.
+
+        Returns:
+            bool: True if they all finished within the timeout
+        """
+        return self.notifier.wait(timeout)
+
+    def close_notifications(self, timeout: float = NOTIFICATION_FLUSH_TIMEOUT) -> List[str]:
+        """
+        Gives the notification hooks still running `timeout` seconds, then kills them (before exiting).
+
+        Returns:
+            list: Descriptions of the dropped hooks
+        """
+        return self.notifier.close(timeout)
+
+    def _default_workers(self) -> int:
+        """Worker limit used for parallel runs when none is given."""
+        return default_max_workers()
+
+    def _run_phases(self, pipeline_config: Dict[str, Any], scheduler: StepScheduler,
+                    env_vars: Optional[Dict[str, str]]):
+        """
+        Runs the step graph and then the cleanup steps.
+
+        Returns:
+            tuple: (step results, overall success)
+        """
+        results = []
+        final_success = True
+        if scheduler.nodes:
+            self._graph_started(scheduler)
+            results, final_success = scheduler.run(
+                lambda step: self.execute_step(step, env_vars),
+                should_stop=lambda: self.stop_requested,
+                on_halt=self._pipeline_halted
+            )
+            self._emit_progress({"event": "graph_end"})
+
+        # Execute cleanup steps if they exist
+        if 'cleanup' in pipeline_config:
+            logging.info("Starting cleanup steps")
+            self._emit_progress({"event": "cleanup_start"})
+            for cleanup_step in pipeline_config.get('cleanup', []):
+                cleanup_result = self.execute_step(cleanup_step, env_vars, is_cleanup=True)
+                results.append(cleanup_result)
+                # Cleanup steps don't affect the overall pipeline success
+            self._emit_progress({"event": "cleanup_end"})
+        return results, final_success
+
+    def _graph_started(self, scheduler: StepScheduler):
+        """Reports the start of the step graph execution."""
+        steps, workers = len(scheduler.nodes), scheduler.max_workers
+        logging.info(f"Starting step graph execution ({steps} steps, {workers} workers)")
+        event = {"event": "graph_start", "steps": steps, "max_workers": workers,
+                 "resources": scheduler.resource_limits}
+        path, expected = scheduler.critical_path()
+        if expected > 0:
+            logging.info(f"Critical path from previous runs: {' -> '.join(path)} (~{expected:.1f}s)")
+            event["critical_path"] = path
+            event["expected_duration"] = round(expected, 2)
+        self._emit_progress(event)
+
+    def _pipeline_halted(self, result: Dict[str, Any]):
+        """Stops the scheduling of new steps and the running ones after a step failed."""
+        logging.error(f"Stopping pipeline due to error in step: {result['step']}")
+        self.halted = True
+        self._terminate_running()
+        self._emit_progress({"event": "pipeline_halted", "reason": f"Error in step: {result['step']}"})
 
     def _save_report(self, pipeline_file, start_time, results, success):
         """Saves the pipeline report in JSON format."""
         pipeline_duration = time.time() - start_time
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
         report = {
+            "run_id": self.run_id,
             "pipeline_file": pipeline_file,
             "start_time": datetime.datetime.fromtimestamp(start_time).strftime("%Y-%m-%d %H:%M:%S"),
+            # Origin of the monotonic times in the step timings
+            "start_monotonic": self.run_started["start_monotonic"] if self.run_started else None,
             "duration": f"{pipeline_duration:.2f}s",
             "steps": results,
-            "success": success
+            "success": success,
+            "log_dir": self.log_dir
         }
-        report_file = f"reports/pipeline_report_{timestamp}.json"
+        flaky_steps = self._flake_scores(results)
+        if flaky_steps:
+            report["flaky_steps"] = flaky_steps
+            for result in results:
+                if result["step"] in flaky_steps:
+                    result["flake_score"] = flaky_steps[result["step"]]
+        reports_dir = os.path.join(self.pipeline_dir or os.getcwd(), "reports")
+        report_file = os.path.join(reports_dir, f"pipeline_report_{timestamp}.json")
         try:
-            with open(report_file, 'w') as f:
+            # Runs finishing in the same second get numbered reports instead of overwriting each other
+            suffix = 1
+            while True:
+                try:
+                    f = open(report_file, 'x')
+                    break
+                except FileExistsError:
+                    suffix += 1
+                    report_file = os.path.join(reports_dir, f"pipeline_report_{timestamp}_{suffix}.json")
+            with f:
                 json.dump(report, f, indent=2)
             logging.info(f"Pipeline report saved to {report_file}")
             self._emit_progress({"event": "report_saved", "file": report_file})
         except Exception as e:
             logging.error(f"Error saving the report {report_file}: {e}")
             self._emit_progress({"event": "report_error", "error": str(e)})
+            report_file = None
+        self._record_run(report, start_time, pipeline_duration, report_file)
+        if not report_file:
+            return
+
+        trace_file = trace_file_for(report_file)
+        try:
+            write_trace(trace_file, build_trace(report, self.run_started["start_monotonic"]))
+            logging.info(f"Pipeline trace saved to {trace_file}")
+            self._emit_progress({"event": "trace_saved", "file": trace_file})
+        except Exception as e:
+            logging.error(f"Error saving the trace {trace_file}: {e}")
+
+
+    def _record_run(self, report: Dict[str, Any], start_time: float, duration: float,
+                    report_file: Optional[str]) -> None:
+        """Appends the run to the run store."""
+        if not self.store:
+            return
+        try:
+            self.store.record_run(report, start_time, duration, report_file=report_file)
+            self._emit_progress({"event": "run_recorded", "run_id": self.run_id, "store": self.store.path})
+        except sqlite3.Error as e:
+            logging.error(f"Error recording the run in {self.store.path}: {e}")
+
+    @staticmethod
+    def _open_store() -> Optional[RunStore]:
+        """Opens the default run store, or returns None if it can't be used."""
+        try:
+            return RunStore(default_store_path())
+        except sqlite3.Error as e:
+            logging.warning(f"Runs will not be recorded, the run store can't be opened: {e}")
+            return None
+
+    def _load_history(self, pipeline_file) -> List[List[Dict[str, Any]]]:
+        """Step results of recent runs of the pipeline, oldest first."""
+        try:
+            if self.store:
+                runs = self.store.recent_step_results(pipeline_file, HISTORY_SIZE)
+                if runs:
+                    return runs
+            # Runs from before the run store only left JSON reports
+            reports = load_reports(os.path.join(self.pipeline_dir or os.getcwd(), "reports"), pipeline_file)
+            return [report.get("steps") or [] for report in reports]
+        except Exception as e:
+            logging.warning(f"Could not load the run history: {e}")
+            return []
+
+    def _flake_scores(self, results) -> Dict[str, float]:
+        """Flake scores of the steps over the recorded runs of the pipeline and this run."""
+        scores = flake_scores(self.history + [results])
+        for name, score in sorted(scores.items(), key=lambda item: -item[1]):
+            logging.warning(f"Step {name} looks flaky: {score:.0%} of its recent runs passed only on retry "
+                            f"or failed with inputs that passed elsewhere")
+        return scores
+
+
+def create_runner(engine: str = "threads", **kwargs) -> PipelineRunner:
+    """
+    Creates a pipeline runner for the given engine.
+
+    Args:
+        engine: "threads" for PipelineRunner, "asyncio" for AsyncPipelineRunner
+        **kwargs: Arguments for the runner constructor
+
+    Returns:
+        PipelineRunner: Runner instance
+    """
+    if engine == "asyncio":
+        # Imported here: the asyncio engine builds on this module
+        from core.src.async_runner import AsyncPipelineRunner
+        return AsyncPipelineRunner(**kwargs)
+    return PipelineRunner(**kwargs)
 
 
 def main():
@@ -386,16 +1298,44 @@ def main():
 
     logging.info(f"Starting pipeline from CLI: {args.pipeline}")
 
+    # Accept remote agents if requested
+    agent_pool = None
+    if args.agents:
+        agent_pool = AgentPool(args.agents, token=args.agent_token, agent_timeout=args.agent_timeout)
+        try:
+            agent_pool.start()
+        except (ValueError, OSError) as e:
+            logging.error(f"Cannot accept agents: {e}")
+            sys.exit(1)
+
     # Create runner instance (without callback for CLI)
-    runner = PipelineRunner()
+    runner = create_runner(args.engine, use_cache=not args.no_cache, agent_pool=agent_pool,
+                           collect_metrics=args.metrics)
 
-    success = runner.execute_pipeline(
-        args.pipeline,
-        parallel=args.parallel,
-        env_vars=env_vars,
-        continue_on_error=args.continue_on_error
-    )
+    # Watch mode runs the pipeline again on every change, until interrupted
+    run = runner.watch_pipeline if args.watch else runner.execute_pipeline
+    success = False
+    try:
+        success = run(
+            args.pipeline,
+            parallel=args.parallel,
+            env_vars=env_vars,
+            continue_on_error=args.continue_on_error,
+            max_workers=args.max_workers,
+            since=args.since,
+            resource_limits=CLIManager.parse_resource_limits(args.resource),
+            resume=args.resume
+        )
+    except KeyboardInterrupt:
+        print("Interrupted")
+    finally:
+        if agent_pool:
+            agent_pool.close()
 
+    # The exit status is known already, only give slow notifiers a short delay
+    runner.close_notifications(args.notification_timeout)
+    if runner.interrupted:
+        sys.exit(INTERRUPTED_EXIT_CODE)
     sys.exit(0 if success else 1)
 
 
@@ -54,8 +54,17 @@ class PipelineUI {  constructor() {
       stepDetailStatus: document.getElementById("stepDetailStatus"),
       stepStartTime: document.getElementById("stepStartTime"),
       stepDuration: document.getElementById("stepDuration"),
+      stepMetricsSection: document.getElementById("stepMetricsSection"),
+      stepCpu: document.getElementById("stepCpu"),
+      stepMemory: document.getElementById("stepMemory"),
+      stepIo: document.getElementById("stepIo"),
+      stepCtxSwitches: document.getElementById("stepCtxSwitches"),
       stepLogContent: document.getElementById("stepLogContent"),
-      modalStepIcon: document.getElementById("modalStepIcon"),    };
+      modalStepIcon: document.getElementById("modalStepIcon"),
+      timelinePanel: document.getElementById("timelinePanel"),
+      timelineChart: document.getElementById("timelineChart"),
+      timelineSubtitle: document.getElementById("timelineSubtitle"),
+      timelineDownload: document.getElementById("timelineDownload"),    };
   }
 
   // ============================================
@@ -288,6 +297,22 @@ class PipelineUI {  constructor() {
         (stepData.execution_time ? `${stepData.execution_time}s` : "-");
     }
 
+    // Resource usage, when the runner sampled it
+    if (this.elements.stepMetricsSection) {
+      const metrics = stepData.metrics;
+      this.elements.stepMetricsSection.style.display = metrics ? "" : "none";
+      if (metrics) {
+        const utilization =
+          metrics.cpu_utilization !== undefined
+            ? ` (${Math.round(metrics.cpu_utilization * 100)}%)`
+            : "";
+        this.elements.stepCpu.textContent = `${metrics.cpu_user.toFixed(2)}s user / ${metrics.cpu_system.toFixed(2)}s sys${utilization}`;
+        this.elements.stepMemory.textContent = this.formatBytes(metrics.peak_rss);
+        this.elements.stepIo.textContent = `${this.formatBytes(metrics.read_bytes)} read / ${this.formatBytes(metrics.write_bytes)} written`;
+        this.elements.stepCtxSwitches.textContent = `${metrics.voluntary_ctx_switches} voluntary / ${metrics.involuntary_ctx_switches} involuntary`;
+      }
+    }
+
     // Update logs
     if (this.elements.stepLogContent) {
       const logText =
@@ -323,6 +348,16 @@ class PipelineUI {  constructor() {
       }
     }
   }
+  formatBytes(bytes) {
+    const units = ["B", "KiB", "MiB", "GiB"];
+    let value = bytes || 0;
+    let unit = 0;
+    while (value >= 1024 && unit < units.length - 1) {
+      value /= 1024;
+      unit++;
+    }
+    return `${unit ? value.toFixed(1) : value} ${units[unit]}`;
+  }
   getStepStatusInfo(status) {
     const statusMap = {
       success: {
@@ -447,6 +482,15 @@ class PipelineUI {  constructor() {
     this.socket.on("stats_update", (stats) => {
       this.updateStats(stats);
     });
+
+    this.socket.on("run_queued", (data) => {
+      if (data.state === "queued") {
+        this.showNotification(
+          `⏳ ${data.pipeline_file} queued (run ${data.run_id}), waiting for a free slot`,
+          "info"
+        );
+      }
+    });
   }
 
   // ============================================
@@ -872,7 +916,11 @@ class PipelineUI {  constructor() {
             <div class="node-label">${step.name}</div>
             <div class="node-status ${
               step.status || "pending"
-            }">${this.getStatusText(step.status)}</div>
+            }">${
+              step.cache_hit
+                ? "Cached"
+                : this.getStatusText(step.failure_reason || step.status)
+            }</div>
             <div class="node-index">${index + 1}</div>
         `;
 
@@ -916,6 +964,7 @@ class PipelineUI {  constructor() {
       success: "check",
       failure: "times",
       pending: "clock",
+      skipped: "forward",
     };
     return icons[status] || "circle";
   }
@@ -933,6 +982,7 @@ class PipelineUI {  constructor() {
       output: step.output,
       error: step.error,
       command: step.command,
+      metrics: step.metrics,
       index: index,
     };
 
@@ -1142,6 +1192,96 @@ class PipelineUI {  constructor() {
     if (data.steps !== undefined) {
       this.updateSteps(data.steps);
     }
+
+    // Timeline of the run once its trace is written
+    if (!data.running && data.trace_file && data.run_id && data.run_id !== this.timelineRunId) {
+      this.loadTimeline(data.run_id);
+    }
+  }
+
+  loadTimeline(runId) {
+    this.timelineRunId = runId;
+    const url = `/api/runs/${runId}/trace`;
+    fetch(url)
+      .then((response) => (response.ok ? response.json() : null))
+      .then((trace) => {
+        if (trace) {
+          this.renderTimeline(trace);
+          if (this.elements.timelineDownload) {
+            this.elements.timelineDownload.href = url;
+          }
+        }
+      })
+      .catch((error) => console.warn("⚠️ Could not load the run timeline:", error));
+  }
+
+  renderTimeline(trace) {
+    const chart = this.elements.timelineChart;
+    if (!chart || !this.elements.timelinePanel) return;
+
+    // Step slices, and the queue wait that preceded each of them
+    const workers = {};
+    const queued = {};
+    trace.traceEvents.forEach((event) => {
+      if (event.ph === "M" && event.name === "thread_name") {
+        workers[event.tid] = event.args.name;
+      } else if (event.ph === "b" && event.cat === "queue") {
+        queued[event.id] = { start: event.ts };
+      } else if (event.ph === "e" && event.cat === "queue" && queued[event.id]) {
+        queued[event.id].end = event.ts;
+        queued[event.id].step = event.name.replace(/ \(queued\)$/, "");
+      }
+    });
+    const queueByStep = {};
+    Object.values(queued).forEach((wait) => {
+      queueByStep[wait.step] = wait;
+    });
+    const steps = trace.traceEvents
+      .filter((event) => event.ph === "X" && event.cat === "step")
+      .sort((a, b) => a.ts - b.ts);
+    if (!steps.length) return;
+
+    const end = Math.max(...steps.map((event) => event.ts + event.dur));
+    const percent = (ts) => `${((ts / end) * 100).toFixed(3)}%`;
+    const escape = (text) =>
+      String(text).replace(/[&<>"]/g, (c) => ({ "&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;" })[c]);
+
+    const ticks = [];
+    for (let i = 0; i <= 4; i++) {
+      ticks.push(`<span class="timeline-tick" style="left: ${i * 25}%">${((end * i) / 4 / 1e6).toFixed(1)}s</span>`);
+    }
+    const rows = steps.map((event) => {
+      const status = event.args.status === "success" ? "success" : event.args.status ? "failure" : "";
+      const wait = queueByStep[event.name];
+      const queueBar = wait
+        ? `<div class="timeline-bar queued" style="left: ${percent(wait.start)}; width: ${percent(wait.end - wait.start)}"
+              title="${escape(event.name)} queued ${((wait.end - wait.start) / 1e6).toFixed(2)}s"></div>`
+        : "";
+      const title = `${event.name}: ${(event.dur / 1e6).toFixed(2)}s on ${workers[event.tid] || "worker"}` +
+        (event.args.queue_wait ? `, queued ${event.args.queue_wait}` : "");
+      return `
+        <div class="timeline-row">
+          <div class="timeline-label" title="${escape(event.name)}">${escape(event.name)}<small>${escape(workers[event.tid] || "")}</small></div>
+          <div class="timeline-track">
+            ${queueBar}
+            <div class="timeline-bar ${status}" style="left: ${percent(event.ts)}; width: ${percent(event.dur)}"
+              title="${escape(title)}"></div>
+          </div>
+        </div>`;
+    });
+
+    chart.innerHTML = `
+      <div class="timeline-row timeline-axis">
+        <div class="timeline-label"></div>
+        <div class="timeline-track">${ticks.join("")}</div>
+      </div>
+      ${rows.join("")}`;
+    if (this.elements.timelineSubtitle) {
+      const lanes = Object.keys(workers).length;
+      this.elements.timelineSubtitle.textContent =
+        `${steps.length} steps on ${lanes} worker${lanes === 1 ? "" : "s"} in ${(end / 1e6).toFixed(2)}s; hatched: waiting in the queue`;
+    }
+    this.elements.timelinePanel.style.display = "";
   }
 
   getStepIcon(status) {
@@ -1158,7 +1298,10 @@ class PipelineUI {  constructor() {
       running: "Running",
       success: "Completed",
       failure: "Failed",
+      timeout: "Timed out",
+      resource_exceeded: "Limit exceeded",
       pending: "Pending",
+      skipped: "Skipped",
     };
     return texts[status] || "Unknown";
   }
@@ -4,7 +4,6 @@ import glob
 import json
 import time
 import logging
-import yaml
 import threading
 from datetime import datetime
 from flask import Flask, render_template, request, jsonify
@@ -29,7 +28,7 @@ except ImportError as e:
     print(f"Project root: {project_root}")
     sys.exit(1)
 
-from core.src.app.pipeline_manager import PipelineManager
+from core.src.app.pipeline_manager import DEFAULT_HISTORY_SIZE, PipelineManager
 from core.src.app.project_manager import ProjectManager, get_available_project_types
 
 app = Flask(
@@ -59,11 +58,11 @@ def pipelines():
     stats = pipeline_manager.get_stats()
     
     return render_template('pipelines.html', 
-                         status=pipeline_manager.status, 
+                         status=pipeline_manager.get_status(), 
                          pipelines=available_pipelines,
                          grouped_pipelines=grouped_pipelines,
                          stats=stats,
-                         history=pipeline_manager.history[-5:])  # Last 5 runs
+                         history=pipeline_manager.get_history(limit=5))
 
 @app.route('/projects')
 def projects():
@@ -97,18 +96,45 @@ def get_pipelines_grouped():
 
 @app.route('/api/stats')
 def get_stats():
-    """API endpoint to get statistics."""
-    return jsonify(pipeline_manager.get_stats())
+    """API endpoint to get statistics (?pipeline=<file> and ?since=<epoch seconds> narrow them)."""
+    since = request.args.get('since', type=float)
+    return jsonify(pipeline_manager.get_stats(pipeline_file=request.args.get('pipeline'), since=since))
 
 @app.route('/api/history')
 def get_history():
-    """API endpoint to get execution history."""
-    return jsonify(pipeline_manager.history)
+    """API endpoint to get execution history (?limit=, ?pipeline=<file> and ?status=success|failed|error)."""
+    limit = request.args.get('limit', default=DEFAULT_HISTORY_SIZE, type=int)
+    if not 1 <= limit <= 1000:
+        return jsonify({"error": "'limit' must be between 1 and 1000"}), 400
+    return jsonify(pipeline_manager.get_history(limit=limit, pipeline_file=request.args.get('pipeline'),
+                                                status=request.args.get('status')))
 
 @app.route('/api/status')
 def get_status():
     """API endpoint to get the current pipeline status."""
-    return jsonify(pipeline_manager.status)
+    return jsonify(pipeline_manager.get_status())
+
+@app.route('/api/runs')
+def get_runs():
+    """API endpoint to get the queued, running and recent pipeline runs."""
+    return jsonify({"runs": pipeline_manager.list_runs(),
+                    "max_concurrent_runs": pipeline_manager.max_concurrent_runs})
+
+@app.route('/api/runs/<run_id>')
+def get_run(run_id):
+    """API endpoint to get the status of a pipeline run."""
+    run = pipeline_manager.get_run(run_id)
+    if run is None:
+        return jsonify({"error": f"Unknown run: {run_id}"}), 404
+    return jsonify(run)
+
+@app.route('/api/runs/<run_id>/trace')
+def get_run_trace(run_id):
+    """API endpoint to get the Chrome trace-event timeline of a finished run."""
+    trace = pipeline_manager.get_trace(run_id)
+    if trace is None:
+        return jsonify({"error": f"No trace for run: {run_id}"}), 404
+    return jsonify(trace)
 
 @app.route('/api/project-types')
 def get_project_types():
@@ -192,8 +218,10 @@ def handle_connect():
     """Handles the connection of a new client."""
     print('🔌 Client connected')
     # Send the current status and statistics to the newly connected client
-    emit('pipeline_update', pipeline_manager.status)
+    emit('pipeline_update', pipeline_manager.get_status())
     emit('stats_update', pipeline_manager.get_stats())
+    emit('runs_update', {"runs": pipeline_manager.list_runs(),
+                         "max_concurrent_runs": pipeline_manager.max_concurrent_runs})
     
     # If there is no active project creation, reset the status to avoid
     # showing success/error messages from previous creations
@@ -222,12 +250,17 @@ def handle_start_pipeline(data):
     if not pipeline_file:
         emit('pipeline_update', {"error": "You must select a pipeline to run."})
         return
-    if not pipeline_manager.status["running"]:
-        print("🚀 Request to start pipeline received.")
-        pipeline_manager.run_pipeline_in_background(pipeline_file)
-    else:
-        print("⚠️ Pipeline is already running.")
-        emit('pipeline_update', {"error": "Pipeline is already running."})
+    try:
+        priority = int(data.get('priority') or 0)
+    except (TypeError, ValueError):
+        emit('pipeline_update', {"error": "Priority must be an integer."})
+        return
+    print("🚀 Request to start pipeline received.")
+    run_id = pipeline_manager.submit_run(pipeline_file, priority=priority)
+    # Runs wait in the queue while all slots are busy or the same pipeline is running
+    run = pipeline_manager.get_run(run_id)
+    emit('run_queued', {"run_id": run_id, "pipeline_file": pipeline_file, "priority": priority,
+                        "state": run["state"] if run else None})
 
 @socketio.on('clear_logs')
 def handle_clear_logs(data):
@@ -241,10 +274,11 @@ def handle_clear_steps(data):
 
 @socketio.on('stop_pipeline')
 def handle_stop_pipeline(data):
-    """Stops the currently running pipeline."""
+    """Stops the currently running pipeline, or the run given by run_id."""
     print("⏹️ Request to stop pipeline received.")
-    if pipeline_manager.status["running"]:
-        success = pipeline_manager.stop_pipeline()
+    run_id = (data or {}).get('run_id')
+    if run_id or pipeline_manager.status["running"]:
+        success = pipeline_manager.stop_pipeline(run_id)
         if success:
             print("✅ Pipeline stopped successfully.")
             emit('pipeline_update', {"message": "Pipeline stopped by the user", "stopped": True})
@@ -255,6 +289,13 @@ def handle_stop_pipeline(data):
         print("⚠️ No pipeline is running.")
         emit('pipeline_update', {"error": "No pipeline is running to stop."})
 
+@socketio.on('cancel_run')
+def handle_cancel_run(data):
+    """Cancels a queued pipeline run, or stops it if it already started."""
+    run_id = (data or {}).get('run_id')
+    if not run_id or not pipeline_manager.cancel_run(run_id):
+        emit('pipeline_update', {"error": f"Run {run_id} is not queued or running."})
+
 @socketio.on('create_project')
 def handle_create_project(data):
     """Handles the request to create a new project via SocketIO."""
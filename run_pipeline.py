@@ -4,6 +4,7 @@ Shortcut script to run the CI/CD engine from the project root.
 Improved version that doesn't manipulate sys.path.
 """
 import subprocess
+import signal
 import sys
 import os
 from pathlib import Path
@@ -13,10 +14,12 @@ def main():
     """Main function that runs the pipeline using the installed package."""
     try:
         # Try to use the installed package first
-        result = subprocess.run([
+        process = subprocess.Popen([
             sys.executable, "-m", "core.src.main"
         ] + sys.argv[1:], cwd=Path(__file__).parent)
-        sys.exit(result.returncode)
+        # Ctrl+C reaches the child too, which stops its steps and writes its report: wait for it
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        sys.exit(process.wait())
     except Exception:
         # Fallback: use direct import for development
         import sys
@@ -30,7 +33,9 @@ def main():
         try:
             from core.src.utils.log_manager import setup_logging
             from core.src.cli.cli_manager import CLIManager
-            from core.src.main import PipelineRunner
+            from core.src.main import create_runner
+            from core.src.engine.distributed import AgentPool
+            from core.src.engine.process import INTERRUPTED_EXIT_CODE
             import logging
             
             # Use centralized CLI
@@ -48,16 +53,43 @@ def main():
             pipeline_path = os.path.abspath(args.pipeline)
             logging.info(f"Starting pipeline from wrapper: {pipeline_path}")
 
+            # Accept remote agents if requested
+            agent_pool = None
+            if args.agents:
+                agent_pool = AgentPool(args.agents, token=args.agent_token, agent_timeout=args.agent_timeout)
+                try:
+                    agent_pool.start()
+                except (ValueError, OSError) as e:
+                    logging.error(f"Cannot accept agents: {e}")
+                    sys.exit(1)
+
             # Create runner instance (without callback for CLI)
-            runner = PipelineRunner()
+            runner = create_runner(args.engine, use_cache=not args.no_cache, agent_pool=agent_pool,
+                                   collect_metrics=args.metrics)
 
-            success = runner.execute_pipeline(
-                pipeline_path,
-                parallel=args.parallel,
-                env_vars=env_vars,
-                continue_on_error=args.continue_on_error
-            )
+            run = runner.watch_pipeline if args.watch else runner.execute_pipeline
+            success = False
+            try:
+                success = run(
+                    pipeline_path,
+                    parallel=args.parallel,
+                    env_vars=env_vars,
+                    continue_on_error=args.continue_on_error,
+                    max_workers=args.max_workers,
+                    since=args.since,
+                    resource_limits=CLIManager.parse_resource_limits(args.resource),
+                    resume=args.resume
+                )
+            except KeyboardInterrupt:
+                print("Interrupted")
+            finally:
+                if agent_pool:
+                    agent_pool.close()
 
+            # The exit status is known already, only give slow notifiers a short delay
+            runner.close_notifications(args.notification_timeout)
+            if runner.interrupted:
+                sys.exit(INTERRUPTED_EXIT_CODE)
             sys.exit(0 if success else 1)
             
         except Exception as e:
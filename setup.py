@@ -44,6 +44,7 @@ setup(
             "localforge-pipeline=core.src.main:main",
             "localforge-ui=core.src.web.web_ui:main",
             "localforge-generate=core.src.project_generator:main",
+            "localforge-agent=core.src.agent:main",
         ],
     },
     include_package_data=True,